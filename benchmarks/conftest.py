@@ -0,0 +1,54 @@
+"""Corpora fixos para os microbenchmarks (pytest benchmarks/)"""
+import json
+import os
+import sys
+
+import pytest
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS_DIR)
+sys.path.insert(0, os.path.dirname(BENCHMARKS_DIR))
+
+# O import de main não deve iniciar snapshots de métricas nem poluir a saída
+os.environ.setdefault('METRICS_ENABLED', 'false')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+from stripe_payloads import make_corpus, sign_payload  # noqa: E402
+
+CORPUS_SIZE = 200
+SIGNING_SECRET = 'whsec_benchmark'
+SIGNATURE_TIMESTAMP = 1700000000
+
+# Quantidade de chaves extras em metadata: de eventos mínimos ao limite do Stripe (50) e além
+# (payloads muito grandes, como eventos com objetos expandidos)
+METADATA_SIZES = {
+    'small': 0,
+    'medium': 10,
+    'large': 50,
+    'xlarge': 500
+}
+
+class Corpus:
+    def __init__(self, name, metadata_keys):
+        self.name = name
+        self.events = make_corpus(CORPUS_SIZE, ['prod-1', 'prod-2', 'prod-3'], seed=1234, metadata_keys=metadata_keys)
+        self.payloads = [json.dumps(event, separators=(',', ':')).encode('utf-8') for event in self.events]
+        self.signatures = [sign_payload(payload, SIGNING_SECRET, SIGNATURE_TIMESTAMP) for payload in self.payloads]
+
+    def __len__(self):
+        return len(self.events)
+
+_corpora = {}
+
+@pytest.fixture(params=list(METADATA_SIZES), scope='session')
+def corpus(request):
+    """Corpus de eventos assinados, um por tamanho de metadata"""
+    if request.param not in _corpora:
+        _corpora[request.param] = Corpus(request.param, METADATA_SIZES[request.param])
+    return _corpora[request.param]
+
+@pytest.fixture(scope='session')
+def small_corpus():
+    if 'small' not in _corpora:
+        _corpora['small'] = Corpus('small', 0)
+    return _corpora['small']
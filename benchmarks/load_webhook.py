@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""Gerador de carga para /webhook/stripe com eventos Stripe assinados.
+
+Envia eventos em taxa fixa (malha aberta: a taxa não cai quando o servidor fica lento)
+e reporta vazão, p50/p95/p99 e taxa de erros. O resultado pode ser salvo em JSON e
+comparado com uma execução anterior (baseline).
+
+Uso:
+    python benchmarks/load_webhook.py --url http://127.0.0.1:5000 --rps 200 --duration 30 \\
+        --secret whsec_bench --setup-pixels 20 --save resultados/atual.json --compare resultados/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stripe_payloads import make_event, sign_payload  # noqa: E402
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+async def setup_pixels(session, url, count, access_token):
+    """Cria os pixels bench-1..N (ignora os que já existem). Retorna os id_gestor"""
+    manager_ids = [f"bench-{index}" for index in range(1, count + 1)]
+    for manager_id in manager_ids:
+        async with session.post(f"{url}/api/pixels", json={
+            'id_gestor': manager_id,
+            'pixel_id': f"BENCHPIXEL{manager_id.split('-')[1]}",
+            'access_token': f"{access_token}-{manager_id}"
+        }) as response:
+            if response.status not in (201, 409):
+                raise RuntimeError(f"Erro ao criar pixel {manager_id}: {response.status} {await response.text()}")
+    return manager_ids
+
+async def send_event(session, url, body, headers, results):
+    started = time.perf_counter()
+    try:
+        async with session.post(f"{url}/webhook/stripe", data=body, headers=headers) as response:
+            await response.read()
+            status = response.status
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        status = type(e).__name__
+    results.append((time.perf_counter() - started, status))
+
+async def run_load(args, manager_ids):
+    rng = random.Random(args.seed)
+    results = []
+    sent_ids = []
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        tasks = set()
+        interval = 1.0 / args.rps
+        started = time.perf_counter()
+        total = int(args.rps * args.duration)
+        for index in range(total):
+            # Malha aberta: cada requisição tem seu horário, independente das anteriores
+            delay = started + index * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            if sent_ids and rng.random() < args.duplicate_rate:
+                event = sent_ids[rng.randrange(len(sent_ids))]  # reenvio do Stripe
+            else:
+                event = make_event(rng, manager_ids)
+                sent_ids.append(event)
+            body = json.dumps(event).encode('utf-8')
+            headers = {'Content-Type': 'application/json'}
+            if args.secret:
+                headers['Stripe-Signature'] = sign_payload(body, args.secret)
+
+            task = asyncio.ensure_future(send_event(session, args.url, body, headers, results))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    return results, elapsed, len(sent_ids)
+
+async def wait_drain(url, timeout):
+    """Espera a outbox esvaziar (eventos pendentes/em processamento). Retorna os segundos esperados"""
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        while time.perf_counter() - started < timeout:
+            async with session.get(f"{url}/api/outbox") as response:
+                outbox = (await response.json()).get('outbox', {})
+            if not outbox.get('pending') and not outbox.get('processing'):
+                return time.perf_counter() - started
+            await asyncio.sleep(0.5)
+    return None
+
+def summarize(results, elapsed, unique_events, args):
+    latencies = [latency * 1000 for latency, _ in results]
+    statuses = Counter(str(status) for _, status in results)
+    errors = sum(count for status, count in statuses.items() if not status.startswith('2'))
+    return {
+        'config': {'rps': args.rps, 'duration': args.duration, 'concurrency': args.concurrency,
+                   'duplicate_rate': args.duplicate_rate, 'signed': bool(args.secret)},
+        'requests': len(results),
+        'unique_events': unique_events,
+        'elapsed_seconds': round(elapsed, 2),
+        'throughput_rps': round(len(results) / elapsed, 1) if elapsed else 0,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 2),
+            'p95': round(percentile(latencies, 95), 2),
+            'p99': round(percentile(latencies, 99), 2),
+            'max': round(max(latencies), 2) if latencies else 0,
+            'mean': round(sum(latencies) / len(latencies), 2) if latencies else 0
+        },
+        'status_codes': dict(statuses),
+        'error_rate': round(errors / len(results) * 100, 2) if results else 0
+    }
+
+def print_report(summary, baseline=None):
+    latency = summary['latency_ms']
+    print(f"\n📊 {summary['requests']} requisições em {summary['elapsed_seconds']}s "
+          f"({summary['throughput_rps']} req/s, {summary['unique_events']} eventos únicos)")
+    print(f"   Latência (ms): p50={latency['p50']} p95={latency['p95']} p99={latency['p99']} "
+          f"max={latency['max']} média={latency['mean']}")
+    print(f"   Status: {summary['status_codes']} | erros: {summary['error_rate']}%")
+    if 'drain_seconds' in summary:
+        if summary['drain_seconds'] is None:
+            print("   ⚠️  A outbox não esvaziou dentro do tempo de espera")
+        else:
+            print(f"   Outbox esvaziada {summary['drain_seconds']}s após o fim da carga")
+    if summary.get('tiktok'):
+        print(f"   Mock TikTok: {summary['tiktok']}")
+
+    if baseline:
+        print("\n📈 Comparação com o baseline:")
+        rows = [('throughput_rps', summary['throughput_rps'], baseline['throughput_rps'])]
+        rows += [(f"latency_ms.{key}", latency[key], baseline['latency_ms'][key]) for key in ('p50', 'p95', 'p99')]
+        rows.append(('error_rate', summary['error_rate'], baseline['error_rate']))
+        for name, current, previous in rows:
+            change = f"{(current - previous) / previous * 100:+.1f}%" if previous else 'n/a'
+            print(f"   {name:<16} {previous:>10} → {current:<10} ({change})")
+
+async def main(args):
+    async with aiohttp.ClientSession() as session:
+        if args.setup_pixels:
+            manager_ids = await setup_pixels(session, args.url, args.setup_pixels, args.access_token)
+        else:
+            manager_ids = args.manager_ids.split(',')
+        if args.mock_url:
+            await session.post(f"{args.mock_url}/__reset")
+
+    print(f"🚀 {args.rps} req/s por {args.duration}s em {args.url}/webhook/stripe ({len(manager_ids)} gestores)")
+    results, elapsed, unique_events = await run_load(args, manager_ids)
+    summary = summarize(results, elapsed, unique_events, args)
+
+    if args.wait_drain:
+        drain = await wait_drain(args.url, args.wait_drain)
+        summary['drain_seconds'] = round(drain, 1) if drain is not None else None
+    if args.mock_url:
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"{args.mock_url}/__stats") as response:
+                summary['tiktok'] = await response.json()
+    return summary
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark do webhook do Stripe')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='URL base do app')
+    parser.add_argument('--rps', type=float, default=50, help='requisições por segundo')
+    parser.add_argument('--duration', type=float, default=10, help='duração em segundos')
+    parser.add_argument('--concurrency', type=int, default=200, help='máximo de conexões simultâneas')
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--secret', default=os.getenv('STRIPE_ENDPOINT_SECRET'),
+                        help='segredo para assinar os eventos (o mesmo STRIPE_ENDPOINT_SECRET do app)')
+    parser.add_argument('--manager-ids', default='prod-1', help='id_gestor separados por vírgula')
+    parser.add_argument('--setup-pixels', type=int, default=0, help='criar N pixels bench-1..N antes da carga')
+    parser.add_argument('--access-token', default='bench-token')
+    parser.add_argument('--duplicate-rate', type=float, default=0.02, help='fração de reenvios de eventos já enviados')
+    parser.add_argument('--wait-drain', type=float, default=0, help='esperar até N segundos a outbox esvaziar')
+    parser.add_argument('--mock-url', help='URL do mock do TikTok (para incluir as estatísticas dele)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--save', help='salvar o resultado em JSON')
+    parser.add_argument('--compare', help='JSON de uma execução anterior para comparar')
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    summary = asyncio.run(main(args))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as handle:
+            baseline = json.load(handle)
+    print_report(summary, baseline)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as handle:
+            json.dump(summary, handle, indent=2)
+        print(f"\n💾 Resultado salvo em {args.save}")
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Servidor local que imita a Events API do TikTok, com latência e erros configuráveis.
+
+Uso:
+    python benchmarks/mock_tiktok.py --port 9000 --latency-ms 80 --jitter-ms 40 \\
+        --throttle-rate 0.02 --server-error-rate 0.01 --failed-event-rate 0.01
+
+E no app: TIKTOK_API_BASE=http://127.0.0.1:9000/open_api/v1.3
+"""
+import argparse
+import asyncio
+import random
+import secrets
+import time
+from collections import Counter
+
+from aiohttp import web
+
+def _body(code, message, data=None):
+    return {'code': code, 'message': message, 'request_id': secrets.token_hex(12), 'data': data or {}}
+
+class MockTikTok:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.started = time.monotonic()
+        self.requests = Counter()
+        self.events = Counter()
+
+    async def _delay(self):
+        latency = max(0.0, self.rng.gauss(self.args.latency_ms, self.args.jitter_ms)) / 1000
+        if latency:
+            await asyncio.sleep(latency)
+
+    async def track(self, request):
+        await self._delay()
+        payload = await request.json()
+        events = payload.get('data') or [payload]
+
+        # Formato do /event/track/ v1.3: event_source_id (pixel) no corpo, event_time em epoch e
+        # user/page no topo de cada item
+        if not payload.get('event_source_id') or any(
+            not isinstance(event.get('event_time'), int) or 'context' in event for event in events
+        ):
+            self.requests['invalid_format'] += 1
+            self.events['rejected'] += len(events)
+            return web.json_response(_body(40002, 'Invalid parameter: event_source_id and epoch event_time are required'))
+
+        roll = self.rng.random()
+        if roll < self.args.throttle_rate:
+            self.requests['throttled'] += 1
+            headers = {'Retry-After': str(self.args.retry_after)} if self.args.retry_after else {}
+            return web.json_response(_body(40100, 'Too many requests'), status=429 if self.args.http_429 else 200, headers=headers)
+        roll -= self.args.throttle_rate
+        if roll < self.args.server_error_rate:
+            self.requests['server_error'] += 1
+            return web.json_response(_body(50000, 'Internal error'), status=500)
+        roll -= self.args.server_error_rate
+        if roll < self.args.permanent_error_rate:
+            self.requests['permanent_error'] += 1
+            self.events['rejected'] += len(events)
+            return web.json_response(_body(40002, 'Invalid parameter'))
+
+        failed = [
+            {'index': index, 'code': 40002, 'message': 'Invalid event'}
+            for index in range(len(events)) if self.rng.random() < self.args.failed_event_rate
+        ]
+        self.requests['ok'] += 1
+        self.events['accepted'] += len(events) - len(failed)
+        self.events['rejected'] += len(failed)
+        return web.json_response(_body(0, 'OK', {'failed_events': failed} if failed else {}))
+
+    async def pixel_list(self, request):
+        await self._delay()
+        self.requests['pixel_list'] += 1
+        if request.headers.get('Access-Token', '').startswith('invalid'):
+            return web.json_response(_body(40105, 'Access token is invalid'))
+
+        # MOCKPIXEL e BENCHPIXEL1..N (os pixels criados pelo load_webhook.py --setup-pixels)
+        pixels = [{'pixel_code': 'MOCKPIXEL', 'pixel_id': '1', 'name': 'Mock'}]
+        pixels += [{'pixel_code': f"BENCHPIXEL{index}", 'pixel_id': str(index + 1), 'name': f"Bench {index}"}
+                   for index in range(1, self.args.pixel_count + 1)]
+        page = max(int(request.query.get('page', 1)), 1)
+        page_size = max(int(request.query.get('page_size', 20)), 1)
+        total_page = max((len(pixels) + page_size - 1) // page_size, 1)
+        return web.json_response(_body(0, 'OK', {
+            'pixels': pixels[(page - 1) * page_size:page * page_size],
+            'page_info': {'page': page, 'page_size': page_size, 'total_number': len(pixels), 'total_page': total_page}
+        }))
+
+    async def stats(self, request):
+        elapsed = time.monotonic() - self.started
+        return web.json_response({
+            'elapsed_seconds': round(elapsed, 1),
+            'requests': dict(self.requests),
+            'events': dict(self.events),
+            'events_per_second': round(sum(self.events.values()) / elapsed, 1) if elapsed else 0
+        })
+
+    async def reset(self, request):
+        self.started = time.monotonic()
+        self.requests.clear()
+        self.events.clear()
+        return web.json_response({'reset': True})
+
+def build_app(args):
+    mock = MockTikTok(args)
+    app = web.Application()
+    app.router.add_post('/open_api/v1.3/event/track/', mock.track)
+    app.router.add_get('/open_api/v1.3/pixel/list/', mock.pixel_list)
+    app.router.add_get('/__stats', mock.stats)
+    app.router.add_post('/__reset', mock.reset)
+    return app
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Mock local da Events API do TikTok')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--latency-ms', type=float, default=50, help='latência média por requisição')
+    parser.add_argument('--jitter-ms', type=float, default=20, help='desvio padrão da latência')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='fração de respostas 40100 (rate limit)')
+    parser.add_argument('--http-429', action='store_true', help='responder rate limit com HTTP 429 (padrão: 200 + code 40100)')
+    parser.add_argument('--retry-after', type=float, default=0, help='valor do Retry-After nas respostas de rate limit')
+    parser.add_argument('--server-error-rate', type=float, default=0.0, help='fração de respostas 500/50000')
+    parser.add_argument('--permanent-error-rate', type=float, default=0.0, help='fração de respostas 40002 (lote inteiro rejeitado)')
+    parser.add_argument('--failed-event-rate', type=float, default=0.0, help='fração de eventos em data.failed_events')
+    parser.add_argument('--pixel-count', type=int, default=50, help='pixels BENCHPIXEL1..N listados em /pixel/list/')
+    parser.add_argument('--seed', type=int, default=None)
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    args = parse_args()
+    print(f"🧪 Mock TikTok em http://{args.host}:{args.port}/open_api/v1.3 "
+          f"(latência {args.latency_ms}±{args.jitter_ms}ms, estatísticas em /__stats)")
+    web.run_app(build_app(args), host=args.host, port=args.port, print=None, access_log=None)
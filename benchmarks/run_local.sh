@@ -0,0 +1,59 @@
+#!/bin/bash
+# Benchmark local completo: mock do TikTok + app no Gunicorn + carga no webhook
+#
+# Uso: ./benchmarks/run_local.sh [argumentos extras do load_webhook.py]
+# Ex.: RPS=300 DURATION=60 MOCK_LATENCY_MS=120 ./benchmarks/run_local.sh --save benchmarks/results/atual.json
+#
+# Sem DATABASE_URL o app usa um arquivo SQLite temporário; para números próximos da produção
+# use um PostgreSQL (DATABASE_URL=postgresql://...).
+set -e
+
+cd "$(dirname "$0")/.."
+
+APP_PORT=${APP_PORT:-5055}
+MOCK_PORT=${MOCK_PORT:-9055}
+RPS=${RPS:-100}
+DURATION=${DURATION:-20}
+PIXELS=${PIXELS:-10}
+
+export STRIPE_ENDPOINT_SECRET=${STRIPE_ENDPOINT_SECRET:-whsec_benchmark}
+export TIKTOK_API_BASE="http://127.0.0.1:${MOCK_PORT}/open_api/v1.3"
+export PORT=$APP_PORT
+export LOG_LEVEL=${LOG_LEVEL:-WARNING}
+export GUNICORN_ACCESS_LOG=${GUNICORN_ACCESS_LOG:-/dev/null}
+export GUNICORN_WORKERS=${GUNICORN_WORKERS:-2}
+if [ -z "$DATABASE_URL" ]; then
+    BENCH_DB=$(mktemp /tmp/tiktok-bench-XXXXXX.db)
+    export DATABASE_URL="sqlite:///${BENCH_DB}"
+fi
+
+echo "🧪 Iniciando mock do TikTok na porta ${MOCK_PORT}..."
+python benchmarks/mock_tiktok.py --port "$MOCK_PORT" \
+    --latency-ms "${MOCK_LATENCY_MS:-80}" --jitter-ms "${MOCK_JITTER_MS:-30}" \
+    --throttle-rate "${MOCK_THROTTLE_RATE:-0.01}" --server-error-rate "${MOCK_SERVER_ERROR_RATE:-0.005}" \
+    --failed-event-rate "${MOCK_FAILED_EVENT_RATE:-0.005}" &
+MOCK_PID=$!
+
+echo "🚀 Iniciando app na porta ${APP_PORT}..."
+# Dispatcher em processo separado (como em produção); DISPATCHER_ARGS=--async para o modo asyncio
+OUTBOX_DISPATCHER_THREAD=false gunicorn -c gunicorn.conf.py wsgi:app &
+APP_PID=$!
+sleep 1
+python dispatcher.py ${DISPATCHER_ARGS} &
+DISPATCHER_PID=$!
+
+trap 'kill $APP_PID $DISPATCHER_PID $MOCK_PID 2>/dev/null; wait 2>/dev/null; [ -n "$BENCH_DB" ] && rm -f "$BENCH_DB"' EXIT
+
+# Esperar o app responder
+for _ in $(seq 1 50); do
+    curl -sf "http://127.0.0.1:${APP_PORT}/health" > /dev/null && break
+    sleep 0.2
+done
+
+python benchmarks/load_webhook.py \
+    --url "http://127.0.0.1:${APP_PORT}" \
+    --mock-url "http://127.0.0.1:${MOCK_PORT}" \
+    --rps "$RPS" --duration "$DURATION" \
+    --setup-pixels "$PIXELS" \
+    --wait-drain 60 \
+    "$@"
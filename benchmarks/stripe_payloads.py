@@ -0,0 +1,124 @@
+"""Geração de eventos Stripe realistas (e assinados) para os benchmarks do webhook"""
+import hmac
+import json
+import random
+import hashlib
+import time
+
+FIRST_NAMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Elisa', 'Felipe', 'Gabriela', 'Henrique', 'Isabela', 'João']
+LAST_NAMES = ['Silva', 'Souza', 'Oliveira', 'Santos', 'Pereira', 'Costa', 'Rodrigues', 'Almeida']
+CURRENCIES = ['brl', 'brl', 'brl', 'usd', 'eur']
+EVENT_TYPES = ['checkout.session.completed', 'payment_intent.succeeded']
+
+def _random_id(rng, prefix, size=24):
+    alphabet = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+    return prefix + ''.join(rng.choice(alphabet) for _ in range(size))
+
+def _customer(rng):
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    return {
+        'name': f"{first} {last}",
+        'email': f"{first.lower()}.{last.lower()}{rng.randint(1, 9999)}@exemplo.com.br",
+        'phone': f"+55{rng.randint(11, 99)}9{rng.randint(10000000, 99999999)}"
+    }
+
+def checkout_session_completed(rng, manager_id):
+    customer = _customer(rng)
+    created = int(time.time())
+    return {
+        'id': _random_id(rng, 'evt_'),
+        'object': 'event',
+        'api_version': '2023-10-16',
+        'created': created,
+        'type': 'checkout.session.completed',
+        'livemode': False,
+        'data': {
+            'object': {
+                'id': _random_id(rng, 'cs_test_'),
+                'object': 'checkout.session',
+                'amount_subtotal': (amount := rng.choice([990, 1990, 4990, 9700, 19700, 49700])),
+                'amount_total': amount,
+                'currency': rng.choice(CURRENCIES),
+                'customer': _random_id(rng, 'cus_', 14),
+                'customer_details': {
+                    'email': customer['email'],
+                    'name': customer['name'],
+                    'phone': customer['phone'],
+                    'address': {'country': 'BR', 'postal_code': f"{rng.randint(10000, 99999)}-000"}
+                },
+                'mode': 'payment',
+                'payment_intent': _random_id(rng, 'pi_'),
+                'payment_status': 'paid',
+                'status': 'complete',
+                'success_url': 'https://loja.exemplo.com.br/obrigado',
+                'metadata': {'utm_term': manager_id, 'utm_source': 'tiktok', 'utm_medium': 'cpc'}
+            }
+        }
+    }
+
+def payment_intent_succeeded(rng, manager_id):
+    customer = _customer(rng)
+    created = int(time.time())
+    return {
+        'id': _random_id(rng, 'evt_'),
+        'object': 'event',
+        'api_version': '2023-10-16',
+        'created': created,
+        'type': 'payment_intent.succeeded',
+        'livemode': False,
+        'data': {
+            'object': {
+                'id': _random_id(rng, 'pi_'),
+                'object': 'payment_intent',
+                'amount': rng.choice([990, 1990, 4990, 9700, 19700, 49700]),
+                'amount_received': 0,
+                'currency': rng.choice(CURRENCIES),
+                'customer': _random_id(rng, 'cus_', 14),
+                'receipt_email': customer['email'],
+                'status': 'succeeded',
+                'billing_details': {
+                    'email': customer['email'],
+                    'name': customer['name'],
+                    'phone': customer['phone']
+                },
+                'metadata': {'utm_term': manager_id, 'customer_email': customer['email']}
+            }
+        }
+    }
+
+GENERATORS = {
+    'checkout.session.completed': checkout_session_completed,
+    'payment_intent.succeeded': payment_intent_succeeded
+}
+
+def make_event(rng, manager_ids, event_type=None):
+    """Um evento Stripe aleatório para um dos gestores"""
+    event_type = event_type or rng.choice(EVENT_TYPES)
+    return GENERATORS[event_type](rng, rng.choice(manager_ids))
+
+def sign_payload(payload, secret, timestamp=None):
+    """Cabeçalho Stripe-Signature (t=...,v1=...) para o corpo em bytes"""
+    timestamp = int(timestamp or time.time())
+    signed = f"{timestamp}.".encode('utf-8') + payload
+    signature = hmac.new(secret.encode('utf-8'), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+def add_metadata(event, keys, rng):
+    """Acrescenta `keys` chaves extras aos metadata do evento (lojas com muitos campos de rastreio)"""
+    metadata = event['data']['object'].setdefault('metadata', {})
+    for index in range(keys):
+        metadata[f"campo_{index}"] = _random_id(rng, '', rng.randint(8, 64))
+    return event
+
+def make_corpus(size, manager_ids, seed=42, metadata_keys=0):
+    """Lista fixa (semente) de eventos, para comparações reproduzíveis"""
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(size):
+        event = add_metadata(make_event(rng, manager_ids), metadata_keys, rng)
+        event['created'] = 1700000000 + index
+        corpus.append(event)
+    return corpus
+
+if __name__ == '__main__':
+    print(json.dumps(make_event(random.Random(), ['prod-1']), indent=2, ensure_ascii=False))
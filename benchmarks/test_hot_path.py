@@ -0,0 +1,192 @@
+"""Microbenchmarks do trabalho de CPU por evento no webhook e no dispatcher.
+
+Cada teste processa um corpus fixo de eventos (conftest.py) e falha se o custo médio por
+evento passar do orçamento em CPU_BUDGET_US (multiplicado por BENCHMARK_BUDGET_SCALE, para
+máquinas mais lentas). Para detectar regressões em relação a uma execução anterior:
+
+    pytest benchmarks --benchmark-autosave
+    pytest benchmarks --benchmark-compare --benchmark-compare-fail=mean:15%
+
+Com --benchmark-disable cada teste roda uma única vez, sem checar o orçamento (smoke test em CI).
+"""
+import os
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from conftest import SIGNATURE_TIMESTAMP, SIGNING_SECRET  # noqa: E402
+from main import (  # noqa: E402
+    IdentityHasher, RoutingTable, StripeSignatureVerifier, TikTokEventsAPI, compile_routing_rules, extract_event_data,
+    json_dumps_bytes, json_loads
+)
+
+BUDGET_SCALE = float(os.getenv('BENCHMARK_BUDGET_SCALE', 1))
+
+# Orçamento em microssegundos por evento (média), com folga para variação entre máquinas
+CPU_BUDGET_US = {
+    ('signature', 'small'): 40,
+    ('signature', 'medium'): 50,
+    ('signature', 'large'): 80,
+    ('signature', 'xlarge'): 200,
+    ('parse', 'small'): 60,
+    ('parse', 'medium'): 100,
+    ('parse', 'large'): 150,
+    ('parse', 'xlarge'): 1200,
+    ('extract', 'small'): 10,
+    ('extract', 'medium'): 10,
+    ('extract', 'large'): 10,
+    ('extract', 'xlarge'): 10,
+    ('hash', None): 8,
+    ('build_event', None): 60,
+    ('serialize', None): 15,
+    ('route', None): 20
+}
+
+def check_budget(benchmark, name, size, events):
+    """Grava o custo por evento no relatório e falha acima do orçamento"""
+    if benchmark.stats is None:
+        # --benchmark-disable: cada teste roda uma vez, como smoke test, sem medir nem checar orçamento
+        return
+    per_event_us = benchmark.stats.stats.mean / events * 1e6
+    benchmark.extra_info['per_event_us'] = round(per_event_us, 2)
+    budget = CPU_BUDGET_US[(name, size)] * BUDGET_SCALE
+    assert per_event_us <= budget, f"{name}/{size}: {per_event_us:.1f}µs por evento (orçamento {budget:.1f}µs)"
+
+@pytest.fixture(scope='module')
+def tiktok_client():
+    return TikTokEventsAPI('token-benchmark', 'PIXELBENCH')
+
+@pytest.fixture(scope='module')
+def verifier():
+    # Segredo antigo antes do atual: mede também o custo de uma rotação em andamento
+    return StripeSignatureVerifier(['whsec_rotacionado', SIGNING_SECRET])
+
+def test_validate_stripe_signature(benchmark, verifier, corpus):
+    items = list(zip(corpus.payloads, corpus.signatures))
+
+    def run():
+        for payload, signature in items:
+            assert verifier.verify(payload, signature, now=SIGNATURE_TIMESTAMP)
+
+    benchmark.group = 'signature'
+    benchmark(run)
+    check_budget(benchmark, 'signature', corpus.name, len(corpus))
+
+def test_validate_stripe_signature_invalid(benchmark, verifier, small_corpus):
+    # Assinatura inválida precisa custar o mesmo que uma válida (sem atalhos)
+    items = [(payload, signature[:-4] + '0000') for payload, signature in zip(small_corpus.payloads, small_corpus.signatures)]
+
+    def run():
+        for payload, signature in items:
+            assert not verifier.verify(payload, signature, now=SIGNATURE_TIMESTAMP)
+
+    benchmark.group = 'signature'
+    benchmark(run)
+    check_budget(benchmark, 'signature', 'small', len(small_corpus))
+
+def test_validate_stripe_signature_stale(verifier, small_corpus):
+    # Fora da tolerância o evento é recusado mesmo com assinatura correta
+    payload, signature = small_corpus.payloads[0], small_corpus.signatures[0]
+    assert not verifier.verify(payload, signature, now=SIGNATURE_TIMESTAMP + verifier.tolerance + 1)
+
+def test_parse_payload(benchmark, corpus):
+    # Mesmo backend do webhook (orjson quando instalado; JSON_BACKEND=stdlib para comparar)
+    def run():
+        for payload in corpus.payloads:
+            json_loads(payload)
+
+    benchmark.group = 'parse'
+    benchmark(run)
+    check_budget(benchmark, 'parse', corpus.name, len(corpus))
+
+def test_serialize_tiktok_payload(benchmark, tiktok_client, small_corpus):
+    # Corpo do lote enviado ao TikTok, serializado uma única vez por requisição
+    events = [tiktok_client.build_purchase_event(extract_event_data(event)) for event in small_corpus.events]
+    payloads = [tiktok_client.track_payload(events[index:index + 50]) for index in range(0, len(events), 50)]
+
+    def run():
+        for payload in payloads:
+            json_dumps_bytes(payload)
+
+    benchmark.group = 'serialize'
+    benchmark(run)
+    check_budget(benchmark, 'serialize', None, len(events))
+
+def test_extract_event_data(benchmark, corpus):
+    def run():
+        for event in corpus.events:
+            extract_event_data(event)
+
+    benchmark.group = 'extract'
+    benchmark(run)
+    check_budget(benchmark, 'extract', corpus.name, len(corpus))
+
+def test_extract_event_data_fields(small_corpus):
+    # Garante que o benchmark mede a extração completa (e-mail, telefone e valor preenchidos)
+    for event in small_corpus.events:
+        data = extract_event_data(event)
+        assert data['email'] and data['phone'] and data['value'] > 0
+
+def _identities(corpus):
+    values = []
+    for event in corpus.events:
+        data = extract_event_data(event)
+        values.extend([('email', data['email']), ('phone', data['phone']), ('external_id', data['external_id'])])
+    return values
+
+def test_hash_data(benchmark, tiktok_client, small_corpus):
+    # Clientes recorrentes: depois da primeira rodada todos os hashes saem do cache
+    values = _identities(small_corpus)
+
+    def run():
+        for kind, value in values:
+            tiktok_client._hash_data(value, kind)
+
+    benchmark.group = 'hash'
+    benchmark(run)
+    check_budget(benchmark, 'hash', None, len(values))
+
+def test_hash_data_uncached(benchmark, small_corpus):
+    # Primeira compra de cada cliente: normalização + SHA-256 a cada valor
+    hasher = IdentityHasher(max_size=0)
+    values = _identities(small_corpus)
+
+    def run():
+        for kind, value in values:
+            hasher.hash(kind, value)
+
+    benchmark.group = 'hash'
+    benchmark(run)
+    check_budget(benchmark, 'hash', None, len(values))
+
+def test_build_purchase_event(benchmark, tiktok_client, small_corpus):
+    event_data = [extract_event_data(event) for event in small_corpus.events]
+
+    def run():
+        for data in event_data:
+            tiktok_client.build_purchase_event(data)
+
+    benchmark.group = 'build_event'
+    benchmark(run)
+    check_budget(benchmark, 'build_event', None, len(event_data))
+
+@pytest.mark.parametrize('rule_count', [10, 10000])
+def test_route_event(benchmark, small_corpus, rule_count):
+    # O custo por evento depende dos grupos de campos das regras, não da quantidade de regras
+    rules = [
+        {'match': {'metadata.campanha': f"campanha-{index}"}, 'id_gestor': f"gestor-{index}"}
+        for index in range(rule_count)
+    ]
+    rules.append({'match': {'currency': 'usd', 'type': 'checkout.session.completed'}, 'id_gestor': 'internacional'})
+    table = RoutingTable(path='')
+    table._routes = compile_routing_rules({'rules': rules})
+    events = small_corpus.events
+
+    def run():
+        for event in events:
+            table.resolve(event)
+
+    benchmark.group = 'route'
+    benchmark(run)
+    check_budget(benchmark, 'route', None, len(events))
@@ -1,12 +1,22 @@
 #!/usr/bin/env python3
 
+import argparse
+import os
 import requests
 import json
 
+BASE_URL = os.getenv('TRACKING_URL', 'https://track.bxsdur.easypanel.host').rstrip('/')
+# Mesmo PIXEL_EXPORT_SECRET do servidor: sem ele a exportação não inclui os access_token
+EXPORT_SECRET = os.getenv('PIXEL_EXPORT_SECRET', '')
+
+# Formato do arquivo pela extensão (.csv, .ndjson/.jsonl ou .json)
+FILE_FORMATS = {'.csv': 'csv', '.ndjson': 'ndjson', '.jsonl': 'ndjson', '.json': 'json'}
+CONTENT_TYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson', 'json': 'application/json'}
+
 def create_pixel():
     """Criar pixel padrão prod-1"""
     
-    url = "https://track.bxsdur.easypanel.host/api/pixels"
+    url = f"{BASE_URL}/api/pixels"
     
     pixel_data = {
         "manager_id": "prod-1",
@@ -37,7 +47,7 @@ def create_pixel():
 def list_pixels():
     """Listar pixels existentes"""
     
-    url = "https://track.bxsdur.easypanel.host/api/pixels"
+    url = f"{BASE_URL}/api/pixels"
     
     print("\n📋 Listando pixels existentes...")
     
@@ -52,7 +62,7 @@ def list_pixels():
 def check_logs():
     """Verificar logs do pixel"""
     
-    url = "https://track.bxsdur.easypanel.host/api/pixels/prod-1/logs"
+    url = f"{BASE_URL}/api/pixels/prod-1/logs"
     
     print("\n📊 Verificando logs do pixel prod-1...")
     
@@ -64,7 +74,80 @@ def check_logs():
     except Exception as e:
         print(f"❌ Erro de conexão: {e}")
 
+def bulk_import(path, mode='upsert', dry_run=False):
+    """Cadastrar pixels em lote a partir de um arquivo CSV, NDJSON ou JSON"""
+    
+    fmt = FILE_FORMATS.get(os.path.splitext(path)[1].lower(), 'ndjson')
+    url = f"{BASE_URL}/api/pixels/bulk"
+    params = {'format': fmt, 'mode': mode}
+    if dry_run:
+        params['dry_run'] = 'true'
+    
+    print(f"\n📦 Enviando {path} ({fmt}) para {url}...")
+    
+    try:
+        # O arquivo vai em streaming, sem ser carregado na memória
+        with open(path, 'rb') as handle:
+            response = requests.post(url, data=handle, params=params,
+                                     headers={'Content-Type': CONTENT_TYPES[fmt]}, timeout=300)
+        print(f"Status: {response.status_code}")
+        result = response.json()
+        print(f"Resumo: {result.get('summary', result.get('error'))}")
+        
+        for row in result.get('results', []):
+            if row['status'] in ('error', 'exists'):
+                print(f"❌ Linha {row['line']} ({row.get('id_gestor')}): {row['error']}")
+            elif row.get('chave_seguranca'):
+                print(f"✅ {row['id_gestor']}: chave de segurança {row['chave_seguranca']}")
+        
+    except Exception as e:
+        print(f"❌ Erro de conexão: {e}")
+
+def export_pixels(path, include_inactive=False):
+    """Exportar os pixels para um arquivo (mesmo formato aceito pelo cadastro em lote)"""
+    
+    fmt = FILE_FORMATS.get(os.path.splitext(path)[1].lower(), 'ndjson')
+    url = f"{BASE_URL}/api/pixels/export"
+    params = {'format': fmt, 'include_inactive': 'true' if include_inactive else 'false'}
+    headers = {}
+    if EXPORT_SECRET:
+        params['include_tokens'] = 'true'
+        headers['X-Export-Secret'] = EXPORT_SECRET
+    
+    print(f"\n💾 Exportando pixels para {path}...")
+    if not EXPORT_SECRET:
+        print("⚠️  PIXEL_EXPORT_SECRET não definido: o arquivo não terá os access_token (não serve para reimportar)")
+    
+    try:
+        with requests.get(url, params=params, headers=headers, stream=True, timeout=300) as response:
+            response.raise_for_status()
+            with open(path, 'wb') as handle:
+                for block in response.iter_content(chunk_size=65536):
+                    handle.write(block)
+        print("✅ Exportação concluída!")
+        
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Configuração de pixels TikTok')
+    parser.add_argument('--import', dest='import_file', help='arquivo CSV/NDJSON/JSON com pixels para cadastrar em lote')
+    parser.add_argument('--mode', choices=['upsert', 'create'], default='upsert',
+                        help='upsert atualiza gestores existentes; create só cria novos')
+    parser.add_argument('--dry-run', action='store_true', help='apenas validar o arquivo')
+    parser.add_argument('--export', dest='export_file', help='exportar os pixels para o arquivo')
+    parser.add_argument('--include-inactive', action='store_true', help='incluir pixels inativos na exportação')
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    if args.import_file or args.export_file:
+        if args.import_file:
+            bulk_import(args.import_file, args.mode, args.dry_run)
+        if args.export_file:
+            export_pixels(args.export_file, args.include_inactive)
+        raise SystemExit(0)
+    
     print("🚀 Configuração do Pixel TikTok")
     print("=" * 40)
     
@@ -5,11 +5,15 @@ CREATE TABLE IF NOT EXISTS tiktok_pixels (
     pixel_id VARCHAR(100) NOT NULL,
     access_token TEXT NOT NULL,
     nome_pixel VARCHAR(200),
+    advertiser_id VARCHAR(50),
     chave_seguranca VARCHAR(64) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     ativo BOOLEAN DEFAULT true
 );
 
+-- Bancos criados antes da verificação de saúde dos pixels
+ALTER TABLE tiktok_pixels ADD COLUMN IF NOT EXISTS advertiser_id VARCHAR(50);
+
 -- Criar tabela de logs de eventos
 CREATE TABLE IF NOT EXISTS event_logs (
     id SERIAL PRIMARY KEY,
@@ -18,15 +22,90 @@ CREATE TABLE IF NOT EXISTS event_logs (
     stripe_event_type VARCHAR(50) NOT NULL,
     status VARCHAR(20) NOT NULL, -- success, error
     error_message TEXT,
-    tiktok_response TEXT,
+    tiktok_response TEXT, -- legado; respostas novas ficam em tiktok_response_bodies
+    response_hash VARCHAR(64),
+    tiktok_request_id VARCHAR(100),
+    event_payload TEXT, -- evento enviado ao TikTok (JSON), usado no replay
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Bancos criados antes de tiktok_response_bodies
+ALTER TABLE event_logs ADD COLUMN IF NOT EXISTS response_hash VARCHAR(64);
+ALTER TABLE event_logs ADD COLUMN IF NOT EXISTS tiktok_request_id VARCHAR(100);
+-- Bancos criados antes do replay de eventos
+ALTER TABLE event_logs ADD COLUMN IF NOT EXISTS event_payload TEXT;
+
+-- Corpos de resposta do TikTok, um por conteúdo (sha256 do JSON sem request_id), comprimidos
+-- (converta os logs antigos com: python maintenance.py compact-responses)
+CREATE TABLE IF NOT EXISTS tiktok_response_bodies (
+    hash VARCHAR(64) PRIMARY KEY,
+    encoding VARCHAR(10) NOT NULL, -- raw, zlib, zstd
+    body BYTEA NOT NULL,
+    size INTEGER NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Criar fila de saída (outbox) de eventos para o TikTok
+CREATE TABLE IF NOT EXISTS event_outbox (
+    id SERIAL PRIMARY KEY,
+    stripe_event_id VARCHAR(100) NOT NULL,
+    stripe_event_type VARCHAR(50) NOT NULL,
+    id_gestor VARCHAR(50) NOT NULL,
+    pixel_id VARCHAR(100) NOT NULL,
+    event_data TEXT NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending, processing, done, dead
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    locked_by VARCHAR(100),
+    locked_until TIMESTAMP,
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Contadores agregados de eventos (rollups) por pixel, status e período
+-- (granularity: all = acumulado, day, hour; preencha com: python maintenance.py rebuild-stats)
+CREATE TABLE IF NOT EXISTS event_stats (
+    pixel_id VARCHAR(100) NOT NULL,
+    granularity VARCHAR(10) NOT NULL,
+    bucket_start TIMESTAMP NOT NULL,
+    status VARCHAR(20) NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (pixel_id, granularity, bucket_start, status)
+);
+
+-- Versões de cache compartilhadas entre workers (invalidação do cache de pixels)
+CREATE TABLE IF NOT EXISTS cache_versions (
+    name VARCHAR(50) PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO cache_versions (name, version) VALUES ('pixels', 0) ON CONFLICT (name) DO NOTHING;
+
 -- Criar índices para melhor performance
 CREATE INDEX IF NOT EXISTS idx_tiktok_pixels_id_gestor ON tiktok_pixels(id_gestor);
 CREATE INDEX IF NOT EXISTS idx_tiktok_pixels_ativo ON tiktok_pixels(ativo);
-CREATE INDEX IF NOT EXISTS idx_event_logs_pixel_id ON event_logs(pixel_id);
+-- Índice composto para a paginação por cursor dos logs (substitui o índice simples em pixel_id)
+CREATE INDEX IF NOT EXISTS idx_event_logs_pixel_created_id ON event_logs(pixel_id, created_at, id);
+DROP INDEX IF EXISTS idx_event_logs_pixel_id;
 CREATE INDEX IF NOT EXISTS idx_event_logs_created_at ON event_logs(created_at);
+CREATE INDEX IF NOT EXISTS idx_event_outbox_status_next_attempt ON event_outbox(status, next_attempt_at);
+
+-- Idempotência: um evento Stripe gera uma única entrada na outbox por gestor e um único log por pixel.
+-- Em bancos antigos com logs duplicados o índice único falha: rode antes dedupe_event_logs.sql
+-- (uma vez; guarda as linhas removidas em event_logs_duplicates).
+-- Com event_logs já particionada (partition_event_logs.sql) o índice único precisa incluir
+-- created_at; a unicidade por (stripe_event_id, pixel_id) fica com o upsert_event_logs() do app.
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('event_logs')) = 'p' THEN
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_event_logs_stripe_event_pixel ON event_logs(stripe_event_id, pixel_id, created_at);
+    ELSE
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_event_logs_stripe_event_pixel ON event_logs(stripe_event_id, pixel_id);
+    END IF;
+END $$;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_event_outbox_stripe_event_gestor ON event_outbox(stripe_event_id, id_gestor);
 
 -- Verificar se as tabelas foram criadas
 SELECT 
@@ -35,5 +114,5 @@ SELECT
     data_type,
     is_nullable
 FROM information_schema.columns 
-WHERE table_name IN ('tiktok_pixels', 'event_logs')
+WHERE table_name IN ('tiktok_pixels', 'event_logs', 'event_outbox', 'event_stats', 'cache_versions', 'tiktok_response_bodies')
 ORDER BY table_name, ordinal_position;
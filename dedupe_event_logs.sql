@@ -0,0 +1,33 @@
+-- Remover logs duplicados de event_logs (mesmo stripe_event_id e pixel_id), mantendo o mais recente
+-- Execute uma vez, antes de create_tables.sql, em bancos criados antes do índice único
+-- uq_event_logs_stripe_event_pixel:
+--   psql "$DATABASE_URL" -f dedupe_event_logs.sql
+-- As linhas removidas são copiadas para event_logs_duplicates (com removed_at) antes do DELETE;
+-- confira e apague essa tabela quando não precisar mais dela.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS event_logs_duplicates (LIKE event_logs);
+ALTER TABLE event_logs_duplicates ADD COLUMN IF NOT EXISTS removed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+DO $$
+DECLARE
+    removed INTEGER;
+BEGIN
+    WITH deleted AS (
+        DELETE FROM event_logs a USING event_logs b
+        WHERE a.stripe_event_id = b.stripe_event_id AND a.pixel_id = b.pixel_id AND a.id < b.id
+        RETURNING a.*
+    )
+    INSERT INTO event_logs_duplicates SELECT * FROM deleted;
+    GET DIAGNOSTICS removed = ROW_COUNT;
+    RAISE NOTICE '% logs duplicados movidos para event_logs_duplicates', removed;
+END $$;
+
+COMMIT;
+
+-- Conferir o que foi removido
+SELECT pixel_id, count(*) AS removidos, min(created_at) AS mais_antigo, max(created_at) AS mais_recente
+FROM event_logs_duplicates
+GROUP BY pixel_id
+ORDER BY removidos DESC;
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+
+import os
+import signal
+import asyncio
+import argparse
+import threading
+from dotenv import load_dotenv
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+# O dispatcher roda em processo separado: não iniciar a thread embutida
+os.environ.setdefault('OUTBOX_DISPATCHER_THREAD', 'false')
+
+from main import app, db, run_outbox_dispatcher, run_outbox_dispatcher_async  # noqa: E402
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Dispatcher da outbox de eventos para o TikTok')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='usar o cliente asyncio (aiohttp) com requisições em paralelo')
+    args = parser.parse_args()
+    
+    stop_event = threading.Event()
+    
+    def _stop(signum, frame):
+        app.logger.info("🛑 Encerrando dispatcher...")
+        stop_event.set()
+    
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    
+    with app.app_context():
+        db.create_all()
+    
+    if args.use_async:
+        asyncio.run(run_outbox_dispatcher_async(stop_event))
+    else:
+        run_outbox_dispatcher(stop_event)
@@ -1,6 +1,10 @@
 -- Habilitar Row Level Security (RLS) nas tabelas
 ALTER TABLE public.tiktok_pixels ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.event_logs ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.event_outbox ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.cache_versions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.event_stats ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.tiktok_response_bodies ENABLE ROW LEVEL SECURITY;
 
 -- Criar políticas para permitir todas as operações (para desenvolvimento/produção)
 -- Isso permite que a aplicação acesse os dados normalmente
@@ -19,6 +23,34 @@ FOR ALL
 USING (true) 
 WITH CHECK (true);
 
+-- Política para event_outbox
+CREATE POLICY "Allow all operations on event_outbox" 
+ON public.event_outbox 
+FOR ALL 
+USING (true) 
+WITH CHECK (true);
+
+-- Política para cache_versions
+CREATE POLICY "Allow all operations on cache_versions" 
+ON public.cache_versions 
+FOR ALL 
+USING (true) 
+WITH CHECK (true);
+
+-- Política para event_stats
+CREATE POLICY "Allow all operations on event_stats" 
+ON public.event_stats 
+FOR ALL 
+USING (true) 
+WITH CHECK (true);
+
+-- Política para tiktok_response_bodies
+CREATE POLICY "Allow all operations on tiktok_response_bodies" 
+ON public.tiktok_response_bodies 
+FOR ALL 
+USING (true) 
+WITH CHECK (true);
+
 -- Verificar se as políticas foram criadas
 SELECT 
     schemaname,
@@ -30,7 +62,7 @@ SELECT
     qual,
     with_check
 FROM pg_policies 
-WHERE tablename IN ('tiktok_pixels', 'event_logs');
+WHERE tablename IN ('tiktok_pixels', 'event_logs', 'event_outbox', 'cache_versions', 'event_stats', 'tiktok_response_bodies');
 
 -- Verificar se RLS está habilitado
 SELECT 
@@ -38,4 +70,4 @@ SELECT
     tablename,
     rowsecurity
 FROM pg_tables 
-WHERE tablename IN ('tiktok_pixels', 'event_logs');
+WHERE tablename IN ('tiktok_pixels', 'event_logs', 'event_outbox', 'cache_versions', 'event_stats', 'tiktok_response_bodies');
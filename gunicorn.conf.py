@@ -0,0 +1,71 @@
+# Configuração do Gunicorn para produção
+# Uso: gunicorn -c gunicorn.conf.py wsgi:app
+import os
+import multiprocessing
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '5000')}"
+
+# Workers: processos (multi-core) x threads por processo
+# - gthread (padrão): threads do SO, bom para a maioria dos casos
+# - gevent: worker assíncrono, chamadas de I/O não prendem threads do SO
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+
+# Com gevent o monkey patch vem antes de qualquer import do app, inclusive o dos hooks abaixo
+# (o master importa main em on_starting e os workers herdam os módulos já carregados)
+if worker_class == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass
+
+workers = int(os.getenv('GUNICORN_WORKERS', os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+# Reciclar workers periodicamente evita acúmulo de memória
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 1000))
+
+# Carregar o app (e o engine do banco) uma vez no master e compartilhar via fork.
+# Com gevent o preload fica desligado: conexões, threads e sessões do app são criadas em cada worker.
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true' if worker_class != 'gevent' else 'false').lower() == 'true'
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+def on_starting(server):
+    """Início do serviço: apagar snapshots de métricas de execuções anteriores"""
+    from main import metrics
+    
+    metrics.clear_directory()
+
+def post_worker_init(worker):
+    """Worker pronto (app já carregado pelo wsgi.py, depois do monkey patch): descartar conexões
+    herdadas do master e, se habilitado, iniciar o dispatcher"""
+    from main import app, db, outbox_dispatcher_thread_enabled, start_outbox_dispatcher
+    
+    with app.app_context():
+        # SQLite em memória vive na conexão herdada: descartá-la apagaria as tabelas
+        if db.engine.url.database not in (None, '', ':memory:'):
+            db.engine.dispose(close=False)
+    
+    # Um único dispatcher por máquina (trava de arquivo): um por worker faria N laços de polling e,
+    # no SQLite (sem SKIP LOCKED), enviaria os mesmos eventos mais de uma vez.
+    # Com o dispatcher em processo próprio (python dispatcher.py), use OUTBOX_DISPATCHER_THREAD=false.
+    if outbox_dispatcher_thread_enabled():
+        start_outbox_dispatcher(exclusive=True)
+
+def worker_exit(server, worker):
+    """Encerramento do worker: gravar os logs de eventos que ainda estão no buffer"""
+    from main import event_log_writer, metrics
+    
+    event_log_writer.close()
+    metrics.persist()
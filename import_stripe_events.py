@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Backfill de compras a partir de eventos exportados do Stripe (JSONL, opcionalmente .gz)
+
+Uso:
+    python import_stripe_events.py eventos.jsonl.gz [mais.jsonl ...] [--dry-run]
+    stripe events list --limit 100 | python import_stripe_events.py -
+
+Cada linha é um evento Stripe (ou uma página `{"object": "list", "data": [...]}`). Os arquivos
+são lidos em streaming; os eventos de compra são enfileirados na outbox e enviados ao TikTok
+pelo dispatcher.
+"""
+
+import sys
+import gzip
+import argparse
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timezone
+from dotenv import load_dotenv
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+from main import (  # noqa: E402
+    app, import_stripe_events, json_dumps, json_loads, _parse_datetime_param, STRIPE_IMPORT_CHUNK
+)
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+@contextmanager
+def open_export(path):
+    """Abre o arquivo (ou stdin com '-') em modo binário, descompactando se for gzip.
+    
+    Ao sair fecha o gzip e o arquivo aberto aqui; a entrada padrão não é fechada.
+    """
+    stream = sys.stdin.buffer if path == '-' else open(path, 'rb')
+    try:
+        if stream.peek(2)[:2] == GZIP_MAGIC:
+            with gzip.GzipFile(fileobj=stream) as decompressed:
+                yield decompressed
+        else:
+            yield stream
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+
+def iter_events(paths, errors, since=None, until=None):
+    """Eventos de todos os arquivos, linha a linha; linhas inválidas são contadas em `errors`"""
+    for path in paths:
+        with open_export(path) as stream:
+            for line_number, line in enumerate(stream, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    data = json_loads(line)
+                except ValueError:
+                    errors[f"{path}:{line_number}"] += 1
+                    continue
+                # Página da API (`stripe events list`): os eventos ficam em data
+                events = data.get('data', []) if isinstance(data, dict) and data.get('object') == 'list' else [data]
+                for event in events:
+                    created = event.get('created') if isinstance(event, dict) else None
+                    if isinstance(created, (int, float)):
+                        if (since and created < since) or (until and created >= until):
+                            continue
+                    yield event
+
+def _epoch(value):
+    """Data ISO 8601 em segundos desde a época (como o `created` do Stripe)"""
+    return _parse_datetime_param(value).replace(tzinfo=timezone.utc).timestamp()
+
+def main():
+    parser = argparse.ArgumentParser(description='Importar eventos exportados do Stripe para a outbox do TikTok')
+    parser.add_argument('paths', nargs='+', help="arquivos JSONL (ou .jsonl.gz); '-' lê da entrada padrão")
+    parser.add_argument('--since', help='só eventos criados a partir desta data (ISO 8601)')
+    parser.add_argument('--until', help='só eventos criados antes desta data (ISO 8601)')
+    parser.add_argument('--chunk-size', type=int, default=STRIPE_IMPORT_CHUNK, help='eventos por transação')
+    parser.add_argument('--dry-run', action='store_true', help='só conta o que seria enfileirado')
+    parser.add_argument('--json', action='store_true', help='progresso em JSON (uma linha por bloco)')
+    args = parser.parse_args()
+
+    since = _epoch(args.since) if args.since else None
+    until = _epoch(args.until) if args.until else None
+    errors = Counter()
+
+    with app.app_context():
+        progress = import_stripe_events(
+            iter_events(args.paths, errors, since, until),
+            chunk_size=args.chunk_size,
+            dry_run=args.dry_run
+        )
+        for line in progress:
+            if args.json:
+                print(json_dumps(line), flush=True)
+                continue
+            counts = ', '.join(f"{key}={value}" for key, value in line.items() if key != 'type')
+            icon = '📥' if line['type'] == 'progress' else '✅'
+            print(f"{icon} {counts}", flush=True)
+
+    if errors:
+        print(f"⚠️  {sum(errors.values())} linhas com JSON inválido (ex.: {', '.join(list(errors)[:5])})", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,41 @@
 import os
+import sys
+import io
+import csv
+import copy
+import itertools
 import time
 import json
+import re
+import random
+import asyncio
+import hmac
 import hashlib
 import secrets
+import base64
+import socket
+import atexit
+import bisect
+import fcntl
+import gzip
+import zlib
+import threading
+import queue
+import logging
+import logging.handlers
 import requests
-from flask import Flask, request, jsonify, send_from_directory
+from requests.adapters import HTTPAdapter
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from datetime import datetime
+from sqlalchemy import or_, and_, func, tuple_, bindparam, text, inspect
+from sqlalchemy.orm import load_only, selectinload
+from sqlalchemy.dialects import postgresql, sqlite
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from collections import Counter, OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import tempfile
 
@@ -18,10 +46,182 @@ try:
 except ImportError:
     SUPABASE_AVAILABLE = False
 
+# Importação opcional do aiohttp (cliente assíncrono do TikTok)
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# Importação opcional do zstandard (compressão das respostas do TikTok; fallback para zlib)
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Importação opcional do orjson (JSON em C/Rust; fallback para o json da stdlib)
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # Carregar variáveis de ambiente
 load_dotenv()
 
+# Backend de JSON do app, do cliente TikTok e dos logs: orjson quando instalado (JSON_BACKEND=stdlib força a stdlib)
+JSON_BACKEND = 'orjson' if ORJSON_AVAILABLE and os.getenv('JSON_BACKEND', 'auto').lower() in ('auto', 'orjson') else 'stdlib'
+
+def json_dumps_bytes(obj, sort_keys=False, default=None):
+    """Serializa em JSON compacto (UTF-8, sem escapar acentos) direto para bytes"""
+    if JSON_BACKEND == 'orjson':
+        option = orjson.OPT_NON_STR_KEYS
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if default is not None:
+            # Como na stdlib, datas passam pelo `default` (ex.: formato HTTP do Flask)
+            option |= orjson.OPT_PASSTHROUGH_DATETIME
+        try:
+            return orjson.dumps(obj, default=default, option=option)
+        except TypeError:
+            pass  # ex.: inteiros acima de 64 bits, que a stdlib aceita
+    return json.dumps(obj, sort_keys=sort_keys, default=default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def json_dumps(obj, sort_keys=False, default=None):
+    return json_dumps_bytes(obj, sort_keys=sort_keys, default=default).decode('utf-8')
+
+def json_loads(data):
+    """Lê JSON de str ou bytes (erros de sintaxe levantam ValueError nos dois backends)"""
+    if JSON_BACKEND == 'orjson':
+        return orjson.loads(data)
+    return json.loads(data)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON do Flask (jsonify, request.get_json) via json_dumps/json_loads"""
+    
+    def dumps(self, obj, **kwargs):
+        return json_dumps(obj, sort_keys=kwargs.get('sort_keys', self.sort_keys), default=kwargs.get('default', self.default))
+    
+    def loads(self, s, **kwargs):
+        return json_loads(s)
+    
+    def response(self, *args, **kwargs):
+        # Saída indentada (modo debug) continua com a implementação padrão
+        if self.compact is False or (self.compact is None and self._app.debug):
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        body = json_dumps_bytes(obj, sort_keys=self.sort_keys, default=self.default)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+# Logging: JSON lines (LOG_FORMAT=json) ou texto, gravado por uma thread (QueueListener) para que
+# a thread da requisição só enfileire o registro e nunca espere pelo I/O do log
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+
+# Chaves cujo valor nunca vai para o log (dados pessoais do cliente, mesmo já com hash)
+PII_KEYS = frozenset((
+    'email', 'phone', 'phone_number', 'external_id', 'customer_name', 'name',
+    'ip', 'user_agent', 'address', 'customer_email', 'customer_phone', 'receipt_email'
+))
+
+def redact_pii(value):
+    """Cópia de um payload (dicts/listas) com os valores das chaves de PII_KEYS mascarados"""
+    if isinstance(value, dict):
+        return {
+            key: ('[redacted]' if item not in (None, '') else item) if key in PII_KEYS else redact_pii(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [redact_pii(item) for item in value]
+    return value
+
+# Atributos padrão de um LogRecord; o resto veio de extra={...} e entra no log como campo
+_LOG_RECORD_ATTRS = frozenset(logging.makeLogRecord({}).__dict__) | {'message', 'asctime'}
+
+def _log_extras(record):
+    return {key: value for key, value in record.__dict__.items() if key not in _LOG_RECORD_ATTRS}
+
+class JsonLogFormatter(logging.Formatter):
+    """Uma linha JSON por registro (campos de extra={...} incluídos)"""
+    
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'msg': record.getMessage()
+        }
+        entry.update(_log_extras(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exc'] = record.exc_text
+        return json_dumps(entry, default=str)
+
+class TextLogFormatter(logging.Formatter):
+    """Formato texto; campos de extra={...} vão no fim da linha como JSON"""
+    
+    def __init__(self):
+        super().__init__('[%(asctime)s] %(levelname)s in %(module)s: %(message)s')
+    
+    def format(self, record):
+        line = super().format(record)
+        extras = _log_extras(record)
+        return f"{line} {json_dumps(extras, default=str)}" if extras else line
+
+class _LogQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que mantém o traceback em exc_text (campo próprio no JSON) em vez de juntá-lo à mensagem"""
+    
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+_log_handler = None
+_log_listener = None
+
+def _start_log_listener():
+    global _log_listener
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonLogFormatter() if LOG_FORMAT == 'json' else TextLogFormatter())
+    _log_handler.queue = queue.SimpleQueue()
+    _log_listener = logging.handlers.QueueListener(_log_handler.queue, stream_handler)
+    _log_listener.start()
+
+def _stop_log_listener():
+    if _log_listener is not None and _log_listener._thread is not None:
+        _log_listener.stop()
+
+def configure_logging():
+    """Liga o logging da aplicação em um QueueHandler no logger raiz (chamado uma vez, no import)"""
+    global _log_handler
+    if _log_handler is not None:
+        return
+    _log_handler = _LogQueueHandler(queue.SimpleQueue())
+    root = logging.getLogger()
+    root.addHandler(_log_handler)
+    root.setLevel(LOG_LEVEL)
+    _start_log_listener()
+    # A thread do listener não sobrevive ao fork (workers do Gunicorn): cada processo inicia a sua
+    os.register_at_fork(after_in_child=_start_log_listener)
+    atexit.register(_stop_log_listener)
+
+def log_payload(message, payload, **fields):
+    """Registra um payload em nível DEBUG, com PII mascarada; sem custo algum fora do DEBUG"""
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug(message, extra={'payload': redact_pii(payload), **fields})
+
+configure_logging()
+
 app = Flask(__name__, static_folder='static')
+app.json = FastJSONProvider(app)
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'chave_padrao_insegura')
 CORS(app)
 
@@ -33,13 +233,15 @@ if database_url:
     # Converter postgres:// para postgresql:// se necessário (Supabase usa postgres://)
     if database_url.startswith('postgres://'):
         database_url = database_url.replace('postgres://', 'postgresql://', 1)
-        print("✅ Usando Supabase PostgreSQL")
+        app.logger.info("✅ Usando Supabase PostgreSQL")
     elif database_url.startswith('postgresql://'):
-        print("✅ Usando PostgreSQL")
+        app.logger.info("✅ Usando PostgreSQL")
+    elif database_url.startswith('sqlite:///'):
+        # Arquivo SQLite local (desenvolvimento e benchmarks; ver benchmarks/run_local.sh)
+        app.logger.info("✅ Usando SQLite em arquivo")
     else:
-        print(f"⚠️  DATABASE_URL inválido: {database_url}")
+        app.logger.warning("⚠️  DATABASE_URL inválido, fallback para SQLite em memória")
         database_url = 'sqlite:///:memory:'
-        print("   Fallback para SQLite em memória")
         
     # Se tiver Supabase configurado mas falhar conexão, usar API REST
     if 'supabase.co' in database_url and SUPABASE_AVAILABLE:
@@ -47,11 +249,11 @@ if database_url:
         supabase_key = os.getenv('SUPABASE_KEY')
         if supabase_url and supabase_key:
             use_supabase_api = True
-            print("🔄 Preparando fallback para Supabase REST API")
+            app.logger.info("🔄 Preparando fallback para Supabase REST API")
 else:
     # Fallback para SQLite em memória se não houver DATABASE_URL
     database_url = 'sqlite:///:memory:'
-    print("⚠️  DATABASE_URL não configurado, usando SQLite em memória")
+    app.logger.warning("⚠️  DATABASE_URL não configurado, usando SQLite em memória")
 
 app.config['SQLALCHEMY_DATABASE_URI'] = database_url
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
@@ -78,111 +280,1736 @@ if SUPABASE_AVAILABLE:
     if supabase_url and supabase_key:
         try:
             supabase_client = create_client(supabase_url, supabase_key)
-            print("✅ Cliente Supabase inicializado")
+            app.logger.info("✅ Cliente Supabase inicializado")
         except Exception as e:
-            print(f"⚠️  Erro ao inicializar Supabase: {e}")
+            app.logger.warning(f"⚠️  Erro ao inicializar Supabase: {e}")
     else:
-        print("⚠️  SUPABASE_URL ou SUPABASE_KEY não configurados")
+        app.logger.warning("⚠️  SUPABASE_URL ou SUPABASE_KEY não configurados")
+
+# Métricas (formato texto do Prometheus em /metrics)
+# Cada processo mantém contadores em memória (custo de um lock por observação) e grava um
+# snapshot em METRICS_DIR a cada METRICS_SNAPSHOT_INTERVAL segundos; /metrics soma os snapshots
+# de todos os processos (workers do Gunicorn e dispatcher) da máquina.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics'))
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv('METRICS_SNAPSHOT_INTERVAL', 5))
+METRICS_DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames, labels, extra=None):
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    kind = None
+    
+    def __init__(self, registry, name, help_text, labelnames=(), collect=None, per_process=True):
+        self.registry = registry
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.collect = collect  # função que devolve {labels: valor} no momento da coleta
+        self.per_process = per_process  # False: calculada só pelo processo que responde /metrics
+        self._values = {}
+        self._lock = threading.Lock()
+        self._baseline = {}
+    
+    def _reset(self):
+        self._values = {}
+        self._lock = threading.Lock()
+        if self.kind == 'counter' and self.collect is not None and self.per_process:
+            # Contadores lidos de objetos herdados do processo pai: contar só o que vier depois do fork
+            self._baseline = {tuple(labels): value for labels, value in self.collect().items()}
+    
+    def snapshot(self):
+        if self.collect is not None:
+            return {
+                tuple(labels): value - self._baseline.get(tuple(labels), 0)
+                for labels, value in self.collect().items()
+            }
+        with self._lock:
+            return {labels: list(value) if isinstance(value, list) else value for labels, value in self._values.items()}
+
+class CounterMetric(_Metric):
+    kind = 'counter'
+    
+    def inc(self, *labels, amount=1):
+        self.registry.ensure_started()
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def render(self, values):
+        for labels, value in sorted(values.items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+class GaugeMetric(CounterMetric):
+    kind = 'gauge'
+    
+    def set(self, *labels, value):
+        self.registry.ensure_started()
+        with self._lock:
+            self._values[labels] = value
+
+class HistogramMetric(_Metric):
+    kind = 'histogram'
+    
+    def __init__(self, registry, name, help_text, labelnames=(), buckets=METRICS_DEFAULT_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+    
+    def observe(self, value, *labels):
+        # Contagem por faixa (não acumulada) + faixa +Inf + soma; acumulado só na renderização
+        index = bisect.bisect_left(self.buckets, value)
+        self.registry.ensure_started()
+        with self._lock:
+            counts = self._values.get(labels)
+            if counts is None:
+                counts = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+    
+    def time(self, *labels):
+        return _MetricTimer(self, labels)
+    
+    def render(self, values):
+        for labels, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {counts[-1]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+class _MetricTimer:
+    __slots__ = ('histogram', 'labels', 'started')
+    
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+class MetricsRegistry:
+    """Registro de métricas do processo, com snapshots em disco para somar entre processos"""
+    
+    def __init__(self, directory=METRICS_DIR, interval=METRICS_SNAPSHOT_INTERVAL, enabled=METRICS_ENABLED):
+        self.directory = directory
+        self.interval = interval
+        self.enabled = enabled
+        self._metrics = []
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._path = None
+        os.register_at_fork(after_in_child=self._after_fork)
+    
+    def counter(self, name, help_text, labelnames=(), **kwargs):
+        return self._register(CounterMetric(self, name, help_text, labelnames, **kwargs))
+    
+    def gauge(self, name, help_text, labelnames=(), **kwargs):
+        return self._register(GaugeMetric(self, name, help_text, labelnames, **kwargs))
+    
+    def histogram(self, name, help_text, labelnames=(), **kwargs):
+        return self._register(HistogramMetric(self, name, help_text, labelnames, **kwargs))
+    
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+    
+    def _after_fork(self):
+        # O processo filho começa do zero (o que o master contou já está no snapshot dele)
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._path = None
+        for metric in self._metrics:
+            metric._reset()
+    
+    def ensure_started(self):
+        if self._started or not self.enabled:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            self._path = os.path.join(self.directory, f"metrics-{os.getpid()}-{secrets.token_hex(4)}.json")
+            threading.Thread(target=self._run, name='metrics-snapshot', daemon=True).start()
+            atexit.register(self.persist)
+            self._started = True
+    
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.persist()
+            except Exception as e:
+                app.logger.error(f"Erro ao gravar snapshot de métricas: {e}")
+    
+    def snapshot(self, per_process=True):
+        return {
+            metric.name: {json_dumps(list(labels)): value for labels, value in metric.snapshot().items()}
+            for metric in self._metrics if metric.per_process == per_process
+        }
+    
+    def persist(self):
+        """Grava o snapshot deste processo (substituição atômica do arquivo)"""
+        if self._path is None:
+            return
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as handle:
+            json.dump({'pid': os.getpid(), 'metrics': self.snapshot()}, handle)
+        os.replace(tmp_path, self._path)
+    
+    @staticmethod
+    def _pid_alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+    
+    def _merge(self, total, snapshot, include_gauges=True):
+        kinds = {metric.name: metric.kind for metric in self._metrics}
+        for name, values in snapshot.items():
+            if kinds.get(name) is None or (kinds[name] == 'gauge' and not include_gauges):
+                continue
+            target = total.setdefault(name, {})
+            for labels, value in values.items():
+                if isinstance(value, list):
+                    current = target.get(labels)
+                    target[labels] = [a + b for a, b in zip(current, value)] if current else list(value)
+                else:
+                    target[labels] = target.get(labels, 0) + value
+    
+    def _fold_dead_processes(self):
+        """Soma os snapshots de processos encerrados em archive.json (gauges são descartados)"""
+        archive_path = os.path.join(self.directory, 'archive.json')
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with open(archive_path, encoding='utf-8') as handle:
+                    archive = json.load(handle)
+            except (FileNotFoundError, ValueError):
+                archive = {}
+            dead = []
+            for name in os.listdir(self.directory):
+                if not (name.startswith('metrics-') and name.endswith('.json')):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    with open(path, encoding='utf-8') as handle:
+                        data = json.load(handle)
+                except (FileNotFoundError, ValueError):
+                    continue
+                if not self._pid_alive(data['pid']):
+                    self._merge(archive, data['metrics'], include_gauges=False)
+                    dead.append(path)
+            if dead:
+                tmp_path = f"{archive_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as handle:
+                    json.dump(archive, handle)
+                os.replace(tmp_path, archive_path)
+                for path in dead:
+                    os.remove(path)
+    
+    def collect(self):
+        """Valores somados de todos os processos: {nome: {labels: valor}}"""
+        total = {}
+        self._merge(total, self.snapshot())
+        if self.enabled and os.path.isdir(self.directory):
+            self._fold_dead_processes()
+            for name in os.listdir(self.directory):
+                path = os.path.join(self.directory, name)
+                if path == self._path or not name.endswith('.json'):
+                    continue
+                try:
+                    with open(path, encoding='utf-8') as handle:
+                        data = json.load(handle)
+                except (FileNotFoundError, ValueError):
+                    continue
+                self._merge(total, data.get('metrics', data))
+        self._merge(total, self.snapshot(per_process=False))
+        return total
+    
+    def render(self):
+        total = self.collect()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.help_text}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            values = {tuple(json_loads(labels)): value for labels, value in total.get(metric.name, {}).items()}
+            lines.extend(metric.render(values))
+        return '\n'.join(lines) + '\n'
+    
+    def clear_directory(self):
+        """Apaga os snapshots antigos (início do serviço: os contadores recomeçam do zero)"""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith('.json') or name.endswith('.tmp'):
+                os.remove(os.path.join(self.directory, name))
+
+metrics = MetricsRegistry()
+STAGE_SECONDS = metrics.histogram(
+    'tiktoktracking_stage_seconds',
+    'Duração de cada etapa do processamento (webhook, outbox e gravação de logs)',
+    ('stage',)
+)
+WEBHOOK_SECONDS = metrics.histogram(
+    'tiktoktracking_webhook_seconds',
+    'Duração total do webhook do Stripe por status HTTP',
+    ('status',)
+)
+TIKTOK_RESPONSES = metrics.counter(
+    'tiktoktracking_tiktok_responses_total',
+    'Respostas da API do TikTok por status HTTP, code e classificação',
+    ('http_status', 'code', 'kind')
+)
+TIKTOK_EVENTS = metrics.counter(
+    'tiktoktracking_tiktok_events_total',
+    'Eventos enviados ao TikTok por resultado',
+    ('result',)
+)
+
+# Modelo do Pixel
+class TikTokPixel(db.Model):
+    __tablename__ = 'tiktok_pixels'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    id_gestor = db.Column(db.String(50), unique=True, nullable=False)
+    pixel_id = db.Column(db.String(100), nullable=False)
+    access_token = db.Column(db.Text, nullable=False)
+    nome_pixel = db.Column(db.String(200))
+    advertiser_id = db.Column(db.String(50))  # conta de anúncios do pixel (verificação via /pixel/list/)
+    chave_seguranca = db.Column(db.String(64), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    ativo = db.Column(db.Boolean, default=True)
+    
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if not self.chave_seguranca:
+            self.chave_seguranca = secrets.token_hex(32)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'id_gestor': self.id_gestor,
+            'pixel_id': self.pixel_id,
+            'nome_pixel': self.nome_pixel,
+            'advertiser_id': self.advertiser_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'ativo': self.ativo
+        }
+
+# Modelo de Log de Eventos
+class EventLog(db.Model):
+    __tablename__ = 'event_logs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    pixel_id = db.Column(db.String(100), nullable=False)
+    stripe_event_id = db.Column(db.String(100), nullable=False)
+    stripe_event_type = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False)  # success, error
+    error_message = db.Column(db.Text)
+    tiktok_response = db.Column(db.Text)  # legado: logs gravados antes de tiktok_response_bodies
+    response_hash = db.Column(db.String(64))  # corpo da resposta em tiktok_response_bodies
+    tiktok_request_id = db.Column(db.String(100))  # request_id da resposta (fica fora do corpo)
+    event_payload = db.Column(db.Text)  # evento enviado ao TikTok (JSON, PII com hash), usado no replay
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    response_body = db.relationship(
+        'TikTokResponseBody',
+        primaryjoin='foreign(EventLog.response_hash) == TikTokResponseBody.hash',
+        viewonly=True,
+        lazy='select'
+    )
+    
+    __table_args__ = (
+        db.Index('uq_event_logs_stripe_event_pixel', 'stripe_event_id', 'pixel_id', unique=True),
+        db.Index('idx_event_logs_pixel_created_id', 'pixel_id', 'created_at', 'id'),
+    )
+    
+    # Campos padrão de to_dict(); tiktok_response e event_payload só quando pedidos explicitamente
+    DEFAULT_FIELDS = ('id', 'pixel_id', 'stripe_event_id', 'stripe_event_type', 'status', 'error_message', 'created_at')
+    FIELDS = DEFAULT_FIELDS + ('tiktok_response', 'event_payload')
+    # Colunas necessárias para cada campo de to_dict() (usado com load_only)
+    FIELD_COLUMNS = {'tiktok_response': ('tiktok_response', 'response_hash', 'tiktok_request_id')}
+    
+    def get_tiktok_response(self):
+        """Resposta do TikTok; o corpo só é carregado e descomprimido aqui"""
+        if self.response_hash:
+            if self.response_body is None:
+                return None
+            return _merge_tiktok_request_id(self.response_body.load(), self.tiktok_request_id)
+        return json_loads(self.tiktok_response) if self.tiktok_response else None
+    
+    def to_dict(self, fields=None):
+        data = {}
+        for field in fields or self.DEFAULT_FIELDS:
+            if field == 'created_at':
+                data['created_at'] = self.created_at.isoformat() if self.created_at else None
+            elif field == 'tiktok_response':
+                data['tiktok_response'] = self.get_tiktok_response()
+            elif field == 'event_payload':
+                data['event_payload'] = json_loads(self.event_payload) if self.event_payload else None
+            else:
+                data[field] = getattr(self, field)
+        return data
+
+# Corpos de resposta do TikTok, armazenados uma única vez por conteúdo (hash) e comprimidos
+TIKTOK_RESPONSE_COMPRESSION = os.getenv('TIKTOK_RESPONSE_COMPRESSION', 'zstd' if ZSTD_AVAILABLE else 'zlib')
+TIKTOK_RESPONSE_MIN_COMPRESS_BYTES = int(os.getenv('TIKTOK_RESPONSE_MIN_COMPRESS_BYTES', 128))
+RESPONSE_BODY_CACHE_SIZE = int(os.getenv('RESPONSE_BODY_CACHE_SIZE', 10000))
+
+class TikTokResponseBody(db.Model):
+    __tablename__ = 'tiktok_response_bodies'
+    
+    hash = db.Column(db.String(64), primary_key=True)  # sha256 do JSON canônico
+    encoding = db.Column(db.String(10), nullable=False)  # raw, zlib, zstd
+    body = db.Column(db.LargeBinary, nullable=False)
+    size = db.Column(db.Integer, nullable=False)  # tamanho sem compressão
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def load(self):
+        # O texto descomprimido fica na instância: logs com o mesmo corpo compartilham a instância na sessão
+        if getattr(self, '_text', None) is None:
+            self._text = _decompress_response_body(self.encoding, self.body).decode('utf-8')
+        return json_loads(self._text)
+
+def _compress_response_body(raw):
+    """(encoding, dados) para um corpo em bytes; corpos pequenos ficam sem compressão"""
+    if len(raw) < TIKTOK_RESPONSE_MIN_COMPRESS_BYTES or TIKTOK_RESPONSE_COMPRESSION == 'none':
+        return 'raw', raw
+    if TIKTOK_RESPONSE_COMPRESSION == 'zstd' and ZSTD_AVAILABLE:
+        return 'zstd', zstandard.ZstdCompressor(level=3).compress(raw)
+    return 'zlib', zlib.compress(raw, 6)
+
+def _decompress_response_body(encoding, data):
+    data = bytes(data)
+    if encoding == 'raw':
+        return data
+    if encoding == 'zlib':
+        return zlib.decompress(data)
+    if encoding == 'zstd':
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError('Corpo comprimido com zstd, mas o pacote zstandard não está instalado')
+        return zstandard.ZstdDecompressor().decompress(data)
+    raise ValueError(f"Encoding desconhecido: {encoding}")
+
+def _split_tiktok_response(response):
+    """Separa o request_id (único por chamada) do corpo, para que respostas iguais tenham o mesmo hash.
+    
+    Retorna (JSON canônico do corpo, request_id).
+    """
+    request_id = None
+    if isinstance(response, dict) and 'request_id' in response:
+        response = dict(response)
+        request_id = response.pop('request_id')
+        request_id = str(request_id) if request_id is not None else None
+    return json_dumps(response, sort_keys=True), request_id
+
+def _merge_tiktok_request_id(response, request_id):
+    if request_id is not None and isinstance(response, dict):
+        response['request_id'] = request_id
+    return response
+
+# Modelo da fila de saída (outbox) de eventos para o TikTok
+class OutboxEvent(db.Model):
+    __tablename__ = 'event_outbox'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    stripe_event_id = db.Column(db.String(100), nullable=False)
+    stripe_event_type = db.Column(db.String(50), nullable=False)
+    id_gestor = db.Column(db.String(50), nullable=False)
+    pixel_id = db.Column(db.String(100), nullable=False)
+    event_data = db.Column(db.Text, nullable=False)  # JSON com os dados extraídos do Stripe
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, processing, done, dead
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    locked_by = db.Column(db.String(100))
+    locked_until = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('idx_event_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+        db.Index('uq_event_outbox_stripe_event_gestor', 'stripe_event_id', 'id_gestor', unique=True),
+    )
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'stripe_event_id': self.stripe_event_id,
+            'stripe_event_type': self.stripe_event_type,
+            'id_gestor': self.id_gestor,
+            'pixel_id': self.pixel_id,
+            'status': self.status,
+            'attempts': self.attempts,
+            'next_attempt_at': self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            'last_error': self.last_error,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+
+def _dialect_insert(model):
+    """insert() do dialeto em uso, com suporte a ON CONFLICT (PostgreSQL ou SQLite)"""
+    if db.engine.dialect.name == 'postgresql':
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+def intern_response_bodies(rows):
+    """Troca o `response_body` de cada linha por `response_hash`, gravando em
+    tiktok_response_bodies só os corpos que ainda não existem.
+    
+    Retorna os hashes gravados/conferidos, que o chamador marca como conhecidos após o commit.
+    """
+    pending = {}
+    for row in rows:
+        body = row.pop('response_body', None)
+        if body is None:
+            row['response_hash'] = None
+            continue
+        digest = hashlib.sha256(body.encode('utf-8')).hexdigest()
+        row['response_hash'] = digest
+        if not known_response_hashes.seen(digest):
+            pending[digest] = body
+    
+    if not pending:
+        return set()
+    existing = {
+        digest for (digest,) in
+        db.session.query(TikTokResponseBody.hash).filter(TikTokResponseBody.hash.in_(list(pending)))
+    }
+    new_bodies = []
+    for digest, body in pending.items():
+        if digest in existing:
+            continue
+        raw = body.encode('utf-8')
+        encoding, data = _compress_response_body(raw)
+        new_bodies.append({'hash': digest, 'encoding': encoding, 'body': data, 'size': len(raw), 'created_at': datetime.utcnow()})
+    if new_bodies:
+        db.session.execute(_dialect_insert(TikTokResponseBody).values(new_bodies).on_conflict_do_nothing())
+    return set(pending)
+
+def upsert_event_logs(rows):
+    """Grava logs de eventos; um mesmo evento Stripe tem um único log por pixel.
+    
+    Logs já existentes são atualizados pela chave (stripe_event_id, pixel_id, created_at),
+    o que também funciona com event_logs particionada por created_at (onde não há índice
+    único global). Também atualiza os rollups de event_stats e grava os corpos de resposta
+    em tiktok_response_bodies; retorna os hashes desses corpos (ver intern_response_bodies).
+    
+    Os rollups só contam o que o banco de fato gravou: inserções descartadas pelo ON CONFLICT
+    e atualizações cujo status mudou desde a leitura (escrita concorrente) não geram variação.
+    """
+    if not rows:
+        return set()
+    rows = list({(r['stripe_event_id'], r['pixel_id']): dict(r) for r in rows}.values())
+    interned = intern_response_bodies(rows)
+    
+    keys = [(r['stripe_event_id'], r['pixel_id']) for r in rows]
+    if db.engine.dialect.name == 'postgresql':
+        # Serializa por pixel até o commit (dispatcher, replay e outras máquinas): a leitura abaixo
+        # continua válida até a escrita e, com event_logs particionada (sem índice único global em
+        # (stripe_event_id, pixel_id)), dois workers não inserem o mesmo log em partições diferentes
+        for pixel_id in sorted({r['pixel_id'] for r in rows}):
+            db.session.execute(
+                text("SELECT pg_advisory_xact_lock(hashtext('event_logs:' || :pixel_id))"),
+                {'pixel_id': pixel_id}
+            )
+    existing = {
+        (stripe_event_id, pixel_id): (status, created_at)
+        for stripe_event_id, pixel_id, status, created_at in (
+            db.session.query(EventLog.stripe_event_id, EventLog.pixel_id, EventLog.status, EventLog.created_at)
+            .filter(tuple_(EventLog.stripe_event_id, EventLog.pixel_id).in_(keys))
+        )
+    }
+    
+    inserts = []
+    updates = []
+    transitions = []
+    for row in rows:
+        previous = existing.get((row['stripe_event_id'], row['pixel_id']))
+        if previous is None:
+            inserts.append(row)
+            continue
+        
+        # created_at não muda na atualização: a contagem muda de status dentro do bucket original
+        update = {
+            'b_stripe_event_id': row['stripe_event_id'],
+            'b_pixel_id': row['pixel_id'],
+            'b_created_at': previous[1],
+            'b_status': previous[0],
+            'stripe_event_type': row['stripe_event_type'],
+            'status': row['status'],
+            'error_message': row['error_message'],
+            'response_hash': row['response_hash'],
+            'tiktok_request_id': row['tiktok_request_id'],
+            'event_payload': row.get('event_payload')
+        }
+        (updates if previous[0] == row['status'] else transitions).append(update)
+    
+    deltas = Counter()
+    if inserts:
+        inserted = db.session.execute(
+            _dialect_insert(EventLog).values(inserts).on_conflict_do_nothing()
+            .returning(EventLog.pixel_id, EventLog.status, EventLog.created_at)
+        )
+        for pixel_id, status, created_at in inserted:
+            deltas[(pixel_id, status, created_at)] += 1
+    
+    table = EventLog.__table__
+    update_stmt = (
+        table.update()
+        .where(table.c.stripe_event_id == bindparam('b_stripe_event_id'))
+        .where(table.c.pixel_id == bindparam('b_pixel_id'))
+        .where(table.c.created_at == bindparam('b_created_at'))
+        .where(table.c.status == bindparam('b_status'))
+        .values(
+            stripe_event_type=bindparam('stripe_event_type'),
+            status=bindparam('status'),
+            error_message=bindparam('error_message'),
+            response_hash=bindparam('response_hash'),
+            tiktok_request_id=bindparam('tiktok_request_id'),
+            tiktok_response=None,
+            # Resultado sem evento montado (ex.: pixel removido) não apaga o payload já gravado
+            event_payload=func.coalesce(bindparam('event_payload'), table.c.event_payload)
+        )
+    )
+    if updates:
+        # Mesmo status: os rollups não mudam, então vai em um executemany sem RETURNING
+        db.session.execute(update_stmt, updates)
+    # Mudança de status (ex.: reenvio que deu certo) é rara: uma a uma, contando só as aplicadas
+    for update in transitions:
+        if db.session.execute(update_stmt.returning(table.c.pixel_id), update).first() is None:
+            continue
+        deltas[(update['b_pixel_id'], update['b_status'], update['b_created_at'])] -= 1
+        deltas[(update['b_pixel_id'], update['status'], update['b_created_at'])] += 1
+    bump_event_stats(deltas)
+    return interned
+
+def _event_log_row(pixel_id, stripe_event_id, stripe_event_type, result, event=None):
+    """Linha de event_logs a partir do resultado do envio ao TikTok (e do evento enviado)"""
+    response_body, request_id = _split_tiktok_response(result.get('tiktok_response', {}))
+    return {
+        'pixel_id': pixel_id,
+        'stripe_event_id': stripe_event_id,
+        'stripe_event_type': stripe_event_type,
+        'status': 'success' if result['success'] else 'error',
+        'error_message': result.get('error'),
+        'response_body': response_body,
+        'tiktok_request_id': request_id,
+        'event_payload': json_dumps(event) if event is not None else None,
+        'created_at': datetime.utcnow()
+    }
+
+# Contadores agregados de eventos (rollups) por pixel, status e período
+class EventStat(db.Model):
+    __tablename__ = 'event_stats'
+    
+    pixel_id = db.Column(db.String(100), primary_key=True)
+    granularity = db.Column(db.String(10), primary_key=True)  # all, day, hour
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    count = db.Column(db.BigInteger, nullable=False, default=0)
+
+# Início do bucket "all" (contador acumulado de todo o período)
+STATS_ALL_BUCKET = datetime(1970, 1, 1)
+
+def _stat_buckets(created_at):
+    """Buckets de event_stats em que um evento criado em created_at é contado"""
+    return (
+        ('all', STATS_ALL_BUCKET),
+        ('day', created_at.replace(hour=0, minute=0, second=0, microsecond=0)),
+        ('hour', created_at.replace(minute=0, second=0, microsecond=0))
+    )
+
+def bump_event_stats(deltas):
+    """Aplica variações {(pixel_id, status, created_at): n} nos rollups (o commit fica a cargo de quem chama).
+    
+    No PostgreSQL o INSERT ... ON CONFLICT espera o fim de um rebuild_event_stats em andamento
+    (a trava EXCLUSIVE de _lock_event_stats barra escritas na tabela).
+    """
+    counts = Counter()
+    for (pixel_id, status, created_at), n in deltas.items():
+        if not n:
+            continue
+        for granularity, bucket_start in _stat_buckets(created_at or datetime.utcnow()):
+            counts[(pixel_id, granularity, bucket_start, status)] += n
+    
+    rows = [
+        {'pixel_id': k[0], 'granularity': k[1], 'bucket_start': k[2], 'status': k[3], 'count': n}
+        for k, n in sorted(counts.items()) if n
+    ]
+    if not rows:
+        return
+    
+    stmt = _dialect_insert(EventStat).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['pixel_id', 'granularity', 'bucket_start', 'status'],
+        set_={'count': EventStat.count + stmt.excluded.count}
+    )
+    db.session.execute(stmt)
+
+def _lock_event_stats():
+    # Trava event_stats contra escritas até o commit (no SQLite a transação de escrita já é exclusiva)
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text("LOCK TABLE event_stats IN EXCLUSIVE MODE"))
+
+def rebuild_event_stats():
+    """Recalcula event_stats a partir de event_logs (carga inicial ou correção).
+    
+    Pode rodar com tráfego: a tabela fica travada até o commit, então gravações de logs que
+    chegam durante o recálculo aplicam sua variação depois dele, sem perda nem contagem dupla.
+    """
+    _lock_event_stats()
+    EventStat.query.delete(synchronize_session=False)
+    
+    deltas = Counter()
+    query = (
+        db.session.query(EventLog.pixel_id, EventLog.status, EventLog.created_at)
+        .execution_options(yield_per=5000)
+    )
+    for pixel_id, status, created_at in query:
+        deltas[(pixel_id, status, created_at.replace(minute=0, second=0, microsecond=0))] += 1
+        if len(deltas) >= 5000:
+            bump_event_stats(deltas)
+            deltas.clear()
+    bump_event_stats(deltas)
+    db.session.commit()
+
+def seed_event_stats():
+    """Carga inicial de event_stats quando ela está vazia e já há logs (bancos anteriores aos rollups)"""
+    if db.session.query(EventStat.pixel_id).first() is not None or db.session.query(EventLog.id).first() is None:
+        return False
+    _lock_event_stats()
+    # Outro processo (ex.: outro worker na inicialização) pode ter feito a carga enquanto esperávamos
+    if db.session.query(EventStat.pixel_id).first() is not None:
+        db.session.commit()
+        return False
+    rebuild_event_stats()
+    return True
+
+# Gravação em lote dos logs de eventos (fora do caminho crítico das requisições)
+EVENT_LOG_BUFFER_SIZE = int(os.getenv('EVENT_LOG_BUFFER_SIZE', 200))
+EVENT_LOG_FLUSH_INTERVAL = float(os.getenv('EVENT_LOG_FLUSH_INTERVAL', 1))
+EVENT_LOG_INSERT_CHUNK = int(os.getenv('EVENT_LOG_INSERT_CHUNK', 500))
+EVENT_LOG_WAL_DIR = os.getenv('EVENT_LOG_WAL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'wal'))
+EVENT_LOG_WAL_FSYNC = os.getenv('EVENT_LOG_WAL_FSYNC', 'false').lower() == 'true'
+
+class EventLogWriter:
+    """Acumula linhas de event_logs e grava em INSERTs multi-linha por tamanho ou tempo.
+    
+    Cada linha vai antes para um arquivo WAL local (JSON lines) travado com flock
+    enquanto o processo vive. Na inicialização, segmentos sem dono (processo que
+    morreu) são regravados no banco; no encerramento o buffer é gravado de forma
+    síncrona.
+    """
+    
+    def __init__(self, wal_dir=EVENT_LOG_WAL_DIR, buffer_size=EVENT_LOG_BUFFER_SIZE,
+                 flush_interval=EVENT_LOG_FLUSH_INTERVAL):
+        self.wal_dir = wal_dir
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._segment = None
+        self._flushed_segments = []  # segmentos cujas linhas já estão no buffer atual
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.flushed_rows = 0
+        self.failed_flushes = 0
+    
+    def _open_segment(self):
+        """Cria o próximo segmento já travado.
+        
+        O arquivo nasce com nome temporário (*.wal.new, O_EXCL) e só vira *.wal depois do flock:
+        a recuperação de outro processo nunca encontra um segmento vivo ainda sem trava.
+        """
+        self._sequence += 1
+        path = os.path.join(self.wal_dir, f"eventlog-{os.getpid()}-{self._sequence}.wal")
+        tmp_path = path + '.new'
+        handle = open(tmp_path, 'x', encoding='utf-8')
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.rename(tmp_path, path)
+        except OSError:
+            handle.close()
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        handle.wal_path = path
+        return handle
+    
+    def _close_segment(self, handle, delete=True):
+        path = getattr(handle, 'wal_path', handle.name)
+        handle.close()
+        if delete:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+    
+    @staticmethod
+    def _decode_row(line):
+        row = json_loads(line)
+        if row.get('created_at'):
+            row['created_at'] = datetime.fromisoformat(row['created_at'])
+        if 'tiktok_response' in row:
+            # Segmento gravado antes de tiktok_response_bodies
+            legacy = row.pop('tiktok_response')
+            row['response_body'], row['tiktok_request_id'] = _split_tiktok_response(json_loads(legacy) if legacy else {})
+        row.setdefault('event_payload', None)
+        return row
+    
+    @staticmethod
+    def _segment_pid_alive(name):
+        try:
+            pid = int(name.split('-')[1])
+            os.kill(pid, 0)
+        except (IndexError, ValueError, ProcessLookupError):
+            return False
+        except PermissionError:
+            return True
+        return True
+    
+    def _recover_orphan_segments(self):
+        """Regrava no banco os segmentos WAL de processos que não estão mais vivos"""
+        for name in sorted(os.listdir(self.wal_dir)):
+            if name.endswith('.wal.new'):
+                # Segmento que nunca chegou a ser travado (processo morreu ao criá-lo): está vazio
+                if not self._segment_pid_alive(name):
+                    try:
+                        os.remove(os.path.join(self.wal_dir, name))
+                    except FileNotFoundError:
+                        pass
+                continue
+            if not name.endswith('.wal'):
+                continue
+            path = os.path.join(self.wal_dir, name)
+            try:
+                handle = open(path, 'r+', encoding='utf-8')
+            except FileNotFoundError:
+                continue
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                handle.close()  # segmento de um processo vivo
+                continue
+            
+            rows = []
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    rows.append(self._decode_row(line))
+                except ValueError:
+                    pass  # última linha incompleta (processo morreu no meio da escrita)
+            
+            if rows:
+                self._write_rows(rows)
+                app.logger.warning(f"♻️  {len(rows)} logs recuperados do WAL {name}")
+            self._close_segment(handle)
+    
+    def _ensure_started(self):
+        # Após um fork o processo filho precisa do próprio WAL e da própria thread
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            os.makedirs(self.wal_dir, exist_ok=True)
+            self._buffer = []
+            self._flushed_segments = []
+            self._stopped.clear()
+            with app.app_context():
+                try:
+                    self._recover_orphan_segments()
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Erro ao recuperar WAL de logs: {e}")
+            self._segment = self._open_segment()
+            self._thread = threading.Thread(target=self._run, name='event-log-writer', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+    
+    def write_many(self, rows):
+        """Registra linhas de event_logs (dicts de _event_log_row) para gravação em lote"""
+        if not rows:
+            return
+        self._ensure_started()
+        lines = ''.join(json_dumps(row, default=str) + '\n' for row in rows)
+        with self._lock:
+            self._segment.write(lines)
+            self._segment.flush()
+            if EVENT_LOG_WAL_FSYNC:
+                os.fsync(self._segment.fileno())
+            self._buffer.extend(rows)
+            full = len(self._buffer) >= self.buffer_size
+        if full:
+            self._wakeup.set()
+    
+    def write(self, row):
+        self.write_many([row])
+    
+    def _write_rows(self, rows):
+        interned = set()
+        for start in range(0, len(rows), EVENT_LOG_INSERT_CHUNK):
+            interned |= upsert_event_logs(rows[start:start + EVENT_LOG_INSERT_CHUNK])
+        db.session.commit()
+        # Só depois do commit: um hash marcado como conhecido não é mais conferido no banco
+        for digest in interned:
+            known_response_hashes.add(digest)
+    
+    def flush(self):
+        """Grava o buffer no banco. Retorna a quantidade de linhas gravadas"""
+        if self._pid != os.getpid():
+            return 0
+        with self._flush_lock:
+            with self._lock:
+                if not self._buffer:
+                    return 0
+                # Novo segmento para o que chegar durante a gravação, aberto antes de trocar o
+                # buffer: se falhar (EMFILE, ENOSPC...), linhas e segmentos ficam como estão
+                try:
+                    segment = self._open_segment()
+                except OSError as e:
+                    self.failed_flushes += 1
+                    app.logger.error(f"Erro ao abrir novo segmento do WAL de logs (nova tentativa em seguida): {e}")
+                    return 0
+                rows, self._buffer = self._buffer, []
+                previous = self._flushed_segments + [self._segment]
+                self._flushed_segments = []
+                self._segment = segment
+            
+            try:
+                with app.app_context(), STAGE_SECONDS.time('log_flush'):
+                    try:
+                        self._write_rows(rows)
+                    except Exception:
+                        db.session.rollback()
+                        raise
+            except Exception as e:
+                self.failed_flushes += 1
+                app.logger.error(f"Erro ao gravar {len(rows)} logs de eventos (nova tentativa em seguida): {e}")
+                with self._lock:
+                    self._buffer[:0] = rows
+                    self._flushed_segments = previous + self._flushed_segments
+                return 0
+            
+            for handle in previous:
+                self._close_segment(handle)
+            self.flushed_rows += len(rows)
+            return len(rows)
+    
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # A thread não pode morrer: sem ela o processo nunca mais grava os logs
+                app.logger.exception(f"Erro inesperado na gravação dos logs de eventos: {e}")
+    
+    def close(self):
+        """Para a thread e grava o que restar no buffer (chamado no encerramento)"""
+        if self._pid != os.getpid():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+        with self._lock:
+            if not self._buffer and self._segment is not None:
+                self._close_segment(self._segment)
+                self._segment = None
+                self._pid = None
+    
+    def stats(self):
+        return {
+            'buffered': len(self._buffer),
+            'flushed_rows': self.flushed_rows,
+            'failed_flushes': self.failed_flushes
+        }
+
+event_log_writer = EventLogWriter()
+atexit.register(event_log_writer.close)
+
+# Particionamento mensal de event_logs (somente PostgreSQL; ver partition_event_logs.sql)
+EVENT_LOG_PARTITION_MONTHS_AHEAD = int(os.getenv('EVENT_LOG_PARTITION_MONTHS_AHEAD', 2))
+EVENT_LOG_RETENTION_MONTHS = int(os.getenv('EVENT_LOG_RETENTION_MONTHS', 6))
+EVENT_LOG_ARCHIVE_DIR = os.getenv('EVENT_LOG_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'archive'))
+
+def _add_months(month_start, months):
+    month_index = month_start.month - 1 + months
+    return month_start.replace(year=month_start.year + month_index // 12, month=month_index % 12 + 1, day=1)
+
+def _event_log_partition_name(month_start):
+    return f"event_logs_y{month_start.year:04d}m{month_start.month:02d}"
+
+def event_logs_is_partitioned():
+    """Indica se event_logs é uma tabela particionada do PostgreSQL"""
+    if db.engine.dialect.name != 'postgresql':
+        return False
+    relkind = db.session.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass('event_logs')")
+    ).scalar()
+    return relkind == 'p'
+    if db.engine.dialect.name != 'postgresql':
+        _event_logs_partitioned = False
+        return False
+    relkind = db.session.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass('event_logs')")
+    ).scalar()
+    _event_logs_partitioned = relkind == 'p'
+    return _event_logs_partitioned
+
+EVENT_LOG_DEFAULT_PARTITION = 'event_logs_default'
+
+def _create_event_log_partition(name, start, end):
+    """Cria a partição [start, end) levando para ela as linhas que caíram na partição DEFAULT.
+    
+    Com linhas do período na DEFAULT o CREATE ... PARTITION OF falharia (a DEFAULT violaria a
+    nova restrição): ela é desanexada, a partição é criada, as linhas são movidas e a DEFAULT
+    volta a ser anexada, tudo na mesma transação.
+    """
+    bounds = {'start': start, 'end': end}
+    stranded = db.session.execute(
+        text("SELECT to_regclass(:name)"), {'name': EVENT_LOG_DEFAULT_PARTITION}
+    ).scalar() and db.session.execute(
+        text(
+            f"SELECT EXISTS (SELECT 1 FROM {EVENT_LOG_DEFAULT_PARTITION} "
+            f"WHERE created_at >= :start AND created_at < :end)"
+        ),
+        bounds
+    ).scalar()
+    if stranded:
+        db.session.execute(text(f"ALTER TABLE event_logs DETACH PARTITION {EVENT_LOG_DEFAULT_PARTITION}"))
+    db.session.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF event_logs "
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    ))
+    if not stranded:
+        return 0
+    
+    columns = ', '.join(column.name for column in EventLog.__table__.columns)
+    moved = db.session.execute(
+        text(
+            f"INSERT INTO event_logs ({columns}) SELECT {columns} FROM {EVENT_LOG_DEFAULT_PARTITION} "
+            f"WHERE created_at >= :start AND created_at < :end"
+        ),
+        bounds
+    ).rowcount
+    db.session.execute(
+        text(f"DELETE FROM {EVENT_LOG_DEFAULT_PARTITION} WHERE created_at >= :start AND created_at < :end"),
+        bounds
+    )
+    db.session.execute(text(f"ALTER TABLE event_logs ATTACH PARTITION {EVENT_LOG_DEFAULT_PARTITION} DEFAULT"))
+    app.logger.info(f"📦 {moved} logs movidos da partição {EVENT_LOG_DEFAULT_PARTITION} para {name}")
+    return moved
+
+def ensure_event_log_partitions(months_ahead=EVENT_LOG_PARTITION_MONTHS_AHEAD):
+    """Cria as partições mensais do mês atual e dos próximos `months_ahead` meses"""
+    if not event_logs_is_partitioned():
+        return []
+    
+    current = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    created = []
+    for offset in range(months_ahead + 1):
+        start = _add_months(current, offset)
+        name = _event_log_partition_name(start)
+        exists = db.session.execute(text("SELECT to_regclass(:name)"), {'name': name}).scalar()
+        if exists:
+            continue
+        _create_event_log_partition(name, start.date(), _add_months(start, 1).date())
+        created.append(name)
+    db.session.commit()
+    return created
+
+_partitions_checked_at = 0.0
+
+def maybe_ensure_event_log_partitions(interval=3600):
+    """Chamado periodicamente pelo dispatcher: garante as partições dos próximos meses"""
+    global _partitions_checked_at
+    if time.monotonic() - _partitions_checked_at < interval:
+        return
+    _partitions_checked_at = time.monotonic()
+    try:
+        ensure_event_log_partitions()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.error(f"Erro ao criar partições de event_logs: {e}")
+
+def list_event_log_partitions():
+    """Partições mensais de event_logs: [(nome, início do mês)], da mais antiga para a mais nova"""
+    names = db.session.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass('event_logs')"
+    )).scalars()
+    
+    partitions = []
+    for name in names:
+        try:
+            start = datetime.strptime(name, 'event_logs_y%Ym%m')
+        except ValueError:
+            continue  # partição DEFAULT ou criada manualmente
+        partitions.append((name, start))
+    return sorted(partitions, key=lambda p: p[1])
+
+def event_log_archive_path(name, archive_dir=EVENT_LOG_ARCHIVE_DIR):
+    return os.path.join(archive_dir, f"{name}.jsonl.gz")
+
+def archive_event_log_partition(name, archive_dir=EVENT_LOG_ARCHIVE_DIR):
+    """Exporta uma partição para <archive_dir>/<nome>.jsonl.gz sem carregá-la inteira na memória.
+    
+    Nunca sobrescreve um arquivo existente (FileExistsError): ele pode ser a única cópia completa.
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    path = event_log_archive_path(name, archive_dir)
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    tmp_path = path + '.tmp'
+    
+    # O arquivo leva a resposta completa (sem depender de tiktok_response_bodies)
+    rows = db.session.execute(
+        text(
+            f"SELECT l.*, b.encoding AS response_encoding, b.body AS response_data FROM {name} l "
+            f"LEFT JOIN tiktok_response_bodies b ON b.hash = l.response_hash ORDER BY l.created_at, l.id"
+        ).execution_options(yield_per=5000)
+    ).mappings()
+    count = 0
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as archive:
+        for row in rows:
+            row = dict(row)
+            encoding, data = row.pop('response_encoding'), row.pop('response_data')
+            request_id = row.pop('tiktok_request_id', None)
+            row.pop('response_hash', None)
+            if data is not None:
+                response = json_loads(_decompress_response_body(encoding, data))
+                row['tiktok_response'] = _merge_tiktok_request_id(response, request_id)
+            elif row.get('tiktok_response'):
+                row['tiktok_response'] = json_loads(row['tiktok_response'])
+            if row.get('event_payload'):
+                row['event_payload'] = json_loads(row['event_payload'])
+            archive.write(json_dumps(row, default=str) + '\n')
+            count += 1
+    # link() falha se o destino já existir (outra execução concorrente), ao contrário de replace()
+    try:
+        os.link(tmp_path, path)
+    finally:
+        os.unlink(tmp_path)
+    return path, count
+
+def apply_event_log_retention(retain_months=EVENT_LOG_RETENTION_MONTHS, mode='drop', archive_dir=EVENT_LOG_ARCHIVE_DIR):
+    """Arquiva as partições mais antigas que `retain_months` e depois as remove (mode='drop')
+    ou apenas descarta o tiktok_response delas (mode='compact')."""
+    if not event_logs_is_partitioned():
+        return []
+    
+    cutoff = _add_months(datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0), -retain_months)
+    uncompacted = "tiktok_response IS NOT NULL OR response_hash IS NOT NULL OR event_payload IS NOT NULL"
+    processed = []
+    for name, start in list_event_log_partitions():
+        if _add_months(start, 1) > cutoff:
+            break
+        
+        # Partição já compactada por uma execução anterior: nada a arquivar de novo
+        if mode == 'compact' and db.session.execute(text(f"SELECT 1 FROM {name} WHERE {uncompacted} LIMIT 1")).first() is None:
+            db.session.rollback()
+            continue
+        
+        # Arquivo de uma execução anterior (interrompida antes do DROP/UPDATE): é a cópia completa, reaproveitar
+        path = event_log_archive_path(name, archive_dir)
+        if os.path.exists(path):
+            count, archived = None, False
+        else:
+            path, count = archive_event_log_partition(name, archive_dir)
+            archived = True
+        if mode == 'compact':
+            db.session.execute(text(
+                f"UPDATE {name} SET tiktok_response = NULL, response_hash = NULL, tiktok_request_id = NULL, "
+                f"event_payload = NULL WHERE {uncompacted}"
+            ))
+            db.session.commit()
+            # VACUUM não roda dentro de transação
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(text(f"VACUUM {name}"))
+        else:
+            db.session.execute(text(f"ALTER TABLE event_logs DETACH PARTITION {name}"))
+            db.session.execute(text(f"DROP TABLE {name}"))
+            db.session.commit()
+        processed.append({'partition': name, 'rows': count, 'archive': path, 'archived': archived, 'mode': mode})
+    return processed
+
+def compact_legacy_tiktok_responses(batch_size=1000):
+    """Move o tiktok_response em texto dos logs antigos para tiktok_response_bodies, em lotes.
+    
+    Retorna a quantidade de logs convertidos.
+    """
+    table = EventLog.__table__
+    converted = 0
+    last_id = 0
+    while True:
+        batch = db.session.query(EventLog.id, EventLog.created_at, EventLog.tiktok_response).filter(
+            EventLog.tiktok_response.isnot(None),
+            EventLog.response_hash.is_(None),
+            EventLog.id > last_id
+        ).order_by(EventLog.id).limit(batch_size).all()
+        if not batch:
+            return converted
+        
+        rows = []
+        for log_id, created_at, legacy in batch:
+            try:
+                response = json_loads(legacy)
+            except ValueError:
+                response = {'raw': legacy}
+            body, request_id = _split_tiktok_response(response)
+            rows.append({'b_id': log_id, 'b_created_at': created_at, 'response_body': body, 'tiktok_request_id': request_id})
+        interned = intern_response_bodies(rows)
+        db.session.execute(
+            table.update()
+            .where(table.c.id == bindparam('b_id'))
+            .where(table.c.created_at == bindparam('b_created_at'))
+            .values(response_hash=bindparam('response_hash'), tiktok_request_id=bindparam('tiktok_request_id'), tiktok_response=None),
+            rows
+        )
+        db.session.commit()
+        for digest in interned:
+            known_response_hashes.add(digest)
+        converted += len(batch)
+        last_id = batch[-1][0]
+
+def purge_outbox(older_than_days):
+    """Remove da outbox os eventos concluídos há mais de `older_than_days` dias"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    deleted = OutboxEvent.query.filter(
+        OutboxEvent.status == 'done',
+        OutboxEvent.updated_at < cutoff
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+# IDs de eventos Stripe vistos recentemente (primeira barreira contra reenvios do Stripe)
+STRIPE_DEDUP_CACHE_SIZE = int(os.getenv('STRIPE_DEDUP_CACHE_SIZE', 50000))
+
+class RecentEventIds:
+    """Conjunto LRU limitado de IDs de eventos já enfileirados neste worker"""
+    
+    def __init__(self, max_size=STRIPE_DEDUP_CACHE_SIZE):
+        self.max_size = max_size
+        self._ids = OrderedDict()
+        self._lock = threading.Lock()
+        self.duplicates = 0
+        self.misses = 0
+    
+    def seen(self, event_id):
+        with self._lock:
+            if event_id in self._ids:
+                self._ids.move_to_end(event_id)
+                self.duplicates += 1
+                return True
+            self.misses += 1
+            return False
+    
+    def add(self, event_id):
+        with self._lock:
+            self._ids[event_id] = None
+            self._ids.move_to_end(event_id)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+    
+    def stats(self):
+        return {
+            'size': len(self._ids),
+            'max_size': self.max_size,
+            'duplicates': self.duplicates,
+            'misses': self.misses
+        }
+
+recent_stripe_events = RecentEventIds()
+# Hashes de corpos de resposta já gravados em tiktok_response_bodies (evita a consulta a cada lote)
+known_response_hashes = RecentEventIds(max_size=RESPONSE_BODY_CACHE_SIZE)
+
+# Versões de cache compartilhadas entre workers (invalidação entre processos)
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+def bump_cache_version(name):
+    """Incrementa a versão de um cache (o commit fica a cargo de quem chama)"""
+    updated = CacheVersion.query.filter_by(name=name).update({
+        'version': CacheVersion.version + 1,
+        'updated_at': datetime.utcnow()
+    }, synchronize_session=False)
+    if not updated:
+        db.session.add(CacheVersion(name=name, version=1))
+
+# Configuração do pixel mantida em cache (somente o necessário para enviar eventos)
+PixelConfig = namedtuple('PixelConfig', ['id_gestor', 'pixel_id', 'access_token', 'ativo'])
+
+PIXEL_CACHE_MAX_SIZE = int(os.getenv('PIXEL_CACHE_MAX_SIZE', 1000))
+PIXEL_CACHE_TTL_SECONDS = float(os.getenv('PIXEL_CACHE_TTL_SECONDS', 300))
+PIXEL_CACHE_VERSION_CHECK_SECONDS = float(os.getenv('PIXEL_CACHE_VERSION_CHECK_SECONDS', 5))
+
+class PixelConfigCache:
+    """Cache LRU com TTL das configurações de pixel ativas, indexado por id_gestor.
+    
+    Cada worker verifica a versão em `cache_versions` no máximo a cada
+    PIXEL_CACHE_VERSION_CHECK_SECONDS; se outro worker alterou um pixel, o
+    cache local é descartado.
+    """
+    VERSION_NAME = 'pixels'
+    
+    def __init__(self, max_size=PIXEL_CACHE_MAX_SIZE, ttl=PIXEL_CACHE_TTL_SECONDS,
+                 version_check_interval=PIXEL_CACHE_VERSION_CHECK_SECONDS):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self._entries = OrderedDict()  # id_gestor -> (expira_em, PixelConfig ou None)
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def _check_version(self):
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return
+        self._version_checked_at = now
+        
+        try:
+            row = db.session.get(CacheVersion, self.VERSION_NAME)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.warning(f"Erro ao verificar versão do cache de pixels: {e}")
+            return
+        
+        version = row.version if row else 0
+        if version != self._version:
+            if self._version is not None:
+                self.invalidate()
+            self._version = version
+    
+    def get(self, manager_id):
+        """Retorna o PixelConfig ativo do gestor (ou None), consultando o banco só em caso de miss"""
+        self._check_version()
+        now = time.monotonic()
+        
+        with self._lock:
+            entry = self._entries.get(manager_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(manager_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        
+        pixel = TikTokPixel.query.filter_by(id_gestor=manager_id, ativo=True).first()
+        config = None
+        if pixel:
+            config = PixelConfig(pixel.id_gestor, pixel.pixel_id, pixel.access_token, pixel.ativo)
+        
+        with self._lock:
+            self._entries[manager_id] = (now + self.ttl, config)
+            self._entries.move_to_end(manager_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        
+        return config
+    
+    def invalidate(self, manager_id=None):
+        """Remove um gestor do cache local (ou todos, se manager_id for None)"""
+        with self._lock:
+            if manager_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(manager_id, None)
+            self.invalidations += 1
+    
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / total * 100, 1) if total else 0,
+            'invalidations': self.invalidations,
+            'version': self._version
+        }
+
+pixel_cache = PixelConfigCache()
+
+def invalidate_pixel_cache(manager_id=None):
+    """Invalida o cache local e sinaliza os demais workers (antes do commit)"""
+    pixel_cache.invalidate(manager_id)
+    bump_cache_version(PixelConfigCache.VERSION_NAME)
+
+# Transporte HTTP compartilhado com o TikTok (pool de conexões keep-alive)
+TIKTOK_CONNECT_TIMEOUT = float(os.getenv('TIKTOK_CONNECT_TIMEOUT', 3.05))
+TIKTOK_READ_TIMEOUT = float(os.getenv('TIKTOK_READ_TIMEOUT', 15))
+TIKTOK_TIMEOUT = (TIKTOK_CONNECT_TIMEOUT, TIKTOK_READ_TIMEOUT)
+TIKTOK_POOL_CONNECTIONS = int(os.getenv('TIKTOK_POOL_CONNECTIONS', 4))
+TIKTOK_POOL_MAXSIZE = int(os.getenv('TIKTOK_POOL_MAXSIZE', 32))
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+def get_http_session():
+    """Retorna a sessão HTTP do processo, criando-a na primeira chamada"""
+    global _http_session
+    if _http_session is None:
+        with _http_session_lock:
+            if _http_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=TIKTOK_POOL_CONNECTIONS,
+                    pool_maxsize=TIKTOK_POOL_MAXSIZE,
+                    max_retries=0
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _http_session = session
+    return _http_session
+
+def _reset_http_session():
+    """Descarta a sessão herdada após fork (conexões não podem ser compartilhadas)"""
+    global _http_session, _http_session_lock
+    _http_session = None
+    _http_session_lock = threading.Lock()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_http_session)
+
+# Rate limit por access token e novas tentativas para respostas transitórias do TikTok
+TIKTOK_RATE_LIMIT_PER_TOKEN = float(os.getenv('TIKTOK_RATE_LIMIT_PER_TOKEN', 10))  # requisições/s
+TIKTOK_RATE_LIMIT_BURST = float(os.getenv('TIKTOK_RATE_LIMIT_BURST', 20))
+TIKTOK_MAX_RETRIES = int(os.getenv('TIKTOK_MAX_RETRIES', 2))
+TIKTOK_RETRY_BASE_DELAY = float(os.getenv('TIKTOK_RETRY_BASE_DELAY', 0.5))
+TIKTOK_RETRY_MAX_DELAY = float(os.getenv('TIKTOK_RETRY_MAX_DELAY', 30))
+
+# Códigos de resposta do TikTok: limite de requisições e falhas temporárias do lado deles
+TIKTOK_THROTTLE_CODES = {40100}
+TIKTOK_TRANSIENT_CODES = {50000, 50002}
+
+class TokenBucket:
+    """Token bucket thread-safe com ajuste adaptativo da taxa (AIMD).
+    
+    Quando o TikTok limita as requisições a taxa cai e o bucket pausa até o
+    Retry-After; a cada sucesso ela volta aos poucos ao máximo configurado.
+    """
+    
+    def __init__(self, rate, burst=None):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = max(rate * 0.1, 0.1)
+        self.burst = burst or max(rate, 1)
+        self.tokens = self.burst
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+    
+    def reserve(self):
+        """Consome um token e retorna quantos segundos esperar antes de usá-lo"""
+        if self.max_rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+    
+    def acquire(self):
+        wait = self.reserve()
+        if wait > 0:
+            time.sleep(wait)
+    
+    def throttled(self, retry_after):
+        """O TikTok limitou: pausar por retry_after segundos e reduzir a taxa"""
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            self.rate = max(self.min_rate, self.rate * 0.7)
+    
+    def succeeded(self):
+        """Requisição aceita: recuperar a taxa gradualmente"""
+        if self.rate < self.max_rate:
+            with self._lock:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+_token_buckets = {}
+_token_buckets_lock = threading.Lock()
+
+def get_token_bucket(access_token):
+    """Token bucket do access token (compartilhado por todos os pixels do token)"""
+    bucket = _token_buckets.get(access_token)
+    if bucket is None:
+        with _token_buckets_lock:
+            bucket = _token_buckets.setdefault(
+                access_token, TokenBucket(TIKTOK_RATE_LIMIT_PER_TOKEN, TIKTOK_RATE_LIMIT_BURST)
+            )
+    return bucket
+
+def classify_tiktok_response(status_code, body):
+    """Classifica a resposta: 'ok', 'throttled', 'transient' ou 'permanent'"""
+    code = body.get('code') if isinstance(body, dict) else None
+    if status_code == 429 or code in TIKTOK_THROTTLE_CODES:
+        return 'throttled'
+    if status_code >= 500 or code in TIKTOK_TRANSIENT_CODES:
+        return 'transient'
+    if status_code == 200 and code == 0:
+        return 'ok'
+    return 'permanent'
+
+def tiktok_retry_delay(attempt, retry_after=None):
+    """Espera antes da próxima tentativa: Retry-After ou backoff exponencial com jitter"""
+    if retry_after is not None:
+        return min(retry_after, TIKTOK_RETRY_MAX_DELAY)
+    return random.uniform(0, min(TIKTOK_RETRY_MAX_DELAY, TIKTOK_RETRY_BASE_DELAY * (2 ** attempt)))
+
+def _parse_retry_after(value):
+    """Converte o header Retry-After (segundos ou data HTTP) em segundos"""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+def _response_json(response):
+    """Corpo JSON da resposta do TikTok (ou um dict com o texto, se não for JSON)"""
+    if not response.content:
+        return {}
+    try:
+        return json_loads(response.content)
+    except ValueError:
+        return {'message': response.text[:500]}
+
+# URL base da API do TikTok (trocada por um servidor local nos benchmarks; ver benchmarks/)
+TIKTOK_API_BASE = os.getenv('TIKTOK_API_BASE', 'https://business-api.tiktok.com/open_api/v1.3').rstrip('/')
+
+# Identificadores do cliente (e-mail, telefone, external_id) normalizados e com hash SHA-256 para o TikTok
+IDENTITY_HASH_CACHE_SIZE = int(os.getenv('IDENTITY_HASH_CACHE_SIZE', 50000))
+# DDI usado em telefones sem código do país (ex.: "(11) 99999-9999" -> +5511999999999)
+DEFAULT_PHONE_COUNTRY_CODE = os.getenv('DEFAULT_PHONE_COUNTRY_CODE', '55').lstrip('+')
+
+_NON_DIGITS = re.compile(r'\D')
+
+def normalize_email(value):
+    return str(value).strip().lower()
+
+def normalize_phone(value):
+    """Telefone em E.164 (+<DDI><número>); sem DDI assume DEFAULT_PHONE_COUNTRY_CODE"""
+    value = str(value).strip()
+    digits = _NON_DIGITS.sub('', value)
+    if not digits:
+        return ''
+    if value.startswith('+'):
+        return '+' + digits
+    if digits.startswith('00'):
+        return '+' + digits[2:]
+    # Prefixo de operadora/longa distância (0, 0xx) não faz parte do número
+    digits = digits.lstrip('0')
+    if len(digits) <= 11:
+        digits = DEFAULT_PHONE_COUNTRY_CODE + digits
+    return '+' + digits
+
+def normalize_external_id(value):
+    return str(value).strip().lower()
 
-# Modelo do Pixel
-class TikTokPixel(db.Model):
-    __tablename__ = 'tiktok_pixels'
-    
-    id = db.Column(db.Integer, primary_key=True)
-    id_gestor = db.Column(db.String(50), unique=True, nullable=False)
-    pixel_id = db.Column(db.String(100), nullable=False)
-    access_token = db.Column(db.Text, nullable=False)
-    nome_pixel = db.Column(db.String(200))
-    chave_seguranca = db.Column(db.String(64), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    ativo = db.Column(db.Boolean, default=True)
+IDENTITY_NORMALIZERS = {
+    'email': normalize_email,
+    'phone': normalize_phone,
+    'external_id': normalize_external_id
+}
+
+class IdentityHasher:
+    """Cache LRU limitado dos hashes de identificadores do cliente.
     
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        if not self.chave_seguranca:
-            self.chave_seguranca = secrets.token_hex(32)
+    Clientes recorrentes (recompras, renovações de assinatura) repetem os mesmos dados; a
+    normalização e o SHA-256 são feitos uma vez por identidade. A chave do cache é um BLAKE2b
+    com chave aleatória deste processo, para não manter o valor original (PII) em memória.
+    """
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'id_gestor': self.id_gestor,
-            'pixel_id': self.pixel_id,
-            'nome_pixel': self.nome_pixel,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'ativo': self.ativo
+    def __init__(self, max_size=IDENTITY_HASH_CACHE_SIZE):
+        self.max_size = max_size
+        key = secrets.token_bytes(32)
+        self._keyed = {
+            kind: hashlib.blake2b(key=key, person=kind.encode('ascii'), digest_size=16)
+            for kind in IDENTITY_NORMALIZERS
         }
-
-# Modelo de Log de Eventos
-class EventLog(db.Model):
-    __tablename__ = 'event_logs'
+        self._hashes = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
     
-    id = db.Column(db.Integer, primary_key=True)
-    pixel_id = db.Column(db.String(100), nullable=False)
-    stripe_event_id = db.Column(db.String(100), nullable=False)
-    stripe_event_type = db.Column(db.String(50), nullable=False)
-    status = db.Column(db.String(20), nullable=False)  # success, error
-    error_message = db.Column(db.Text)
-    tiktok_response = db.Column(db.Text)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    def hash(self, kind, value):
+        """SHA-256 (hex) do identificador normalizado; "" para valores vazios"""
+        if value is None or value == '':
+            return ""
+        raw = value if isinstance(value, str) else str(value)
+        digest = self._keyed[kind].copy()
+        digest.update(raw.encode('utf-8'))
+        cache_key = digest.digest()
+        with self._lock:
+            hashed = self._hashes.get(cache_key)
+            if hashed is not None:
+                self._hashes.move_to_end(cache_key)
+                self.hits += 1
+                return hashed
+            self.misses += 1
+        
+        normalized = IDENTITY_NORMALIZERS[kind](raw)
+        hashed = hashlib.sha256(normalized.encode('utf-8')).hexdigest() if normalized else ""
+        if self.max_size > 0:
+            with self._lock:
+                self._hashes[cache_key] = hashed
+                while len(self._hashes) > self.max_size:
+                    self._hashes.popitem(last=False)
+        return hashed
     
-    def to_dict(self):
+    def clear(self):
+        with self._lock:
+            self._hashes.clear()
+    
+    def stats(self):
         return {
-            'id': self.id,
-            'pixel_id': self.pixel_id,
-            'stripe_event_id': self.stripe_event_id,
-            'stripe_event_type': self.stripe_event_type,
-            'status': self.status,
-            'error_message': self.error_message,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'size': len(self._hashes),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses
         }
 
+identity_hasher = IdentityHasher()
+
 # Classe para integração TikTok
+def _epoch_seconds(value):
+    """event_time do TikTok (segundos desde a época) a partir de epoch, datetime UTC ou ISO 8601"""
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
 class TikTokEventsAPI:
-    BASE_URL = "https://business-api.tiktok.com/open_api/v1.3/pixel/track/"
-    PIXEL_LIST_URL = "https://business-api.tiktok.com/open_api/v1.3/pixel/list/"
+    BASE_URL = f"{TIKTOK_API_BASE}/event/track/"
+    PIXEL_LIST_URL = f"{TIKTOK_API_BASE}/pixel/list/"
     
-    def __init__(self, access_token, pixel_id):
+    def __init__(self, access_token, pixel_id, session=None):
         self.access_token = access_token
         self.pixel_id = pixel_id
+        self.session = session or get_http_session()
         self.headers = {
             'Access-Token': self.access_token,
             'Content-Type': 'application/json'
         }
         self.event_source_id = None
     
+    def _request(self, method, url, **kwargs):
+        """Requisição ao TikTok com rate limit por token e novas tentativas.
+        
+        Respostas de limite (429/40100) e falhas transitórias (5xx) são repetidas até
+        TIKTOK_MAX_RETRIES vezes. Retorna (response, body) da última tentativa.
+        """
+        bucket = get_token_bucket(self.access_token)
+        attempt = 0
+        while True:
+            bucket.acquire()
+            try:
+                response = self.session.request(
+                    method, url, headers=self.headers, timeout=TIKTOK_TIMEOUT, **kwargs
+                )
+            except requests.exceptions.RequestException as e:
+                if attempt >= TIKTOK_MAX_RETRIES:
+                    raise
+                delay = tiktok_retry_delay(attempt)
+                app.logger.warning(f"Erro de rede no TikTok ({e}), nova tentativa em {delay:.2f}s")
+                time.sleep(delay)
+                attempt += 1
+                continue
+            
+            body = _response_json(response)
+            kind = classify_tiktok_response(response.status_code, body)
+            TIKTOK_RESPONSES.inc(response.status_code, body.get('code'), kind)
+            if kind == 'ok':
+                bucket.succeeded()
+            if kind in ('ok', 'permanent') or attempt >= TIKTOK_MAX_RETRIES:
+                return response, body
+            
+            delay = tiktok_retry_delay(attempt, _parse_retry_after(response.headers.get('Retry-After')))
+            app.logger.warning(f"TikTok respondeu {kind} ({response.status_code}/{body.get('code')}), nova tentativa em {delay:.2f}s")
+            if kind == 'throttled':
+                # A espera acontece no próximo acquire(), valendo para todas as threads do token
+                bucket.throttled(delay)
+            else:
+                time.sleep(delay)
+            attempt += 1
+    
     def get_valid_event_source_id(self, advertiser_id):
         """Obtém o event_source_id válido via API do TikTok"""
         try:
-            params = {
-                'advertiser_id': advertiser_id
-            }
-            response = requests.get(
-                self.PIXEL_LIST_URL,
-                headers=self.headers,
-                params=params,
-                timeout=30
-            )
+            response, data = self._request('GET', self.PIXEL_LIST_URL, params={'advertiser_id': advertiser_id})
             
-            print(f"Pixel list response ({response.status_code}):", response.text)
+            log_payload(f"Pixel list response ({response.status_code})", data)
             
-            if response.status_code == 200:
-                data = response.json()
-                if data.get('code') == 0 and data.get('data', {}).get('list'):
-                    for pixel in data['data']['list']:
-                        if pixel.get('pixel_id') == self.pixel_id:
-                            print(f"Pixel encontrado: {pixel}")
-                            return pixel.get('pixel_id')  # Retorna o pixel_id válido
-            
-            return self.pixel_id  # fallback
+            return self._event_source_id_from_list(data if response.status_code == 200 else {})
         except Exception as e:
-            print(f"Erro ao obter event_source_id: {e}")
+            app.logger.error(f"Erro ao obter event_source_id: {e}")
             return self.pixel_id  # fallback
     
-    def _hash_data(self, value):
-        """Hash dados do usuário com SHA256"""
+    def _event_source_id_from_list(self, data):
+        """Procura o pixel na resposta de /pixel/list/ (fallback: o próprio pixel_id)"""
+        if data.get('code') == 0 and data.get('data', {}).get('list'):
+            for pixel in data['data']['list']:
+                if pixel.get('pixel_id') == self.pixel_id:
+                    app.logger.debug(f"Pixel encontrado: {pixel}")
+                    return pixel.get('pixel_id')  # Retorna o pixel_id válido
+        
+        return self.pixel_id  # fallback
+    
+    def _hash_data(self, value, kind='external_id'):
+        """Hash SHA256 de um dado do usuário (normalizado conforme o tipo; ver IdentityHasher)"""
         if not value:
             return ""
-        return hashlib.sha256(str(value).lower().strip().encode('utf-8')).hexdigest()
+        return identity_hasher.hash(kind, value)
     
     def _format_value_for_tiktok(self, value, currency='BRL'):
         """Formatar valor para padrão TikTok"""
@@ -207,76 +2034,687 @@ class TikTokEventsAPI:
         except (ValueError, TypeError):
             return 0.01  # Valor padrão seguro
     
+    def build_purchase_event(self, event_data):
+        """Monta um item de `data` do /event/track/ (v1.3): event_time em epoch, user e page no topo"""
+        # Preparar dados do usuário (hasheados conforme TikTok)
+        user_data = {}
+        if event_data.get('email'):
+            user_data['email'] = self._hash_data(event_data['email'], 'email')
+        if event_data.get('phone'):
+            user_data['phone_number'] = self._hash_data(event_data['phone'], 'phone')
+        if event_data.get('external_id'):
+            user_data['external_id'] = self._hash_data(event_data['external_id'], 'external_id')
+        
+        # Mesmo formato dos itens de `data` enviados pelo teste de conectividade
+        return {
+            'event': 'Purchase',
+            'event_id': f"stripe_{event_data.get('stripe_event_id', '')}",
+            'event_time': _epoch_seconds(event_data.get('event_time')) or int(time.time()),
+            'user': user_data,
+            'page': {
+                'url': event_data.get('page_url', 'https://example.com/checkout')
+            },
+            'properties': {
+                'content_type': 'product',
+                'currency': str(event_data.get('currency', 'BRL')).upper(),
+                'value': self._format_value_for_tiktok(
+                    event_data.get('value', 0), 
+                    event_data.get('currency', 'BRL')
+                )
+            }
+        }
+    
     def send_purchase_event(self, event_data):
-        """Envia evento de compra para TikTok - Formato EXATO do exemplo oficial"""
+        """Envia um evento de compra para TikTok (lote de um item, mesmo formato de send_events)"""
+        try:
+            event = self.build_purchase_event(event_data)
+        except Exception as e:
+            return {'success': False, 'error': f'Erro inesperado: {str(e)}'}
+        return self.send_events([event])[0]
+    
+    def track_payload(self, events):
+        """Corpo do /event/track/ (v1.3) para um lote de eventos web deste pixel"""
+        return {
+            'event_source': 'web',
+            'event_source_id': self.pixel_id,
+            'data': events
+        }
+    
+    def send_events(self, events):
+        """Envia vários eventos já montados em uma única requisição ao /event/track/.
+        
+        Retorna uma lista de resultados, um por evento, na mesma ordem de `events`.
+        """
+        if not events:
+            return []
+        
+        payload = self.track_payload(events)
+        
         try:
-            # Preparar dados do usuário (hasheados conforme TikTok)
-            user_data = {}
-            if event_data.get('email'):
-                user_data['email'] = self._hash_data(event_data['email'])
-            if event_data.get('phone'):
-                user_data['phone_number'] = self._hash_data(event_data['phone'])
-            if event_data.get('external_id'):
-                user_data['external_id'] = self._hash_data(str(event_data['external_id']))
+            log_payload(f"Enviando lote de {len(events)} eventos para TikTok", payload, pixel_id=self.pixel_id)
             
-            # Formato EXATO do exemplo oficial TikTok
-            payload = {
-                'pixel_code': self.pixel_id,
-                'event': 'Purchase',
-                'event_id': f"stripe_{event_data.get('stripe_event_id', '')}",
-                'timestamp': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
-                'context': {
-                    'page': {
-                        'url': event_data.get('page_url', 'https://example.com/checkout')
-                    },
-                    'user': user_data
-                },
-                'properties': {
-                    'content_type': 'product',
-                    'currency': str(event_data.get('currency', 'BRL')).upper(),
-                    'value': self._format_value_for_tiktok(
-                        event_data.get('value', 0), 
-                        event_data.get('currency', 'BRL')
-                    )
-                }
+            response, result = self._request('POST', self.BASE_URL, data=json_dumps_bytes(payload))
+            log_payload(f"Resposta TikTok ({response.status_code})", result, pixel_id=self.pixel_id)
+        except requests.exceptions.RequestException as e:
+            return [{'success': False, 'error': f'Erro de rede: {str(e)}'} for _ in events]
+        except Exception as e:
+            return [{'success': False, 'error': f'Erro inesperado: {str(e)}'} for _ in events]
+        
+        return self._batch_results(events, response.status_code, result)
+    
+    @staticmethod
+    def _event_result(status_code, result):
+        """Interpreta a resposta do TikTok para um único evento"""
+        kind = classify_tiktok_response(status_code, result)
+        if kind == 'ok':
+            return {
+                'success': True,
+                'message': 'Evento enviado para TikTok com sucesso',
+                'tiktok_response': result
             }
-            
-            print("Enviando para TikTok:", json.dumps(payload, indent=2, ensure_ascii=False))
-            
-            # Fazer requisição para TikTok
-            response = requests.post(
-                self.BASE_URL,
-                headers=self.headers,
-                json=payload,
-                timeout=30
-            )
-            
-            result = response.json()
-            print(f"Resposta TikTok ({response.status_code}):", json.dumps(result, indent=2, ensure_ascii=False))
-            
-            if response.status_code == 200 and result.get('code') == 0:
-                return {
+        return {
+            'success': False,
+            'error': f"Erro TikTok (Code: {result.get('code')}): {result.get('message', 'Erro desconhecido')}",
+            'tiktok_response': result,
+            'retryable': kind != 'permanent'
+        }
+    
+    @staticmethod
+    def _batch_results(events, status_code, result):
+        """Mapeia a resposta de um lote para um resultado por evento, na ordem de `events`"""
+        if classify_tiktok_response(status_code, result) != 'ok':
+            error = TikTokEventsAPI._event_result(status_code, result)
+            return [dict(error) for _ in events]
+        
+        # Falhas parciais: o TikTok pode devolver os eventos rejeitados em data.failed_events
+        failed = {}
+        data = result.get('data') if isinstance(result.get('data'), dict) else {}
+        for item in data.get('failed_events') or []:
+            if not isinstance(item, dict):
+                continue
+            key = item.get('event_id', item.get('index'))
+            failed[key] = item.get('message') or item.get('error') or 'Evento rejeitado pelo TikTok'
+        
+        results = []
+        for index, event in enumerate(events):
+            error = failed.get(event.get('event_id'), failed.get(index))
+            if error:
+                results.append({
+                    'success': False,
+                    'error': f"Erro TikTok: {error}",
+                    'tiktok_response': result,
+                    'retryable': False
+                })
+            else:
+                results.append({
                     'success': True,
                     'message': 'Evento enviado para TikTok com sucesso',
                     'tiktok_response': result
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f"Erro TikTok (Code: {result.get('code')}): {result.get('message', 'Erro desconhecido')}",
-                    'tiktok_response': result
-                }
+                })
+        return results
+
+# Cliente assíncrono (asyncio + aiohttp) para o dispatcher manter muitas
+# requisições em andamento sem uma thread por requisição
+TIKTOK_ASYNC_POOL_SIZE = int(os.getenv('TIKTOK_ASYNC_POOL_SIZE', 200))
+TIKTOK_MAX_INFLIGHT_PER_TOKEN = int(os.getenv('TIKTOK_MAX_INFLIGHT_PER_TOKEN', 8))
+
+class AsyncTikTokTransport:
+    """Pool de conexões aiohttp compartilhado + limites de concorrência por access token.
+    
+    O rate limit usa os mesmos TokenBucket do cliente síncrono (get_token_bucket).
+    """
+    
+    def __init__(self, pool_size=TIKTOK_ASYNC_POOL_SIZE, max_inflight_per_token=TIKTOK_MAX_INFLIGHT_PER_TOKEN):
+        if not AIOHTTP_AVAILABLE:
+            raise RuntimeError("aiohttp não instalado: pip install aiohttp")
+        self.pool_size = pool_size
+        self.max_inflight_per_token = max_inflight_per_token
+        self._session = None
+        self._semaphores = {}
+    
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(sock_connect=TIKTOK_CONNECT_TIMEOUT, sock_read=TIKTOK_READ_TIMEOUT)
+            )
+        return self._session
+    
+    def semaphore(self, access_token):
+        if access_token not in self._semaphores:
+            self._semaphores[access_token] = asyncio.Semaphore(self.max_inflight_per_token)
+        return self._semaphores[access_token]
+    
+    async def request(self, method, url, access_token, **kwargs):
+        """Faz a requisição respeitando concorrência, rate limit e novas tentativas. Retorna (status, json)"""
+        bucket = get_token_bucket(access_token)
+        attempt = 0
+        async with self.semaphore(access_token):
+            while True:
+                wait = bucket.reserve()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                try:
+                    async with self.session.request(method, url, **kwargs) as response:
+                        status = response.status
+                        retry_after = response.headers.get('Retry-After')
+                        content = await response.read()
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    if attempt >= TIKTOK_MAX_RETRIES:
+                        raise
+                    await asyncio.sleep(tiktok_retry_delay(attempt))
+                    attempt += 1
+                    continue
                 
-        except requests.exceptions.RequestException as e:
-            return {
-                'success': False,
-                'error': f'Erro de rede: {str(e)}'
-            }
+                try:
+                    body = json_loads(content) if content else {}
+                except ValueError:
+                    body = {'message': content[:500].decode('utf-8', 'replace')}
+                
+                kind = classify_tiktok_response(status, body)
+                TIKTOK_RESPONSES.inc(status, body.get('code'), kind)
+                if kind == 'ok':
+                    bucket.succeeded()
+                if kind in ('ok', 'permanent') or attempt >= TIKTOK_MAX_RETRIES:
+                    return status, body
+                
+                delay = tiktok_retry_delay(attempt, _parse_retry_after(retry_after))
+                if kind == 'throttled':
+                    bucket.throttled(delay)
+                else:
+                    await asyncio.sleep(delay)
+                attempt += 1
+    
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        await self.close()
+
+class AsyncTikTokEventsAPI(TikTokEventsAPI):
+    """Versão asyncio do TikTokEventsAPI (mesma interface, métodos com await)"""
+    
+    def __init__(self, access_token, pixel_id, transport):
+        self.access_token = access_token
+        self.pixel_id = pixel_id
+        self.transport = transport
+        self.headers = {
+            'Access-Token': self.access_token,
+            'Content-Type': 'application/json'
+        }
+        self.event_source_id = None
+    
+    async def get_valid_event_source_id(self, advertiser_id):
+        """Obtém o event_source_id válido via API do TikTok"""
+        try:
+            status, data = await self.transport.request(
+                'GET', self.PIXEL_LIST_URL, self.access_token,
+                headers=self.headers,
+                params={'advertiser_id': advertiser_id}
+            )
+            return self._event_source_id_from_list(data if status == 200 else {})
         except Exception as e:
-            return {
-                'success': False,
-                'error': f'Erro inesperado: {str(e)}'
+            app.logger.error(f"Erro ao obter event_source_id: {e}")
+            return self.pixel_id  # fallback
+    
+    async def send_purchase_event(self, event_data):
+        """Envia um evento de compra para TikTok (lote de um item, mesmo formato de send_events)"""
+        try:
+            event = self.build_purchase_event(event_data)
+        except Exception as e:
+            return {'success': False, 'error': f'Erro inesperado: {str(e)}'}
+        return (await self.send_events([event]))[0]
+    
+    async def send_events(self, events):
+        """Envia vários eventos já montados em uma única requisição ao /event/track/"""
+        if not events:
+            return []
+        
+        payload = self.track_payload(events)
+        log_payload(f"Enviando lote de {len(events)} eventos para TikTok", payload, pixel_id=self.pixel_id)
+        try:
+            status, result = await self.transport.request(
+                'POST', self.BASE_URL, self.access_token,
+                headers=self.headers,
+                data=json_dumps_bytes(payload)
+            )
+            log_payload(f"Resposta TikTok ({status})", result, pixel_id=self.pixel_id)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            return [{'success': False, 'error': f'Erro de rede: {str(e)}'} for _ in events]
+        except Exception as e:
+            return [{'success': False, 'error': f'Erro inesperado: {str(e)}'} for _ in events]
+        
+        return self._batch_results(events, status, result)
+
+# Configuração da fila de saída (outbox)
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 500))
+OUTBOX_LEASE_SECONDS = int(os.getenv('OUTBOX_LEASE_SECONDS', 120))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_BACKOFF_BASE_SECONDS = float(os.getenv('OUTBOX_BACKOFF_BASE_SECONDS', 5))
+OUTBOX_BACKOFF_MAX_SECONDS = float(os.getenv('OUTBOX_BACKOFF_MAX_SECONDS', 3600))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', 1))
+
+# Agrupamento de eventos por pixel em uma única requisição ao TikTok
+TIKTOK_BATCH_MAX_SIZE = int(os.getenv('TIKTOK_BATCH_MAX_SIZE', 100))
+TIKTOK_BATCH_WINDOW_SECONDS = float(os.getenv('TIKTOK_BATCH_WINDOW_SECONDS', 1))
+
+def _outbox_worker_id():
+    """Identificador do processo que faz o lease dos eventos"""
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+def _outbox_backoff_seconds(attempts):
+    """Backoff exponencial entre tentativas, limitado por OUTBOX_BACKOFF_MAX_SECONDS"""
+    return min(OUTBOX_BACKOFF_MAX_SECONDS, OUTBOX_BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)))
+
+def outbox_row(manager_id, pixel_id, stripe_event_id, stripe_event_type, event_data, now=None):
+    """Linha de event_outbox para enqueue_outbox_events (event_data já serializado ou dict)"""
+    now = now or datetime.utcnow()
+    return {
+        'stripe_event_id': stripe_event_id,
+        'stripe_event_type': stripe_event_type,
+        'id_gestor': manager_id,
+        'pixel_id': pixel_id,
+        'event_data': event_data if isinstance(event_data, str) else json_dumps(event_data),
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': now,
+        'created_at': now,
+        'updated_at': now
+    }
+
+def enqueue_outbox_events(rows):
+    """Adiciona vários eventos na outbox em uma única instrução, ignorando os já enfileirados
+    (mesmo stripe_event_id e id_gestor). Retorna os (stripe_event_id, id_gestor) gravados; o
+    commit fica a cargo de quem chama.
+    """
+    if not rows:
+        return []
+    stmt = (
+        _dialect_insert(OutboxEvent).values(rows)
+        .on_conflict_do_nothing(index_elements=['stripe_event_id', 'id_gestor'])
+        .returning(OutboxEvent.stripe_event_id, OutboxEvent.id_gestor)
+    )
+    return [tuple(row) for row in db.session.execute(stmt)]
+
+def lease_outbox_events(worker_id, limit=OUTBOX_BATCH_SIZE):
+    """Reserva eventos pendentes (ou com lease expirado) para este worker"""
+    now = datetime.utcnow()
+    rows = (
+        OutboxEvent.query
+        .filter(or_(
+            and_(OutboxEvent.status == 'pending', OutboxEvent.next_attempt_at <= now),
+            and_(OutboxEvent.status == 'processing', OutboxEvent.locked_until < now)
+        ))
+        .order_by(OutboxEvent.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    
+    leased = []
+    for row in rows:
+        row.status = 'processing'
+        row.locked_by = worker_id
+        row.locked_until = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+        row.attempts = (row.attempts or 0) + 1
+        # Copiar os dados antes do commit para não recarregar cada linha depois
+        leased.append({
+            'id': row.id,
+            'stripe_event_id': row.stripe_event_id,
+            'stripe_event_type': row.stripe_event_type,
+            'id_gestor': row.id_gestor,
+            'pixel_id': row.pixel_id,
+            'event_data': row.event_data,
+            'attempts': row.attempts
+        })
+    db.session.commit()
+    return leased
+
+def _finish_outbox_event(item, worker_id, result):
+    """Marca o evento como concluído, reagenda ou move para dead-letter"""
+    now = datetime.utcnow()
+    query = OutboxEvent.query.filter_by(id=item['id'], locked_by=worker_id)
+    
+    if result['success']:
+        updated = query.update({
+            'status': 'done',
+            'locked_by': None,
+            'locked_until': None,
+            'last_error': None,
+            'updated_at': now
+        }, synchronize_session=False)
+    elif item['attempts'] >= OUTBOX_MAX_ATTEMPTS or result.get('retryable') is False:
+        updated = query.update({
+            'status': 'dead',
+            'locked_by': None,
+            'locked_until': None,
+            'last_error': result.get('error'),
+            'updated_at': now
+        }, synchronize_session=False)
+    else:
+        updated = query.update({
+            'status': 'pending',
+            'locked_by': None,
+            'locked_until': None,
+            'last_error': result.get('error'),
+            'next_attempt_at': now + timedelta(seconds=_outbox_backoff_seconds(item['attempts'])),
+            'updated_at': now
+        }, synchronize_session=False)
+        return None
+    
+    # Lease perdido para outro worker: não registrar o resultado em duplicidade
+    if not updated:
+        return None
+    
+    return _event_log_row(item['pixel_id'], item['stripe_event_id'], item['stripe_event_type'], result, item.get('event'))
+
+def _group_outbox_items(leased):
+    """Agrupa os eventos reservados por (pixel_id, access_token).
+    
+    Retorna (grupos, resultados); eventos sem pixel ativo já saem com erro em `resultados`.
+    """
+    groups = {}
+    results = {}
+    for item in leased:
+        manager_id = item['id_gestor']
+        pixel = pixel_cache.get(manager_id)
+        
+        if not pixel:
+            results[item['id']] = {'success': False, 'error': f"Pixel não encontrado para gestor {manager_id}"}
+            continue
+        
+        item['pixel_id'] = pixel.pixel_id
+        groups.setdefault((pixel.pixel_id, pixel.access_token), []).append(item)
+    return groups, results
+
+def _outbox_chunks(items):
+    """Divide os eventos de um pixel em lotes de até TIKTOK_BATCH_MAX_SIZE"""
+    for start in range(0, len(items), TIKTOK_BATCH_MAX_SIZE):
+        yield items[start:start + TIKTOK_BATCH_MAX_SIZE]
+
+def _complete_outbox_batch(leased, worker_id, results):
+    """Grava o resultado de cada evento reservado e os logs correspondentes"""
+    logs = []
+    for item in leased:
+        log = _finish_outbox_event(item, worker_id, results[item['id']])
+        if log is not None:
+            logs.append(log)
+    # Logs vão para o WAL antes do commit: se o commit falhar o evento volta para a fila
+    # e o log é regravado pelo upsert quando o envio terminar
+    event_log_writer.write_many(logs)
+    with STAGE_SECONDS.time('outbox_commit'):
+        db.session.commit()
+    for item in leased:
+        TIKTOK_EVENTS.inc('success' if results[item['id']]['success'] else 'error')
+
+def process_outbox_batch(worker_id=None, limit=OUTBOX_BATCH_SIZE):
+    """Processa um lote da outbox. Retorna a quantidade de eventos processados"""
+    worker_id = worker_id or _outbox_worker_id()
+    with STAGE_SECONDS.time('outbox_lease'):
+        leased = lease_outbox_events(worker_id, limit)
+    
+    # Agrupar por pixel: cada grupo vira uma requisição (ou poucas) para o TikTok
+    groups, results = _group_outbox_items(leased)
+    
+    for (pixel_id, access_token), items in groups.items():
+        tiktok_client = TikTokEventsAPI(access_token, pixel_id)
+        for chunk in _outbox_chunks(items):
+            events = [tiktok_client.build_purchase_event(json_loads(item['event_data'])) for item in chunk]
+            with STAGE_SECONDS.time('tiktok_call'):
+                chunk_results = tiktok_client.send_events(events)
+            for item, event, result in zip(chunk, events, chunk_results):
+                item['event'] = event
+                results[item['id']] = result
+    
+    _complete_outbox_batch(leased, worker_id, results)
+    return len(leased)
+
+async def process_outbox_batch_async(transport, worker_id=None, limit=OUTBOX_BATCH_SIZE):
+    """Versão asyncio de process_outbox_batch: todos os lotes vão ao TikTok em paralelo"""
+    worker_id = worker_id or _outbox_worker_id()
+    with STAGE_SECONDS.time('outbox_lease'):
+        leased = lease_outbox_events(worker_id, limit)
+    groups, results = _group_outbox_items(leased)
+    
+    async def send_chunk(tiktok_client, chunk):
+        events = [tiktok_client.build_purchase_event(json_loads(item['event_data'])) for item in chunk]
+        with STAGE_SECONDS.time('tiktok_call'):
+            chunk_results = await tiktok_client.send_events(events)
+        for item, event, result in zip(chunk, events, chunk_results):
+            item['event'] = event
+            results[item['id']] = result
+    
+    tasks = []
+    for (pixel_id, access_token), items in groups.items():
+        tiktok_client = AsyncTikTokEventsAPI(access_token, pixel_id, transport)
+        tasks.extend(send_chunk(tiktok_client, chunk) for chunk in _outbox_chunks(items))
+    await asyncio.gather(*tasks)
+    
+    _complete_outbox_batch(leased, worker_id, results)
+    return len(leased)
+
+def run_outbox_dispatcher(stop_event=None, poll_interval=OUTBOX_POLL_INTERVAL):
+    """Loop do dispatcher: drena a outbox até stop_event ser sinalizado"""
+    stop_event = stop_event or threading.Event()
+    worker_id = _outbox_worker_id()
+    app.logger.info(f"📤 Dispatcher da outbox iniciado ({worker_id})")
+    
+    with app.app_context():
+        while not stop_event.is_set():
+            try:
+                maybe_ensure_event_log_partitions()
+                processed = process_outbox_batch(worker_id)
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Erro no dispatcher da outbox: {e}")
+                processed = 0
+            finally:
+                db.session.remove()
+            
+            # Fila cheia: seguir drenando. Caso contrário, aguardar a janela de
+            # agrupamento para que novos eventos do mesmo pixel saiam no mesmo lote
+            if processed >= OUTBOX_BATCH_SIZE:
+                continue
+            stop_event.wait(TIKTOK_BATCH_WINDOW_SECONDS if processed else poll_interval)
+
+async def run_outbox_dispatcher_async(stop_event=None, poll_interval=OUTBOX_POLL_INTERVAL):
+    """Loop do dispatcher assíncrono: um único processo com muitas requisições em andamento"""
+    stop_event = stop_event or threading.Event()
+    worker_id = _outbox_worker_id()
+    app.logger.info(f"📤 Dispatcher assíncrono da outbox iniciado ({worker_id})")
+    
+    async with AsyncTikTokTransport() as transport:
+        with app.app_context():
+            while not stop_event.is_set():
+                try:
+                    maybe_ensure_event_log_partitions()
+                    processed = await process_outbox_batch_async(transport, worker_id)
+                except Exception as e:
+                    db.session.rollback()
+                    app.logger.error(f"Erro no dispatcher da outbox: {e}")
+                    processed = 0
+                finally:
+                    db.session.remove()
+                
+                if processed >= OUTBOX_BATCH_SIZE:
+                    continue
+                await asyncio.sleep(TIKTOK_BATCH_WINDOW_SECONDS if processed else poll_interval)
+
+# Trava da máquina para a thread do dispatcher nos workers do Gunicorn (só um worker despacha)
+OUTBOX_DISPATCHER_LOCK_FILE = os.getenv(
+    'OUTBOX_DISPATCHER_LOCK_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'outbox-dispatcher.lock')
+)
+OUTBOX_DISPATCHER_LOCK_RETRY_SECONDS = float(os.getenv('OUTBOX_DISPATCHER_LOCK_RETRY_SECONDS', 5))
+_outbox_dispatcher_lock = None
+
+def acquire_outbox_dispatcher_lock():
+    """Tenta obter a trava (flock) do dispatcher da máquina; fica com este processo até ele sair"""
+    global _outbox_dispatcher_lock
+    if _outbox_dispatcher_lock is not None:
+        return True
+    os.makedirs(os.path.dirname(OUTBOX_DISPATCHER_LOCK_FILE), exist_ok=True)
+    handle = open(OUTBOX_DISPATCHER_LOCK_FILE, 'a')
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return False
+    _outbox_dispatcher_lock = handle
+    return True
+
+def _run_outbox_dispatcher_exclusive():
+    # Espera a trava: quando o worker dono é reciclado, um dos outros assume o dispatcher
+    while not acquire_outbox_dispatcher_lock():
+        time.sleep(OUTBOX_DISPATCHER_LOCK_RETRY_SECONDS)
+    app.logger.info(f"📤 Dispatcher da outbox ativo neste worker (pid {os.getpid()})")
+    run_outbox_dispatcher()
+
+def start_outbox_dispatcher(exclusive=False):
+    """Inicia o dispatcher da outbox em uma thread daemon deste processo.
+    
+    Com exclusive=True (workers do Gunicorn) a thread só despacha enquanto este processo tiver a
+    trava OUTBOX_DISPATCHER_LOCK_FILE, então há um único dispatcher por máquina.
+    """
+    target = _run_outbox_dispatcher_exclusive if exclusive else run_outbox_dispatcher
+    thread = threading.Thread(target=target, name='outbox-dispatcher', daemon=True)
+    thread.start()
+    return thread
+
+# Replay: reenvio ao TikTok de eventos já registrados em event_logs (ex.: falhas durante uma instabilidade)
+REPLAY_PAGE_SIZE = int(os.getenv('REPLAY_PAGE_SIZE', 1000))
+# Tempo máximo de um replay via HTTP (abaixo do timeout do Gunicorn); continua com o `cursor` retornado
+REPLAY_REQUEST_MAX_SECONDS = float(os.getenv('REPLAY_REQUEST_MAX_SECONDS', 20))
+
+def _replay_event(row, outbox_data):
+    """Evento a reenviar: o payload gravado no log ou, em logs anteriores a ele, o remontado da outbox"""
+    if row.event_payload:
+        event = json_loads(row.event_payload)
+        if 'context' in event:
+            # Gravado no formato antigo (timestamp ISO e context{page, user}): converter para o atual
+            context = event.pop('context') or {}
+            event['user'] = context.get('user', {})
+            event['page'] = context.get('page', {})
+            event['event_time'] = _epoch_seconds(event.pop('timestamp', None)) or _epoch_seconds(row.created_at)
+        return event
+    event_data = outbox_data.get((row.stripe_event_id, row.pixel_id))
+    if event_data is None:
+        return None
+    event_data = json_loads(event_data)
+    event_data.setdefault('event_time', _epoch_seconds(row.created_at))
+    return TikTokEventsAPI(None, row.pixel_id).build_purchase_event(event_data)
+
+def replay_events(pixel_id=None, since=None, until=None, statuses=('error',), cursor=None, limit=None,
+                  dry_run=False, max_seconds=None, page_size=REPLAY_PAGE_SIZE):
+    """Reenvia ao TikTok os eventos de event_logs com status em `statuses` (por padrão, os que falharam).
+    
+    Percorre os logs por (created_at, id) em páginas de `page_size`, sem carregar tudo na memória.
+    Cada página vai ao TikTok em lotes por pixel, pelo mesmo caminho com rate limit do dispatcher e
+    com o event_id original (o TikTok descarta duplicados). Os logs e os rollups de event_stats são
+    atualizados com o novo resultado. Gera um dict de progresso por página e um final (type='done'),
+    ambos com o `cursor` para continuar de onde parou.
+    """
+    totals = Counter()
+    tokens = {}
+    started = time.monotonic()
+    finished = True
+    
+    def access_token_for(log_pixel_id):
+        if log_pixel_id not in tokens:
+            tokens[log_pixel_id] = db.session.query(TikTokPixel.access_token).filter(
+                TikTokPixel.pixel_id == log_pixel_id, TikTokPixel.ativo == True  # noqa: E712
+            ).order_by(TikTokPixel.id).limit(1).scalar()
+        return tokens[log_pixel_id]
+    
+    def progress(kind):
+        return {'type': kind, **totals, 'cursor': _encode_log_cursor(last_row) if last_row else cursor_token}
+    
+    cursor_token = cursor
+    cursor = _decode_log_cursor(cursor) if cursor else None
+    last_row = None
+    while True:
+        if limit and totals['scanned'] >= limit:
+            finished = False
+            break
+        if max_seconds and time.monotonic() - started >= max_seconds:
+            finished = False
+            break
+        
+        query = db.session.query(
+            EventLog.id, EventLog.pixel_id, EventLog.stripe_event_id, EventLog.stripe_event_type,
+            EventLog.created_at, EventLog.event_payload
+        ).filter(EventLog.status.in_(statuses))
+        if pixel_id:
+            query = query.filter(EventLog.pixel_id == pixel_id)
+        if since:
+            query = query.filter(EventLog.created_at >= since)
+        if until:
+            query = query.filter(EventLog.created_at < until)
+        if cursor:
+            query = query.filter(or_(
+                EventLog.created_at > cursor[0],
+                and_(EventLog.created_at == cursor[0], EventLog.id > cursor[1])
+            ))
+        size = min(page_size, limit - totals['scanned']) if limit else page_size
+        page = query.order_by(EventLog.created_at, EventLog.id).limit(size).all()
+        if not page:
+            break
+        last_row = page[-1]
+        cursor = (last_row.created_at, last_row.id)
+        
+        outbox_data = {}
+        missing = [row.stripe_event_id for row in page if not row.event_payload]
+        if missing:
+            outbox_data = {
+                (stripe_event_id, outbox_pixel_id): event_data
+                for stripe_event_id, outbox_pixel_id, event_data in db.session.query(
+                    OutboxEvent.stripe_event_id, OutboxEvent.pixel_id, OutboxEvent.event_data
+                ).filter(OutboxEvent.stripe_event_id.in_(missing))
             }
+        
+        groups = {}
+        for row in page:
+            totals['scanned'] += 1
+            event = _replay_event(row, outbox_data)
+            if event is None:
+                totals['skipped_no_payload'] += 1
+                continue
+            access_token = access_token_for(row.pixel_id)
+            if access_token is None:
+                totals['skipped_no_pixel'] += 1
+                continue
+            groups.setdefault((row.pixel_id, access_token), []).append((row, event))
+        # As chamadas ao TikTok acontecem fora da transação
+        db.session.rollback()
+        
+        if dry_run:
+            totals['would_send'] += sum(len(items) for items in groups.values())
+            yield progress('progress')
+            continue
+        
+        log_rows = []
+        for (log_pixel_id, access_token), items in groups.items():
+            tiktok_client = TikTokEventsAPI(access_token, log_pixel_id)
+            for chunk in _outbox_chunks(items):
+                with STAGE_SECONDS.time('tiktok_call'):
+                    chunk_results = tiktok_client.send_events([event for _, event in chunk])
+                for (row, event), result in zip(chunk, chunk_results):
+                    totals['succeeded' if result['success'] else 'failed'] += 1
+                    TIKTOK_EVENTS.inc('success' if result['success'] else 'error')
+                    log_rows.append(_event_log_row(row.pixel_id, row.stripe_event_id, row.stripe_event_type, result, event))
+        
+        interned = upsert_event_logs(log_rows)
+        db.session.commit()
+        for digest in interned:
+            known_response_hashes.add(digest)
+        yield progress('progress')
+    
+    yield {**progress('done'), 'finished': finished, 'elapsed_seconds': round(time.monotonic() - started, 1)}
 
 # Rotas da API
 @app.route('/api')
@@ -289,7 +2727,14 @@ def api_info():
         'endpoints': {
             'webhook': '/webhook/stripe',
             'pixels': '/api/pixels',
-            'logs': '/api/pixels/<manager_id>/logs'
+            'pixels_bulk': '/api/pixels/bulk',
+            'pixels_export': '/api/pixels/export',
+            'pixels_health': '/api/pixels/health',
+            'logs': '/api/pixels/<manager_id>/logs',
+            'outbox': '/api/outbox',
+            'replay': '/api/events/replay',
+            'routing': '/api/routing',
+            'metrics': '/metrics'
         }
     }
 
@@ -322,7 +2767,7 @@ def create_pixel():
             # Última tentativa: tentar carregar o raw body como JSON
             try:
                 if request.data:
-                    data = json.loads(request.data)
+                    data = json_loads(request.data)
                     app.logger.info("create_pixel: JSON carregado a partir do raw body")
             except Exception:
                 data = None
@@ -345,10 +2790,12 @@ def create_pixel():
         id_gestor=data['id_gestor'],
         pixel_id=data['pixel_id'],
         access_token=data['access_token'],
-        nome_pixel=data.get('nome_pixel', f"Pixel {data['id_gestor']}")
+        nome_pixel=data.get('nome_pixel', f"Pixel {data['id_gestor']}"),
+        advertiser_id=data.get('advertiser_id') or None
     )
     
     db.session.add(pixel)
+    invalidate_pixel_cache(pixel.id_gestor)
     db.session.commit()
     
     return jsonify({
@@ -363,27 +2810,300 @@ def update_pixel(id_gestor):
     """Atualizar pixel existente"""
     data = request.get_json(silent=True)
     
-    if not data:
-        return jsonify({'success': False, 'error': 'JSON obrigatório'}), 400
+    if not data:
+        return jsonify({'success': False, 'error': 'JSON obrigatório'}), 400
+    
+    pixel = TikTokPixel.query.filter_by(id_gestor=id_gestor, ativo=True).first()
+    if not pixel:
+        return jsonify({'success': False, 'error': 'Pixel não encontrado'}), 404
+    
+    # Atualizar campos se fornecidos
+    if data.get('access_token'):
+        pixel.access_token = data['access_token']
+    if data.get('pixel_id'):
+        pixel.pixel_id = data['pixel_id']
+    if data.get('nome_pixel'):
+        pixel.nome_pixel = data['nome_pixel']
+    if data.get('advertiser_id'):
+        pixel.advertiser_id = data['advertiser_id']
+    
+    invalidate_pixel_cache(id_gestor)
+    db.session.commit()
+    
+    return jsonify({
+        'success': True,
+        'message': 'Pixel atualizado com sucesso',
+        'pixel': pixel.to_dict()
+    })
+
+# Cadastro em lote de pixels (JSON, NDJSON ou CSV) e exportação no mesmo formato
+PIXEL_BULK_CHUNK = int(os.getenv('PIXEL_BULK_CHUNK', 500))
+PIXEL_EXPORT_FIELDS = ('id_gestor', 'pixel_id', 'nome_pixel', 'advertiser_id', 'ativo')
+# Backup completo (com access_token) só com o cabeçalho X-Export-Secret igual a este segredo
+PIXEL_EXPORT_SECRET = os.getenv('PIXEL_EXPORT_SECRET', '')
+PIXEL_FIELD_LIMITS = {'id_gestor': 50, 'pixel_id': 100, 'nome_pixel': 200, 'advertiser_id': 50}
+_TRUE_VALUES = {'true', '1', 'sim', 'yes', 's', 'y'}
+_FALSE_VALUES = {'false', '0', 'nao', 'não', 'no', 'n'}
+# Campos que o cadastro em lote só sobrescreve quando vêm preenchidos na linha
+PIXEL_OPTIONAL_FIELDS = ('nome_pixel', 'advertiser_id', 'ativo')
+
+def _bulk_pixel_format():
+    """Formato do corpo em /api/pixels/bulk: ?format=json|ndjson|csv ou pelo Content-Type"""
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt.lower()
+    mimetype = request.mimetype or ''
+    if mimetype in ('application/x-ndjson', 'application/jsonl', 'application/jsonlines'):
+        return 'ndjson'
+    if mimetype in ('text/csv', 'application/csv'):
+        return 'csv'
+    return 'json'
+
+def _iter_bulk_pixel_rows(fmt):
+    """Lê as definições de pixel do corpo da requisição; gera (número da linha, dict ou erro).
+    
+    NDJSON e CSV são lidos do stream, linha a linha, sem carregar o corpo inteiro. Um corpo
+    JSON que não seja uma lista levanta ValueError.
+    """
+    if fmt == 'json':
+        data = json_loads(request.get_data(cache=False) or b'null')
+        if isinstance(data, dict):
+            data = data.get('pixels')
+        if not isinstance(data, list):
+            raise ValueError('Envie uma lista de pixels (ou {"pixels": [...]})')
+        yield from enumerate(data, start=1)
+        return
+    
+    lines = io.TextIOWrapper(io.BufferedReader(request.stream), encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json_loads(line)
+        except ValueError:
+            yield line_number, 'JSON inválido'
+
+def _validate_bulk_pixel(row):
+    """Normaliza uma definição de pixel; retorna (valores, None) ou (None, mensagem de erro)"""
+    if not isinstance(row, dict):
+        return None, row if isinstance(row, str) else 'Cada item deve ser um objeto'
+    
+    values = {}
+    for field in ('id_gestor', 'pixel_id', 'access_token', 'nome_pixel', 'advertiser_id'):
+        value = row.get(field)
+        if field == 'id_gestor' and value in (None, ''):
+            value = row.get('manager_id')  # nome usado pelo create_pixel.py antigo
+        value = str(value).strip() if value not in (None, '') else ''
+        limit = PIXEL_FIELD_LIMITS.get(field)
+        if limit and len(value) > limit:
+            return None, f"{field} maior que {limit} caracteres"
+        values[field] = value
+    
+    missing = [field for field in ('id_gestor', 'pixel_id', 'access_token') if not values[field]]
+    if missing:
+        return None, f"Dados obrigatórios faltando: {', '.join(missing)}"
+    # Campos opcionais ausentes (ou vazios) ficam de fora: no update o valor gravado é mantido
+    for field in PIXEL_OPTIONAL_FIELDS:
+        if not values.get(field):
+            values.pop(field, None)
+    
+    ativo = row.get('ativo')
+    if isinstance(ativo, str):
+        if not ativo.strip():
+            ativo = None
+        elif ativo.strip().lower() in _TRUE_VALUES:
+            ativo = True
+        elif ativo.strip().lower() in _FALSE_VALUES:
+            ativo = False
+        else:
+            return None, f"ativo inválido: {ativo}"
+    if ativo is not None:
+        values['ativo'] = bool(ativo)
+    return values, None
+
+def upsert_pixels(rows, create_only=False):
+    """Grava um bloco de pixels (INSERT ... ON CONFLICT ... RETURNING, uma instrução por
+    combinação de campos opcionais presentes).
+    
+    No update só são sobrescritos pixel_id, access_token e os campos opcionais presentes na
+    linha; os ausentes mantêm o valor gravado e, na criação, recebem o padrão. Retorna
+    {id_gestor: (status, chave_seguranca)} com status 'created', 'updated' ou 'exists'
+    (create_only e o gestor já existia). O commit fica a cargo de quem chama.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(field for field in PIXEL_OPTIONAL_FIELDS if field in row), []).append(row)
+    
+    results = {}
+    for provided, group in groups.items():
+        results.update(_upsert_pixel_group(group, provided, create_only))
+    return results
+
+def _upsert_pixel_group(rows, provided, create_only):
+    now = datetime.utcnow()
+    keys = {row['id_gestor']: secrets.token_hex(32) for row in rows}
+    values = [
+        {'nome_pixel': f"Pixel {row['id_gestor']}", 'advertiser_id': None, 'ativo': True,
+         **row, 'chave_seguranca': keys[row['id_gestor']], 'created_at': now}
+        for row in rows
+    ]
+    stmt = _dialect_insert(TikTokPixel).values(values)
+    if create_only:
+        stmt = stmt.on_conflict_do_nothing(index_elements=['id_gestor'])
+    else:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['id_gestor'],
+            set_={field: stmt.excluded[field] for field in ('pixel_id', 'access_token') + provided}
+        )
+    stmt = stmt.returning(TikTokPixel.id_gestor, TikTokPixel.chave_seguranca)
+    
+    # A chave de segurança não muda no update: só as linhas inseridas voltam com a chave gerada aqui
+    results = {row['id_gestor']: ('exists', None) for row in rows}
+    for manager_id, key in db.session.execute(stmt):
+        results[manager_id] = ('created', key) if key == keys[manager_id] else ('updated', None)
+    return results
+
+@app.route('/api/pixels/bulk', methods=['POST'])
+def bulk_pixels():
+    """Cria/atualiza pixels em lote a partir de uma lista JSON, NDJSON ou CSV.
+    
+    Parâmetros: format (json|ndjson|csv; padrão pelo Content-Type), mode (upsert|create)
+    e dry_run (só valida). Retorna o resultado de cada linha.
+    """
+    fmt = _bulk_pixel_format()
+    if fmt not in ('json', 'ndjson', 'csv'):
+        return jsonify({'success': False, 'error': 'format deve ser json, ndjson ou csv'}), 400
+    mode = request.args.get('mode', 'upsert')
+    if mode not in ('upsert', 'create'):
+        return jsonify({'success': False, 'error': 'mode deve ser upsert ou create'}), 400
+    dry_run = request.args.get('dry_run', '').lower() in _TRUE_VALUES
+    
+    results = []
+    chunk = []
+    seen = set()
+    
+    def flush():
+        if not chunk:
+            return
+        pending = {row['id_gestor']: index for index, row in chunk}
+        try:
+            written = upsert_pixels([row for _, row in chunk], create_only=(mode == 'create'))
+            invalidate_pixel_cache()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Erro no cadastro em lote de pixels: {e}")
+            written = {manager_id: ('error', None) for manager_id in pending}
+        for manager_id, (status, key) in written.items():
+            result = results[pending[manager_id]]
+            result['status'] = status
+            if key:
+                result['chave_seguranca'] = key
+            if status == 'exists':
+                result['error'] = 'ID do gestor já existe'
+            elif status == 'error':
+                result['error'] = 'Erro ao gravar o bloco'
+        chunk.clear()
+    
+    rows = _iter_bulk_pixel_rows(fmt)
+    try:
+        first = next(rows, None)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': f"Corpo inválido: {e}"}), 400
+    
+    with STAGE_SECONDS.time('pixel_bulk'):
+        for line, row in itertools.chain([first] if first else [], rows):
+            values, error = _validate_bulk_pixel(row)
+            if values and values['id_gestor'] in seen:
+                values, error = None, 'id_gestor repetido no lote'
+            result = {'line': line, 'id_gestor': values['id_gestor'] if values else (row.get('id_gestor') if isinstance(row, dict) else None)}
+            if error:
+                result.update(status='error', error=error)
+                results.append(result)
+                continue
+            
+            seen.add(values['id_gestor'])
+            result['status'] = 'valid'
+            results.append(result)
+            if not dry_run:
+                chunk.append((len(results) - 1, values))
+                if len(chunk) >= PIXEL_BULK_CHUNK:
+                    flush()
+        if not dry_run:
+            flush()
+    
+    summary = Counter(result['status'] for result in results)
+    failed = summary['error'] + summary['exists']
+    return jsonify({
+        'success': failed == 0,
+        'dry_run': dry_run,
+        'summary': {'total': len(results), **summary},
+        'results': results
+    }), 200 if failed == 0 else 207
+
+@app.route('/api/pixels/export', methods=['GET'])
+def export_pixels():
+    """Exporta os pixels no formato aceito por /api/pixels/bulk (ndjson, csv ou json), em streaming.
     
-    pixel = TikTokPixel.query.filter_by(id_gestor=id_gestor, ativo=True).first()
-    if not pixel:
-        return jsonify({'success': False, 'error': 'Pixel não encontrado'}), 404
+    Parâmetros: format (padrão ndjson), include_inactive e include_tokens. O access_token só é
+    incluído com include_tokens=true e o cabeçalho X-Export-Secret igual a PIXEL_EXPORT_SECRET.
+    """
+    fmt = (request.args.get('format') or 'ndjson').lower()
+    if fmt not in ('json', 'ndjson', 'csv'):
+        return jsonify({'success': False, 'error': 'format deve ser json, ndjson ou csv'}), 400
+    include_inactive = request.args.get('include_inactive', '').lower() in _TRUE_VALUES
     
-    # Atualizar campos se fornecidos
-    if data.get('access_token'):
-        pixel.access_token = data['access_token']
-    if data.get('pixel_id'):
-        pixel.pixel_id = data['pixel_id']
-    if data.get('nome_pixel'):
-        pixel.nome_pixel = data['nome_pixel']
+    fields = PIXEL_EXPORT_FIELDS
+    if request.args.get('include_tokens', '').lower() in _TRUE_VALUES:
+        provided = request.headers.get('X-Export-Secret', '')
+        if not PIXEL_EXPORT_SECRET or not hmac.compare_digest(provided.encode('utf-8'), PIXEL_EXPORT_SECRET.encode('utf-8')):
+            app.logger.warning("Exportação de pixels com tokens recusada (X-Export-Secret ausente ou inválido)")
+            return jsonify({'success': False, 'error': 'Exportação com access_token não autorizada'}), 403
+        fields = PIXEL_EXPORT_FIELDS[:2] + ('access_token',) + PIXEL_EXPORT_FIELDS[2:]
     
-    db.session.commit()
+    def pixel_rows():
+        last_id = 0
+        while True:
+            query = db.session.query(TikTokPixel.id, *(getattr(TikTokPixel, field) for field in fields))
+            query = query.filter(TikTokPixel.id > last_id)
+            if not include_inactive:
+                query = query.filter(TikTokPixel.ativo == True)  # noqa: E712
+            page = query.order_by(TikTokPixel.id).limit(PIXEL_BULK_CHUNK).all()
+            if not page:
+                return
+            last_id = page[-1][0]
+            yield [dict(zip(fields, row[1:])) for row in page]
     
-    return jsonify({
-        'success': True,
-        'message': 'Pixel atualizado com sucesso',
-        'pixel': pixel.to_dict()
+    def generate():
+        if fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=fields)
+            writer.writeheader()
+            for page in pixel_rows():
+                writer.writerows(page)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            yield buffer.getvalue()
+        elif fmt == 'ndjson':
+            for page in pixel_rows():
+                yield b''.join(json_dumps_bytes(row) + b'\n' for row in page)
+        else:
+            separator = b'['
+            for page in pixel_rows():
+                for row in page:
+                    yield separator + json_dumps_bytes(row)
+                    separator = b','
+            yield b'[]\n' if separator == b'[' else b']\n'
+    
+    mimetypes = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv', 'json': 'application/json'}
+    return Response(stream_with_context(generate()), mimetype=mimetypes[fmt], headers={
+        'Content-Disposition': f"attachment; filename=pixels.{fmt}"
     })
 
 @app.route('/api/pixels/<id_gestor>/test-connectivity', methods=['POST'])
@@ -396,32 +3116,24 @@ def test_pixel_connectivity(id_gestor):
     tiktok_api = TikTokEventsAPI(pixel.access_token, pixel.pixel_id)
     
     # Teste 1: Payload mínimo
-    test_payload = {
-        'pixel_code': pixel.pixel_id,
-        'data': [{
-            'event': 'Purchase',
-            'event_time': int(time.time()),
-            'event_id': 'test_connectivity_123',
-            'properties': {
-                'value': 1.00,
-                'currency': 'USD'
-            }
-        }]
-    }
+    test_payload = tiktok_api.track_payload([{
+        'event': 'Purchase',
+        'event_time': int(time.time()),
+        'event_id': 'test_connectivity_123',
+        'properties': {
+            'value': 1.00,
+            'currency': 'USD'
+        }
+    }])
     
     try:
-        response = requests.post(
-            tiktok_api.BASE_URL,
-            headers=tiktok_api.headers,
-            json=test_payload,
-            timeout=30
-        )
+        response, response_body = tiktok_api._request('POST', tiktok_api.BASE_URL, data=json_dumps_bytes(test_payload))
         
         return jsonify({
             'success': True,
             'test_payload': test_payload,
             'response_status': response.status_code,
-            'response_body': response.json() if response.content else {},
+            'response_body': response_body,
             'headers_sent': dict(tiktok_api.headers)
         })
     except Exception as e:
@@ -432,39 +3144,459 @@ def test_pixel_connectivity(id_gestor):
             'headers_sent': dict(tiktok_api.headers)
         })
 
+# Verificação de saúde da frota de pixels: token e pixel conferidos em /pixel/list/, uma chamada
+# (paginada) por par access_token + advertiser_id, em paralelo e com cache
+HEALTH_CHECK_CONCURRENCY = int(os.getenv('HEALTH_CHECK_CONCURRENCY', 16))
+HEALTH_CHECK_TTL_SECONDS = float(os.getenv('HEALTH_CHECK_TTL_SECONDS', 300))
+HEALTH_CHECK_PAGE_SIZE = int(os.getenv('HEALTH_CHECK_PAGE_SIZE', 20))
+HEALTH_CHECK_MAX_PAGES = int(os.getenv('HEALTH_CHECK_MAX_PAGES', 50))
+# Códigos do TikTok para access token inválido, expirado, ausente ou sem permissão
+TIKTOK_AUTH_ERROR_CODES = {40001, 40102, 40104, 40105}
+
+PixelProbe = namedtuple('PixelProbe', 'id_gestor pixel_id access_token advertiser_id')
+
+def _token_fingerprint(access_token):
+    """Identifica o token na saída (pixels com o mesmo token) sem expô-lo"""
+    return hashlib.sha256(access_token.encode('utf-8')).hexdigest()[:8]
+
+class PixelHealthChecker:
+    """Confere token e pixel de vários pixels em paralelo, agrupando os que compartilham o token.
+    
+    O resultado de cada grupo (access_token, advertiser_id) fica em cache por `ttl` segundos.
+    """
+    
+    def __init__(self, concurrency=HEALTH_CHECK_CONCURRENCY, ttl=HEALTH_CHECK_TTL_SECONDS):
+        self.concurrency = concurrency
+        self.ttl = ttl
+        self._groups = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def _list_pixels(self, access_token, advertiser_id):
+        """Todos os pixels do anunciante visíveis para o token (páginas de /pixel/list/)"""
+        client = TikTokEventsAPI(access_token, None)
+        result = {'token_valid': None, 'pixel_codes': set(), 'error': None, 'checked_at': datetime.utcnow()}
+        started = time.monotonic()
+        try:
+            for page in range(1, HEALTH_CHECK_MAX_PAGES + 1):
+                response, body = client._request('GET', client.PIXEL_LIST_URL, params={
+                    'advertiser_id': advertiser_id, 'page': page, 'page_size': HEALTH_CHECK_PAGE_SIZE
+                })
+                code = body.get('code')
+                if code in TIKTOK_AUTH_ERROR_CODES or response.status_code in (401, 403):
+                    result.update(token_valid=False, error=f"{code}: {body.get('message', 'token inválido')}")
+                    break
+                if response.status_code != 200 or code != 0:
+                    result['error'] = f"{response.status_code}/{code}: {body.get('message', 'erro desconhecido')}"
+                    break
+                
+                result['token_valid'] = True
+                data = body.get('data') or {}
+                for pixel in data.get('pixels') or data.get('list') or []:
+                    result['pixel_codes'].update(
+                        str(pixel[key]) for key in ('pixel_code', 'pixel_id') if pixel.get(key)
+                    )
+                if page >= (data.get('page_info') or {}).get('total_page', 1):
+                    break
+        except requests.exceptions.RequestException as e:
+            result['error'] = f"Erro de rede: {e}"
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            # Corpo fora do formato esperado: só este grupo fica com erro (e sem cache)
+            result.update(token_valid=None, error=f"Resposta inválida do TikTok: {e!r}")
+        result['latency_ms'] = round((time.monotonic() - started) * 1000, 1)
+        return result
+    
+    def _group_result(self, key, refresh):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._groups.get(key)
+            if entry is not None and entry[0] > now and not refresh:
+                self.hits += 1
+                return entry[1], True
+            self.misses += 1
+        
+        result = self._list_pixels(*key)
+        # Falhas temporárias não ficam em cache: a próxima verificação tenta de novo
+        if result['token_valid'] is not None:
+            with self._lock:
+                self._groups[key] = (time.monotonic() + self.ttl, result)
+        return result, False
+    
+    def check(self, pixels, refresh=False):
+        """Verifica uma lista de PixelProbe; retorna uma linha da matriz de status por pixel"""
+        groups = sorted({(p.access_token, p.advertiser_id) for p in pixels if p.advertiser_id})
+        results = {}
+        if groups:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, len(groups)))) as executor:
+                for key, outcome in zip(groups, executor.map(lambda key: self._group_result(key, refresh), groups)):
+                    results[key] = outcome
+        
+        matrix = []
+        for pixel in pixels:
+            row = {
+                'id_gestor': pixel.id_gestor,
+                'pixel_id': pixel.pixel_id,
+                'advertiser_id': pixel.advertiser_id,
+                'token': _token_fingerprint(pixel.access_token),
+                'token_valid': None,
+                'pixel_found': None,
+                'status': 'unconfigured',
+                'error': 'advertiser_id não configurado',
+                'checked_at': None,
+                'cached': False
+            }
+            if pixel.advertiser_id:
+                result, cached = results[(pixel.access_token, pixel.advertiser_id)]
+                pixel_found = pixel.pixel_id in result['pixel_codes'] if result['token_valid'] else None
+                if result['token_valid'] is False:
+                    status = 'invalid_token'
+                elif result['token_valid'] is None:
+                    status = 'error'
+                else:
+                    status = 'ok' if pixel_found else 'pixel_not_found'
+                row.update(
+                    token_valid=result['token_valid'],
+                    pixel_found=pixel_found,
+                    status=status,
+                    error=result['error'] if status != 'pixel_not_found' else 'Pixel não encontrado no anunciante',
+                    checked_at=result['checked_at'].isoformat(),
+                    latency_ms=result['latency_ms'],
+                    cached=cached
+                )
+            matrix.append(row)
+        return matrix
+    
+    def clear(self):
+        with self._lock:
+            self._groups.clear()
+    
+    def stats(self):
+        return {
+            'size': len(self._groups),
+            'ttl_seconds': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+pixel_health_checker = PixelHealthChecker()
+
+def check_pixels_health(manager_ids=None, refresh=False, checker=None):
+    """Matriz de status dos pixels ativos (ou só dos gestores em manager_ids)"""
+    query = db.session.query(
+        TikTokPixel.id_gestor, TikTokPixel.pixel_id, TikTokPixel.access_token, TikTokPixel.advertiser_id
+    ).filter(TikTokPixel.ativo == True)  # noqa: E712
+    if manager_ids:
+        query = query.filter(TikTokPixel.id_gestor.in_(manager_ids))
+    pixels = [PixelProbe(*row) for row in query.order_by(TikTokPixel.id_gestor)]
+    # As chamadas ao TikTok acontecem fora da transação
+    db.session.rollback()
+    
+    with STAGE_SECONDS.time('pixel_health'):
+        matrix = (checker or pixel_health_checker).check(pixels, refresh=refresh)
+    return {
+        'checked_at': datetime.utcnow().isoformat(),
+        'total': len(matrix),
+        'tokens': len({row['token'] for row in matrix}),
+        'summary': dict(Counter(row['status'] for row in matrix)),
+        'matrix': matrix
+    }
+
+@app.route('/api/pixels/health', methods=['GET'])
+def pixels_health():
+    """Verificação de saúde de todos os pixels ativos (token e pixel), com cache por token.
+    
+    Parâmetros: id_gestor (lista separada por vírgula), status (filtra a matriz) e refresh=true
+    (ignora o cache).
+    """
+    manager_ids = [m.strip() for m in request.args.get('id_gestor', '').split(',') if m.strip()]
+    refresh = request.args.get('refresh', '').lower() in _TRUE_VALUES
+    report = check_pixels_health(manager_ids or None, refresh=refresh)
+    if request.args.get('status'):
+        statuses = set(request.args['status'].split(','))
+        report['matrix'] = [row for row in report['matrix'] if row['status'] in statuses]
+    return jsonify({'success': True, **report})
+
+LOGS_PAGE_DEFAULT = 50
+LOGS_PAGE_MAX = 500
+
+def _encode_log_cursor(log):
+    """Cursor opaco com a posição (created_at, id) do último log da página"""
+    raw = f"{log.created_at.isoformat()}|{log.id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def _decode_log_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    created_at, log_id = raw.rsplit('|', 1)
+    return datetime.fromisoformat(created_at), int(log_id)
+
+def _parse_datetime_param(value):
+    """Converte um parâmetro ISO 8601 em datetime UTC sem fuso (como gravado no banco)"""
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
 @app.route('/api/pixels/<id_gestor>/logs', methods=['GET'])
 def get_pixel_logs(id_gestor):
-    """Obter logs de eventos de um pixel"""
-    pixel = TikTokPixel.query.filter_by(id_gestor=id_gestor, ativo=True).first()
+    """Obter logs de eventos de um pixel, paginados por cursor (mais recentes primeiro).
+    
+    Parâmetros: limit, cursor, status, event_type, since, until (ISO 8601) e fields
+    (lista separada por vírgula; tiktok_response só é retornado se pedido).
+    """
+    pixel = pixel_cache.get(id_gestor)
     if not pixel:
         return jsonify({'success': False, 'error': 'Pixel não encontrado'}), 404
     
-    logs = EventLog.query.filter_by(pixel_id=pixel.pixel_id).order_by(EventLog.created_at.desc()).limit(50).all()
+    try:
+        limit = min(max(int(request.args.get('limit', LOGS_PAGE_DEFAULT)), 1), LOGS_PAGE_MAX)
+        since = request.args.get('since')
+        until = request.args.get('until')
+        since = _parse_datetime_param(since) if since else None
+        until = _parse_datetime_param(until) if until else None
+        cursor = request.args.get('cursor')
+        cursor = _decode_log_cursor(cursor) if cursor else None
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return jsonify({'success': False, 'error': 'Parâmetros inválidos (limit, cursor, since ou until)'}), 400
+    
+    fields = EventLog.DEFAULT_FIELDS
+    if request.args.get('fields'):
+        fields = tuple(f.strip() for f in request.args['fields'].split(',') if f.strip())
+        invalid = [f for f in fields if f not in EventLog.FIELDS]
+        if invalid:
+            return jsonify({'success': False, 'error': f"Campos inválidos: {', '.join(invalid)}"}), 400
+    
+    query = EventLog.query.filter(EventLog.pixel_id == pixel.pixel_id)
+    if request.args.get('status'):
+        query = query.filter(EventLog.status == request.args['status'])
+    if request.args.get('event_type'):
+        query = query.filter(EventLog.stripe_event_type == request.args['event_type'])
+    if since:
+        query = query.filter(EventLog.created_at >= since)
+    if until:
+        query = query.filter(EventLog.created_at < until)
+    if cursor:
+        query = query.filter(tuple_(EventLog.created_at, EventLog.id) < cursor)
+    
+    # Carregar só as colunas pedidas (id e created_at sempre, para o cursor)
+    columns = {'id', 'created_at'}
+    for field in fields:
+        columns.update(EventLog.FIELD_COLUMNS.get(field, (field,)))
+    query = query.options(load_only(*[getattr(EventLog, c) for c in columns]))
+    if 'tiktok_response' in fields:
+        query = query.options(selectinload(EventLog.response_body))
+    
+    logs = query.order_by(EventLog.created_at.desc(), EventLog.id.desc()).limit(limit + 1).all()
+    has_more = len(logs) > limit
+    logs = logs[:limit]
     
     return jsonify({
         'success': True,
-        'logs': [log.to_dict() for log in logs],
-        'total': len(logs)
+        'logs': [log.to_dict(fields) for log in logs],
+        'total': len(logs),
+        'next_cursor': _encode_log_cursor(logs[-1]) if has_more else None
     })
 
 @app.route('/api/stats', methods=['GET'])
 def get_stats():
-    """Obter estatísticas gerais"""
+    """Obter estatísticas gerais a partir dos rollups de event_stats.
+    
+    Parâmetros opcionais: id_gestor ou pixel_id (filtra um pixel) e, para a série
+    temporal, granularity (hour ou day) com since/until (ISO 8601).
+    """
+    pixel_id = request.args.get('pixel_id')
+    if request.args.get('id_gestor'):
+        pixel = pixel_cache.get(request.args['id_gestor'])
+        if not pixel:
+            return jsonify({'success': False, 'error': 'Pixel não encontrado'}), 404
+        pixel_id = pixel.pixel_id
+    
+    granularity = request.args.get('granularity')
+    if granularity and granularity not in ('hour', 'day'):
+        return jsonify({'success': False, 'error': 'granularity deve ser hour ou day'}), 400
+    try:
+        since = _parse_datetime_param(request.args['since']) if request.args.get('since') else None
+        until = _parse_datetime_param(request.args['until']) if request.args.get('until') else None
+    except ValueError:
+        return jsonify({'success': False, 'error': 'since/until inválidos'}), 400
+    
     total_pixels = TikTokPixel.query.filter_by(ativo=True).count()
-    total_events = EventLog.query.count()
-    success_events = EventLog.query.filter_by(status='success').count()
+    
+    # Totais: bucket "all" (uma linha por pixel e status)
+    query = db.session.query(EventStat.status, func.sum(EventStat.count)).filter(EventStat.granularity == 'all')
+    if pixel_id:
+        query = query.filter(EventStat.pixel_id == pixel_id)
+    by_status = {status: int(count or 0) for status, count in query.group_by(EventStat.status)}
+    
+    total_events = sum(by_status.values())
+    success_events = by_status.get('success', 0)
     
     success_rate = round((success_events / total_events * 100) if total_events > 0 else 0, 1)
     
+    stats = {
+        'total_pixels': total_pixels,
+        'total_events': total_events,
+        'success_rate': success_rate,
+        'by_status': by_status
+    }
+    
+    if granularity:
+        query = (
+            db.session.query(EventStat.bucket_start, EventStat.status, func.sum(EventStat.count))
+            .filter(EventStat.granularity == granularity)
+        )
+        if pixel_id:
+            query = query.filter(EventStat.pixel_id == pixel_id)
+        if since:
+            query = query.filter(EventStat.bucket_start >= since)
+        if until:
+            query = query.filter(EventStat.bucket_start < until)
+        
+        series = OrderedDict()
+        for bucket_start, status, count in query.group_by(EventStat.bucket_start, EventStat.status).order_by(EventStat.bucket_start):
+            series.setdefault(bucket_start.isoformat(), {})[status] = int(count or 0)
+        stats['series'] = [{'bucket_start': bucket, 'by_status': counts} for bucket, counts in series.items()]
+        stats['granularity'] = granularity
+    
+    return jsonify({'success': True, 'stats': stats})
+
+@app.route('/api/outbox', methods=['GET'])
+def get_outbox_stats():
+    """Estado da fila de saída (outbox) por status"""
+    counts = dict(
+        db.session.query(OutboxEvent.status, func.count(OutboxEvent.id))
+        .group_by(OutboxEvent.status)
+        .all()
+    )
+    dead = (
+        OutboxEvent.query.filter_by(status='dead')
+        .order_by(OutboxEvent.id.desc())
+        .limit(20)
+        .all()
+    )
+    
     return jsonify({
         'success': True,
-        'stats': {
-            'total_pixels': total_pixels,
-            'total_events': total_events,
-            'success_rate': success_rate
-        }
+        'outbox': {
+            'pending': counts.get('pending', 0),
+            'processing': counts.get('processing', 0),
+            'done': counts.get('done', 0),
+            'dead': counts.get('dead', 0)
+        },
+        'dead_letters': [e.to_dict() for e in dead]
+    })
+
+@app.route('/api/events/replay', methods=['POST'])
+def replay_events_endpoint():
+    """Reenvia eventos de event_logs ao TikTok, com progresso em NDJSON (uma linha por página).
+    
+    Parâmetros (JSON ou query string): id_gestor ou pixel_id, since, until (ISO 8601), status
+    (padrão error), limit, cursor e dry_run. Cada chamada roda por até REPLAY_REQUEST_MAX_SECONDS;
+    se a última linha vier com finished=false, repita a chamada com o `cursor` dela.
+    """
+    params = {**request.args.to_dict(), **(request.get_json(silent=True) or {})}
+    pixel_id = params.get('pixel_id')
+    if params.get('id_gestor'):
+        pixel = pixel_cache.get(params['id_gestor'])
+        if not pixel:
+            return jsonify({'success': False, 'error': 'Pixel não encontrado'}), 404
+        pixel_id = pixel.pixel_id
+    
+    try:
+        since = _parse_datetime_param(params['since']) if params.get('since') else None
+        until = _parse_datetime_param(params['until']) if params.get('until') else None
+        limit = int(params['limit']) if params.get('limit') else None
+        if params.get('cursor'):
+            _decode_log_cursor(params['cursor'])
+    except (ValueError, TypeError, UnicodeDecodeError):
+        return jsonify({'success': False, 'error': 'Parâmetros inválidos (since, until, limit ou cursor)'}), 400
+    statuses = params.get('status') or 'error'
+    statuses = tuple(statuses.split(',')) if isinstance(statuses, str) else tuple(statuses)
+    dry_run = str(params.get('dry_run', '')).lower() in _TRUE_VALUES
+    
+    progress = replay_events(
+        pixel_id=pixel_id, since=since, until=until, statuses=statuses, cursor=params.get('cursor'),
+        limit=limit, dry_run=dry_run, max_seconds=REPLAY_REQUEST_MAX_SECONDS
+    )
+    return Response(
+        stream_with_context(json_dumps_bytes(line) + b'\n' for line in progress),
+        mimetype='application/x-ndjson'
+    )
+
+@app.route('/api/outbox/dead/requeue', methods=['POST'])
+def requeue_dead_letters():
+    """Recoloca na fila os eventos em dead-letter"""
+    requeued = OutboxEvent.query.filter_by(status='dead').update({
+        'status': 'pending',
+        'attempts': 0,
+        'next_attempt_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    
+    return jsonify({'success': True, 'requeued': requeued})
+
+@app.route('/api/cache', methods=['GET'])
+def get_cache_stats():
+    """Contadores dos caches em memória deste worker"""
+    return jsonify({
+        'success': True,
+        'pid': os.getpid(),
+        'pixels': pixel_cache.stats(),
+        'stripe_events': recent_stripe_events.stats(),
+        'event_log_writer': event_log_writer.stats(),
+        'response_bodies': known_response_hashes.stats(),
+        'identities': identity_hasher.stats(),
+        'pixel_health': pixel_health_checker.stats()
     })
 
+@app.route('/api/routing', methods=['GET'])
+def get_routing():
+    """Estado das regras de roteamento carregadas neste worker"""
+    return jsonify({'success': True, 'pid': os.getpid(), 'routing': routing_table.stats()})
+
+def _outbox_depth():
+    rows = db.session.query(OutboxEvent.status, func.count(OutboxEvent.id)).group_by(OutboxEvent.status)
+    depth = {status: 0 for status in ('pending', 'processing', 'done', 'dead')}
+    depth.update({status: count for status, count in rows})
+    return {(status,): count for status, count in depth.items()}
+
+def _outbox_oldest_pending_age():
+    oldest = db.session.query(func.min(OutboxEvent.created_at)).filter(OutboxEvent.status == 'pending').scalar()
+    return {(): (datetime.utcnow() - oldest).total_seconds() if oldest else 0}
+
+metrics.gauge('tiktoktracking_outbox_events', 'Eventos na outbox por status', ('status',),
+              collect=_outbox_depth, per_process=False)
+metrics.gauge('tiktoktracking_outbox_oldest_pending_age_seconds', 'Idade do evento pendente mais antigo da outbox',
+              collect=_outbox_oldest_pending_age, per_process=False)
+metrics.gauge('tiktoktracking_event_log_buffered', 'Logs de eventos no buffer aguardando gravação',
+              collect=lambda: {(): len(event_log_writer._buffer)})
+metrics.counter('tiktoktracking_event_log_flushed_rows_total', 'Logs de eventos gravados pelo buffer',
+                collect=lambda: {(): event_log_writer.flushed_rows})
+metrics.counter('tiktoktracking_event_log_failed_flushes_total', 'Falhas ao gravar o buffer de logs',
+                collect=lambda: {(): event_log_writer.failed_flushes})
+metrics.counter('tiktoktracking_cache_hits_total', 'Acertos dos caches em memória', ('cache',), collect=lambda: {
+    ('pixels',): pixel_cache.hits,
+    ('stripe_events',): recent_stripe_events.duplicates,
+    ('response_bodies',): known_response_hashes.duplicates,
+    ('identities',): identity_hasher.hits
+})
+metrics.counter('tiktoktracking_cache_misses_total', 'Faltas dos caches em memória', ('cache',), collect=lambda: {
+    ('pixels',): pixel_cache.misses,
+    ('stripe_events',): recent_stripe_events.misses,
+    ('response_bodies',): known_response_hashes.misses,
+    ('identities',): identity_hasher.misses
+})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Métricas no formato texto do Prometheus (somadas entre os processos da máquina)"""
+    try:
+        body = metrics.render()
+    finally:
+        db.session.rollback()
+    return body, 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/webhook/stripe/test', methods=['POST'])
 def test_webhook():
     """Teste de simulação - NÃO envia para TikTok"""
@@ -476,24 +3608,20 @@ def test_webhook():
         )
         return jsonify({'success': False, 'error': 'JSON obrigatório'}), 400
     
-    # Extrair ID do gestor dos metadados
-    metadata = data.get('data', {}).get('object', {}).get('metadata', {})
-    manager_id = metadata.get('utm_term')
-    
-    if not manager_id:
-        return jsonify({'success': False, 'error': 'utm_term não encontrado'}), 400
-    
-    # Buscar pixel
-    pixel = TikTokPixel.query.filter_by(id_gestor=manager_id, ativo=True).first()
-    if not pixel:
-        return jsonify({'success': False, 'error': f'Pixel não encontrado para gestor {manager_id}'}), 404
+    # Mesmo roteamento do webhook real (útil para testar as regras)
+    targets, missing = resolve_stripe_targets(data)
+    if not targets:
+        return jsonify({'success': False, 'error': f"Pixel não encontrado para gestor {', '.join(missing) or '(nenhum)'}"}), 404
     
+    manager_id, pixel = targets[0]
     return jsonify({
         'success': True,
         'message': 'Teste de webhook processado com sucesso',
         'event_id': data.get('id'),
         'manager_id': manager_id,
         'pixel_id': pixel.pixel_id,
+        'targets': [{'manager_id': target_id, 'pixel_id': target.pixel_id} for target_id, target in targets],
+        'missing': missing,
         'test_mode': True
     })
 
@@ -505,25 +3633,14 @@ def test_webhook_real():
     if not data:
         return jsonify({'success': False, 'error': 'JSON obrigatório'}), 400
     
-    # Extrair ID do gestor
-    metadata = data.get('data', {}).get('object', {}).get('metadata', {})
-    manager_id = metadata.get('utm_term')
-    
-    # Se não houver utm_term, usar pixel padrão
-    if not manager_id:
-        manager_id = 'prod-1'  # Pixel padrão
-        print(f"utm_term não encontrado, usando pixel padrão: {manager_id}")
-    
-    # Buscar pixel
-    pixel = TikTokPixel.query.filter_by(id_gestor=manager_id, ativo=True).first()
-    if not pixel:
-        return jsonify({'success': False, 'error': f'Pixel não encontrado para gestor {manager_id}'}), 404
-    
-    # Criar cliente TikTok
-    tiktok_client = TikTokEventsAPI(pixel.access_token, pixel.pixel_id)
+    # Gestores de destino (mesmo roteamento do webhook real)
+    targets, missing = resolve_stripe_targets(data)
+    if not targets:
+        return jsonify({'success': False, 'error': f"Pixel não encontrado para gestor {', '.join(missing) or '(nenhum)'}"}), 404
     
     # Preparar dados do evento
     event_obj = data.get('data', {}).get('object', {})
+    metadata = event_obj.get('metadata', {})
     event_data = {
         'stripe_event_id': data.get('id'),
         'value': event_obj.get('amount', 9999) / 100,  # Converter centavos
@@ -532,119 +3649,220 @@ def test_webhook_real():
         'email': metadata.get('customer_email', 'test@example.com')
     }
     
-    # ENVIAR PARA TIKTOK DE VERDADE
-    result = tiktok_client.send_purchase_event(event_data)
-    
-    # Salvar log
-    log = EventLog(
-        pixel_id=pixel.pixel_id,
-        stripe_event_id=data.get('id'),
-        stripe_event_type=data.get('type'),
-        status='success' if result['success'] else 'error',
-        error_message=result.get('error'),
-        tiktok_response=json.dumps(result.get('tiktok_response', {}))
-    )
-    db.session.add(log)
-    db.session.commit()
+    # ENVIAR PARA TIKTOK DE VERDADE (um envio por pixel de destino)
+    results = []
+    for manager_id, pixel in targets:
+        result = TikTokEventsAPI(pixel.access_token, pixel.pixel_id).send_purchase_event(event_data)
+        event_log_writer.write(_event_log_row(pixel.pixel_id, data.get('id'), data.get('type'), result))
+        results.append({'manager_id': manager_id, 'pixel_id': pixel.pixel_id, 'tiktok_result': result})
     
+    first = results[0]
     return jsonify({
-        'success': result['success'],
-        'message': result.get('message', result.get('error')),
+        'success': all(item['tiktok_result']['success'] for item in results),
+        'message': first['tiktok_result'].get('message', first['tiktok_result'].get('error')),
         'event_id': data.get('id'),
-        'manager_id': manager_id,
-        'pixel_id': pixel.pixel_id,
-        'tiktok_result': result,
+        'manager_id': first['manager_id'],
+        'pixel_id': first['pixel_id'],
+        'tiktok_result': first['tiktok_result'],
+        'targets': results,
         'real_send': True
     })
 
-def validate_stripe_signature(payload, signature, endpoint_secret):
-    """Valida assinatura do webhook Stripe"""
-    try:
-        import hmac
-        import hashlib
-        
-        if not signature or not endpoint_secret:
-            return False
-            
-        # Extrair timestamp e assinatura
-        elements = signature.split(',')
-        timestamp = None
-        signatures = []
-        
-        for element in elements:
-            key, value = element.split('=', 1)
-            if key == 't':
-                timestamp = value
-            elif key == 'v1':
-                signatures.append(value)
-        
-        if not timestamp or not signatures:
-            return False
-            
-        # Criar payload para verificação
-        signed_payload = f"{timestamp}.{payload}"
-        
-        # Verificar assinatura
-        expected_signature = hmac.new(
-            endpoint_secret.encode('utf-8'),
-            signed_payload.encode('utf-8'),
-            hashlib.sha256
-        ).hexdigest()
-        
-        return any(hmac.compare_digest(expected_signature, sig) for sig in signatures)
-    except Exception as e:
-        print(f"Erro na validação da assinatura: {e}")
-        return False
+# Eventos do Stripe que viram Purchase no TikTok
+STRIPE_PURCHASE_EVENT_TYPES = ('payment_intent.succeeded', 'checkout.session.completed')
 
-@app.route('/webhook/stripe', methods=['POST'])
-def stripe_webhook():
-    """Webhook real do Stripe com validação de assinatura"""
-    try:
-        # Obter payload raw para validação de assinatura
-        payload = request.get_data(as_text=True)
-        signature = request.headers.get('Stripe-Signature', '')
-        
-        # Validar assinatura Stripe (em produção)
-        stripe_endpoint_secret = os.getenv('STRIPE_ENDPOINT_SECRET')
-        if stripe_endpoint_secret and not validate_stripe_signature(payload, signature, stripe_endpoint_secret):
-            app.logger.warning("Assinatura Stripe inválida")
-            return jsonify({'success': False, 'error': 'Assinatura inválida'}), 400
-        
-        # Parse JSON após validação
-        data = request.get_json(silent=True)
+# Roteamento dos eventos Stripe para pixels (ROUTING_RULES_FILE, recarregado quando o arquivo muda)
+ROUTING_RULES_FILE = os.getenv('ROUTING_RULES_FILE', '')
+ROUTING_RELOAD_CHECK_SECONDS = float(os.getenv('ROUTING_RELOAD_CHECK_SECONDS', 2))
+DEFAULT_ID_GESTOR = os.getenv('DEFAULT_ID_GESTOR', 'prod-1')
+
+# Campos aceitos nas regras, além de metadata.<chave>
+ROUTING_FIELDS = ('account', 'currency', 'product', 'price', 'type')
+
+CompiledRoutes = namedtuple('CompiledRoutes', ['lookup', 'fields', 'utm_term', 'default', 'rules'])
+
+def _routing_values(value):
+    values = value if isinstance(value, list) else [value]
+    if not values or not all(isinstance(item, (str, int)) and str(item) for item in values):
+        raise ValueError(f"valor inválido: {value!r}")
+    return [str(item) for item in values]
+
+def compile_routing_rules(config, default=DEFAULT_ID_GESTOR):
+    """Compila as regras de roteamento em tabelas de lookup (levanta ValueError se inválidas).
+    
+    Formato:
+        {"utm_term": true, "default": "prod-1",
+         "rules": [{"match": {"metadata.campanha": "bf", "currency": ["usd", "eur"]},
+                    "id_gestor": ["prod-2", "prod-3"]}]}
+    
+    As regras são agrupadas pelo conjunto de campos que usam; cada grupo vira um dict
+    (valores dos campos) -> gestores. Avaliar um evento custa um lookup por grupo, não por regra.
+    """
+    if not isinstance(config, dict):
+        raise ValueError('o arquivo de regras deve ser um objeto JSON')
+    rules = config.get('rules', [])
+    if not isinstance(rules, list):
+        raise ValueError('rules deve ser uma lista')
+    
+    lookup = {}
+    for index, rule in enumerate(rules, start=1):
+        try:
+            match = rule['match']
+            if not isinstance(match, dict) or not match:
+                raise ValueError('match deve ser um objeto com ao menos um campo')
+            for field in match:
+                if field not in ROUTING_FIELDS and not (field.startswith('metadata.') and len(field) > 9):
+                    raise ValueError(f"campo desconhecido: {field}")
+            targets = tuple(_routing_values(rule['id_gestor']))
+            signature = tuple(sorted(match))
+            options = [_routing_values(match[field]) for field in signature]
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"regra {index}: {e}") from None
         
-        if not data:
-            app.logger.warning(
-                f"stripe_webhook: JSON ausente ou inválido. Content-Type={request.content_type}"
-            )
-            return jsonify({'success': False, 'error': 'JSON obrigatório'}), 400
-    except Exception as e:
-        app.logger.error(f"Erro no webhook Stripe: {e}")
-        return jsonify({'success': False, 'error': 'Erro interno'}), 500
+        table = lookup.setdefault(signature, {})
+        for values in itertools.product(*options):
+            key = tuple(value.lower() if field == 'currency' else value for field, value in zip(signature, values))
+            current = table.setdefault(key, [])
+            current.extend(target for target in targets if target not in current)
     
-    # Processar apenas eventos de pagamento bem-sucedidos
-    if data.get('type') not in ['payment_intent.succeeded', 'checkout.session.completed']:
-        return jsonify({'success': True, 'message': 'Evento ignorado'}), 200
+    return CompiledRoutes(
+        lookup=lookup,
+        fields=frozenset(field for signature in lookup for field in signature),
+        utm_term=bool(config.get('utm_term', True)),
+        default=config.get('default', default) or None,
+        rules=len(rules)
+    )
+
+def _routing_field_values(data, fields):
+    """Valores de cada campo usado nas regras (produto e preço podem ter vários, um por item)"""
+    event_obj = data.get('data', {}).get('object', {})
+    values = {}
+    for field in fields:
+        if field.startswith('metadata.'):
+            value = (event_obj.get('metadata') or {}).get(field[9:])
+            found = [str(value)] if value not in (None, '') else []
+        elif field == 'account':
+            found = [data['account']] if data.get('account') else []
+        elif field == 'currency':
+            found = [event_obj['currency'].lower()] if event_obj.get('currency') else []
+        elif field == 'type':
+            found = [data['type']] if data.get('type') else []
+        else:
+            # Itens só vêm no evento quando expandidos (line_items) na exportação ou no webhook
+            found = []
+            for item in (event_obj.get('line_items') or {}).get('data', []):
+                price = item.get('price') or {}
+                value = price.get('id') if field == 'price' else price.get('product')
+                if isinstance(value, dict):
+                    value = value.get('id')
+                if value and value not in found:
+                    found.append(value)
+        values[field] = found
+    return values
+
+class RoutingTable:
+    """Regras de roteamento compiladas: evento Stripe -> gestores (id_gestor) de destino.
     
-    # Extrair ID do gestor
-    metadata = data.get('data', {}).get('object', {}).get('metadata', {})
-    manager_id = metadata.get('utm_term')
+    Um evento vai para todos os gestores das regras que casam, mais o metadata.utm_term (se
+    habilitado); sem nenhum, para o gestor padrão. O arquivo é verificado no máximo a cada
+    ROUTING_RELOAD_CHECK_SECONDS e recompilado quando o mtime muda; regras inválidas são
+    recusadas e as anteriores continuam valendo.
+    """
     
-    # Se não houver utm_term, usar pixel padrão
-    if not manager_id:
-        manager_id = 'prod-1'  # Pixel padrão
-        print(f"utm_term não encontrado, usando pixel padrão: {manager_id}")
+    def __init__(self, path=ROUTING_RULES_FILE, default=DEFAULT_ID_GESTOR, check_interval=ROUTING_RELOAD_CHECK_SECONDS):
+        self.path = path
+        self.default = default
+        self.check_interval = check_interval
+        self._routes = compile_routing_rules({}, default)
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._checked_at = 0.0
+        self.reloads = 0
+        self.errors = 0
+        self.last_error = None
     
-    # Buscar pixel
-    pixel = TikTokPixel.query.filter_by(id_gestor=manager_id, ativo=True).first()
-    if not pixel:
-        return jsonify({'success': False, 'error': f'Pixel não encontrado para gestor {manager_id}'}), 404
+    def _check_reload(self):
+        now = time.monotonic()
+        if not self.path or now - self._checked_at < self.check_interval:
+            return
+        with self._lock:
+            if now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError as e:
+                mtime = None
+                if self._mtime is not None:
+                    app.logger.error(f"Arquivo de roteamento indisponível ({self.path}): {e}; mantendo as regras atuais")
+            if mtime is None or mtime == self._mtime:
+                return
+            self._mtime = mtime
+            try:
+                with open(self.path, 'rb') as f:
+                    self._routes = compile_routing_rules(json_loads(f.read()), self.default)
+            except (OSError, ValueError) as e:
+                self.errors += 1
+                self.last_error = str(e)
+                app.logger.error(f"Regras de roteamento inválidas em {self.path}: {e}; mantendo as regras atuais")
+                return
+            self.reloads += 1
+            self.last_error = None
+            app.logger.info(f"🧭 Regras de roteamento carregadas: {self._routes.rules} regras ({self.path})")
     
-    # Criar cliente TikTok
-    tiktok_client = TikTokEventsAPI(pixel.access_token, pixel.pixel_id)
+    def resolve(self, data):
+        """Gestores de destino do evento, sem repetição, na ordem: regras, utm_term, padrão"""
+        self._check_reload()
+        routes = self._routes
+        targets = []
+        if routes.lookup:
+            values = _routing_field_values(data, routes.fields)
+            for signature, table in routes.lookup.items():
+                for key in itertools.product(*(values[field] for field in signature)):
+                    for manager_id in table.get(key, ()):
+                        if manager_id not in targets:
+                            targets.append(manager_id)
+        if routes.utm_term:
+            manager_id = (data.get('data', {}).get('object', {}).get('metadata') or {}).get('utm_term')
+            if manager_id and manager_id not in targets:
+                targets.append(manager_id)
+        if not targets and routes.default:
+            app.logger.debug(f"Nenhuma regra nem utm_term, usando pixel padrão: {routes.default}")
+            targets.append(routes.default)
+        return targets
     
-    # Preparar dados do evento com extração melhorada
+    def stats(self):
+        self._check_reload()
+        routes = self._routes
+        return {
+            'file': self.path or None,
+            'rules': routes.rules,
+            'groups': len(routes.lookup),
+            'keys': sum(len(table) for table in routes.lookup.values()),
+            'utm_term': routes.utm_term,
+            'default': routes.default,
+            'reloads': self.reloads,
+            'errors': self.errors,
+            'last_error': self.last_error
+        }
+
+routing_table = RoutingTable()
+
+def resolve_stripe_targets(data):
+    """Destinos do evento Stripe: ([(id_gestor, PixelConfig) dos pixels ativos], [gestores sem pixel])"""
+    targets, missing = [], []
+    for manager_id in routing_table.resolve(data):
+        pixel = pixel_cache.get(manager_id)
+        if pixel:
+            targets.append((manager_id, pixel))
+        else:
+            missing.append(manager_id)
+    return targets, missing
+
+def extract_event_data(data):
+    """Extrai do evento Stripe os dados do evento de compra para o TikTok (valor, moeda, cliente)"""
     event_obj = data.get('data', {}).get('object', {})
+    metadata = event_obj.get('metadata', {})
     
     # Extrair dados do cliente de múltiplas fontes
     customer_email = (
@@ -675,7 +3893,7 @@ def stripe_webhook():
     else:
         amount = event_obj.get('amount', 0)
     
-    event_data = {
+    return {
         'stripe_event_id': data.get('id'),
         'value': amount / 100,  # Converter centavos
         'currency': event_obj.get('currency', 'brl'),
@@ -683,34 +3901,246 @@ def stripe_webhook():
         'email': customer_email,
         'phone': customer_phone,
         'customer_name': customer_name,
-        'page_url': event_obj.get('success_url', 'https://checkout.stripe.com/success')
+        'page_url': event_obj.get('success_url', 'https://checkout.stripe.com/success'),
+        # Horário da compra no Stripe: reenvios e replays da outbox mantêm o event_time original
+        'event_time': _epoch_seconds(data.get('created'))
     }
+
+# Tolerância (segundos) entre o timestamp assinado pelo Stripe e o relógio local; 0 desliga
+STRIPE_SIGNATURE_TOLERANCE = int(os.getenv('STRIPE_SIGNATURE_TOLERANCE', 300))
+
+class StripeSignatureVerifier:
+    """Verifica o cabeçalho Stripe-Signature sobre o corpo bruto (bytes) da requisição.
     
-    print(f"Dados extraídos do Stripe: {json.dumps(event_data, indent=2, ensure_ascii=False)}")
+    Cada segredo vira um HMAC-SHA256 já com a chave aplicada; por requisição só é feita uma
+    cópia dele e o timestamp e o corpo são passados sem montar uma nova string. Aceita vários
+    segredos (rotação do endpoint secret no Stripe) e rejeita timestamps fora da tolerância.
+    """
     
-    # Enviar para TikTok
-    result = tiktok_client.send_purchase_event(event_data)
+    def __init__(self, endpoint_secrets, tolerance=STRIPE_SIGNATURE_TOLERANCE):
+        self._keyed = [
+            hmac.new(secret.encode('utf-8'), digestmod=hashlib.sha256)
+            for secret in endpoint_secrets if secret
+        ]
+        self.tolerance = tolerance
     
-    # Salvar log
-    log = EventLog(
-        pixel_id=pixel.pixel_id,
-        stripe_event_id=data.get('id'),
-        stripe_event_type=data.get('type'),
-        status='success' if result['success'] else 'error',
-        error_message=result.get('error'),
-        tiktok_response=json.dumps(result.get('tiktok_response', {}))
-    )
-    db.session.add(log)
-    db.session.commit()
+    @classmethod
+    def from_env(cls):
+        """Segredos de STRIPE_ENDPOINT_SECRET (separados por vírgula durante uma rotação)"""
+        secrets_env = os.getenv('STRIPE_ENDPOINT_SECRET', '')
+        return cls([secret.strip() for secret in secrets_env.split(',')])
+    
+    @property
+    def enabled(self):
+        return bool(self._keyed)
+    
+    def verify(self, payload, header, now=None):
+        if not header or not self._keyed:
+            return False
+        
+        # Extrair timestamp e assinaturas (t=...,v1=...,v1=...)
+        timestamp = None
+        signatures = []
+        for element in header.split(','):
+            key, _, value = element.strip().partition('=')
+            if key == 't':
+                timestamp = value
+            elif key == 'v1':
+                signatures.append(value)
+        if not timestamp or not timestamp.isdigit() or not signatures:
+            return False
+        
+        if self.tolerance and abs((now or time.time()) - int(timestamp)) > self.tolerance:
+            return False
+        
+        prefix = timestamp.encode('ascii') + b'.'
+        for keyed in self._keyed:
+            mac = keyed.copy()
+            mac.update(prefix)
+            mac.update(payload)
+            expected = mac.hexdigest()
+            if any(hmac.compare_digest(expected, signature) for signature in signatures):
+                return True
+        return False
+
+stripe_signature_verifier = StripeSignatureVerifier.from_env()
+
+def validate_stripe_signature(payload, signature, endpoint_secret):
+    """Valida assinatura do webhook Stripe (sem checar o timestamp; ver StripeSignatureVerifier)"""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return StripeSignatureVerifier([endpoint_secret], tolerance=0).verify(payload, signature)
+
+@app.route('/webhook/stripe', methods=['POST'])
+def stripe_webhook():
+    """Webhook real do Stripe com validação de assinatura"""
+    started = time.perf_counter()
+    response = app.make_response(_stripe_webhook())
+    WEBHOOK_SECONDS.observe(time.perf_counter() - started, response.status_code)
+    return response
+
+def _stripe_webhook():
+    try:
+        # Corpo bruto (bytes): a assinatura é validada e o JSON é lido do mesmo buffer
+        payload = request.get_data(cache=False)
+        signature = request.headers.get('Stripe-Signature', '')
+        
+        # Validar assinatura Stripe (em produção)
+        with STAGE_SECONDS.time('signature'):
+            valid_signature = not stripe_signature_verifier.enabled or stripe_signature_verifier.verify(payload, signature)
+        if not valid_signature:
+            app.logger.warning("Assinatura Stripe inválida ou expirada")
+            return jsonify({'success': False, 'error': 'Assinatura inválida'}), 400
+        
+        # Parse JSON após validação
+        with STAGE_SECONDS.time('parse'):
+            try:
+                data = json_loads(payload) if payload else None
+            except ValueError:
+                data = None
+        
+        if not data:
+            app.logger.warning(
+                f"stripe_webhook: JSON ausente ou inválido. Content-Type={request.content_type}"
+            )
+            return jsonify({'success': False, 'error': 'JSON obrigatório'}), 400
+    except Exception as e:
+        app.logger.error(f"Erro no webhook Stripe: {e}")
+        return jsonify({'success': False, 'error': 'Erro interno'}), 500
+    
+    # Processar apenas eventos de pagamento bem-sucedidos
+    if data.get('type') not in STRIPE_PURCHASE_EVENT_TYPES:
+        return jsonify({'success': True, 'message': 'Evento ignorado'}), 200
+    
+    # Reenvio do Stripe de um evento já enfileirado: responder sem fazer nada
+    stripe_event_id = data.get('id')
+    if recent_stripe_events.seen(stripe_event_id):
+        return jsonify({'success': True, 'message': 'Evento duplicado ignorado', 'event_id': stripe_event_id, 'duplicate': True}), 200
+    
+    # Gestores de destino (regras de roteamento, utm_term ou pixel padrão) e seus pixels
+    with STAGE_SECONDS.time('pixel_lookup'):
+        targets, missing = resolve_stripe_targets(data)
+    if not targets:
+        return jsonify({'success': False, 'error': f"Pixel não encontrado para gestor {', '.join(missing) or '(nenhum)'}"}), 404
+    if missing:
+        app.logger.warning(f"Evento {stripe_event_id}: pixel não encontrado para {', '.join(missing)}")
+    
+    # Preparar dados do evento com extração melhorada
+    event_data = extract_event_data(data)
+    
+    log_payload("Dados extraídos do Stripe", event_data, stripe_event_id=stripe_event_id)
     
+    # Enfileirar na outbox (uma linha por pixel, mesmo commit): o envio é feito pelo dispatcher
+    with STAGE_SECONDS.time('enqueue_commit'):
+        serialized = json_dumps(event_data)
+        inserted = enqueue_outbox_events([
+            outbox_row(manager_id, pixel.pixel_id, stripe_event_id, data.get('type'), serialized)
+            for manager_id, pixel in targets
+        ])
+        db.session.commit()
+    recent_stripe_events.add(stripe_event_id)
+    if not inserted:
+        # Outro worker já enfileirou este evento (índice único em event_outbox)
+        return jsonify({'success': True, 'message': 'Evento duplicado ignorado', 'event_id': stripe_event_id, 'duplicate': True}), 200
+    
+    manager_id, pixel = targets[0]
     return jsonify({
-        'success': result['success'],
-        'message': result.get('message', result.get('error')),
+        'success': True,
+        'message': 'Evento enfileirado para envio ao TikTok',
         'event_id': data.get('id'),
         'manager_id': manager_id,
-        'pixel_id': pixel.pixel_id
+        'pixel_id': pixel.pixel_id,
+        'targets': [{'manager_id': target_id, 'pixel_id': target.pixel_id} for target_id, target in targets],
+        'queued': True
     })
 
+# Importação (backfill) de eventos exportados do Stripe
+STRIPE_IMPORT_CHUNK = int(os.getenv('STRIPE_IMPORT_CHUNK', 1000))
+
+def _import_stripe_chunk(candidates, dry_run):
+    """Descarta os eventos já registrados (event_logs ou outbox) e enfileira o resto em uma instrução.
+    
+    Retorna (enfileirados, duplicados).
+    """
+    event_ids = list({entry['stripe_event_id'] for entry in candidates})
+    logged = set(
+        db.session.query(EventLog.stripe_event_id, EventLog.pixel_id)
+        .filter(EventLog.stripe_event_id.in_(event_ids))
+    )
+    queued = set(
+        db.session.query(OutboxEvent.stripe_event_id, OutboxEvent.id_gestor)
+        .filter(OutboxEvent.stripe_event_id.in_(event_ids))
+    )
+    rows = [
+        entry for entry in candidates
+        if (entry['stripe_event_id'], entry['pixel_id']) not in logged
+        and (entry['stripe_event_id'], entry['id_gestor']) not in queued
+    ]
+    if dry_run or not rows:
+        db.session.rollback()
+        return len(rows), len(candidates) - len(rows)
+    
+    # ON CONFLICT cobre um webhook que enfileire o mesmo evento durante a importação
+    inserted = enqueue_outbox_events(rows)
+    db.session.commit()
+    for event_id, _ in inserted:
+        recent_stripe_events.add(event_id)
+    return len(inserted), len(candidates) - len(inserted)
+
+def import_stripe_events(events, chunk_size=STRIPE_IMPORT_CHUNK, dry_run=False):
+    """Enfileira na outbox eventos Stripe exportados (compras que não chegaram ao webhook).
+    
+    Usa a mesma extração do webhook (utm_term → pixel, valor, e-mail/telefone) e mantém o
+    horário original do evento. Os eventos são lidos de `events` (iterável de dicts) em blocos
+    de `chunk_size`; cada bloco é deduplicado contra event_logs e a outbox e gravado em uma única
+    instrução. O envio ao TikTok, em lotes por pixel, fica com o dispatcher.
+    
+    Gera um dict de progresso por bloco.
+    """
+    counts = Counter()
+    started = time.monotonic()
+    candidates = []
+    seen = set()
+    
+    def flush(kind):
+        if candidates:
+            with STAGE_SECONDS.time('stripe_import'):
+                enqueued, duplicates = _import_stripe_chunk(candidates, dry_run)
+            counts['would_enqueue' if dry_run else 'enqueued'] += enqueued
+            counts['duplicates'] += duplicates
+            candidates.clear()
+            seen.clear()
+        elapsed = time.monotonic() - started
+        return {'type': kind, **counts, 'elapsed_seconds': round(elapsed, 1), 'events_per_second': round(counts['read'] / elapsed) if elapsed else None}
+    
+    for data in events:
+        counts['read'] += 1
+        stripe_event_id = data.get('id') if isinstance(data, dict) else None
+        if not stripe_event_id:
+            counts['invalid'] += 1
+            continue
+        if data.get('type') not in STRIPE_PURCHASE_EVENT_TYPES:
+            counts['ignored'] += 1
+            continue
+        
+        targets, missing = resolve_stripe_targets(data)
+        counts['no_pixel'] += len(missing)
+        fresh = [(manager_id, pixel) for manager_id, pixel in targets if (stripe_event_id, manager_id) not in seen]
+        counts['duplicates'] += len(targets) - len(fresh)
+        if not fresh:
+            continue
+        
+        event_data = extract_event_data(data)
+        serialized = json_dumps(event_data)
+        now = datetime.utcnow()
+        for manager_id, pixel in fresh:
+            seen.add((stripe_event_id, manager_id))
+            candidates.append(outbox_row(manager_id, pixel.pixel_id, stripe_event_id, data['type'], serialized, now))
+        if len(candidates) >= chunk_size:
+            yield flush('progress')
+    
+    yield flush('done')
+
 @app.route('/create-payment-intent', methods=['POST'])
 def create_payment_intent():
     """Criar Payment Intent para teste"""
@@ -758,21 +4188,59 @@ def index():
 def static_files(path):
     return send_from_directory('static', path)
 
-if __name__ == '__main__':
+# Colunas adicionadas a tabelas que já existiam (db.create_all não altera tabelas existentes)
+SCHEMA_COLUMNS = (
+    ('event_logs', 'response_hash', 'VARCHAR(64)'),
+    ('event_logs', 'tiktok_request_id', 'VARCHAR(100)'),
+    ('event_logs', 'event_payload', 'TEXT'),
+    ('tiktok_pixels', 'advertiser_id', 'VARCHAR(50)')
+)
+
+def ensure_schema_columns():
+    """Adiciona as colunas de SCHEMA_COLUMNS que faltam; retorna as criadas (tabela.coluna)"""
+    inspector = inspect(db.engine)
+    added = []
+    for table, column, ddl in SCHEMA_COLUMNS:
+        if not inspector.has_table(table):
+            continue
+        if column in {existing['name'] for existing in inspector.get_columns(table)}:
+            continue
+        db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+        added.append(f"{table}.{column}")
+    db.session.commit()
+    return added
+
+def init_db():
+    """Cria/verifica as tabelas do banco"""
     with app.app_context():
         try:
             db.create_all()
-            print("✅ Tabelas criadas/verificadas com sucesso")
+            app.logger.info("✅ Tabelas criadas/verificadas com sucesso")
+            added = ensure_schema_columns()
+            if added:
+                app.logger.info(f"✅ Colunas adicionadas: {', '.join(added)}")
+            created = ensure_event_log_partitions()
+            if created:
+                app.logger.info(f"✅ Partições de event_logs criadas: {', '.join(created)}")
+            if seed_event_stats():
+                app.logger.info("✅ event_stats preenchida a partir de event_logs")
         except Exception as e:
-            print(f"⚠️  Erro ao criar tabelas: {e}")
-            print("   Continuando mesmo assim...")
+            app.logger.warning(f"⚠️  Erro ao criar tabelas: {e} (continuando mesmo assim)")
+
+def outbox_dispatcher_thread_enabled():
+    """Indica se o dispatcher da outbox deve rodar em uma thread do app"""
+    return os.getenv('OUTBOX_DISPATCHER_THREAD', 'true').lower() == 'true'
+
+if __name__ == '__main__':
+    init_db()
+    
+    if outbox_dispatcher_thread_enabled():
+        start_outbox_dispatcher()
     
     host = os.getenv('HOST', '0.0.0.0')
     port = int(os.getenv('PORT', 5000))
     debug = os.getenv('DEBUG', 'False').lower() == 'true'
     
-    print(f"🚀 Iniciando servidor em {host}:{port}")
-    print(f"   Debug: {debug}")
-    print(f"   Ambiente: {os.getenv('APP_ENV', 'development')}")
+    app.logger.info(f"🚀 Iniciando servidor em {host}:{port} (debug: {debug}, ambiente: {os.getenv('APP_ENV', 'development')})")
     
     app.run(host=host, port=port, debug=debug)
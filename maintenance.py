@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+import argparse
+from dotenv import load_dotenv
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+from main import (  # noqa: E402
+    app, db, rebuild_event_stats, ensure_event_log_partitions, apply_event_log_retention,
+    purge_outbox, event_logs_is_partitioned, compact_legacy_tiktok_responses, check_pixels_health,
+    json_dumps, PixelHealthChecker, replay_events, pixel_cache, _parse_datetime_param, EVENT_LOG_PARTITION_MONTHS_AHEAD, EVENT_LOG_RETENTION_MONTHS,
+    EVENT_LOG_ARCHIVE_DIR, HEALTH_CHECK_CONCURRENCY, REPLAY_PAGE_SIZE
+)
+
+def cmd_rebuild_stats(args):
+    """Recalcular os rollups de event_stats a partir de event_logs"""
+    print("📊 Recalculando event_stats...")
+    rebuild_event_stats()
+    print("✅ event_stats recalculado")
+
+def cmd_partitions(args):
+    """Criar as partições mensais de event_logs dos próximos meses"""
+    if not event_logs_is_partitioned():
+        print("⚠️  event_logs não é particionada (execute partition_event_logs.sql no PostgreSQL)")
+        return
+    created = ensure_event_log_partitions(args.months_ahead)
+    print(f"✅ Partições criadas: {', '.join(created)}" if created else "✅ Partições já existentes")
+
+def cmd_retention(args):
+    """Arquivar (gzip JSONL) e remover/compactar partições antigas de event_logs"""
+    if not event_logs_is_partitioned():
+        print("⚠️  event_logs não é particionada (execute partition_event_logs.sql no PostgreSQL)")
+        return
+    processed = apply_event_log_retention(args.retain_months, args.mode, args.archive_dir)
+    for item in processed:
+        if item['archived']:
+            print(f"📦 {item['partition']}: {item['rows']} linhas arquivadas em {item['archive']} ({item['mode']})")
+        else:
+            print(f"📦 {item['partition']}: arquivo existente mantido em {item['archive']} ({item['mode']})")
+    if not processed:
+        print("✅ Nenhuma partição fora do período de retenção")
+
+def cmd_purge_outbox(args):
+    """Remover eventos já concluídos da outbox"""
+    deleted = purge_outbox(args.days)
+    print(f"🧹 {deleted} eventos concluídos removidos da outbox")
+
+def cmd_compact_responses(args):
+    """Mover o tiktok_response em texto dos logs antigos para tiktok_response_bodies"""
+    converted = compact_legacy_tiktok_responses(args.batch_size)
+    print(f"🗜️  {converted} logs convertidos para tiktok_response_bodies")
+
+def cmd_health_check(args):
+    """Verificar token e pixel de todos os pixels ativos na API do TikTok"""
+    manager_ids = args.id_gestor.split(',') if args.id_gestor else None
+    report = check_pixels_health(manager_ids, refresh=True, checker=PixelHealthChecker(concurrency=args.concurrency))
+    failing = [row for row in report['matrix'] if row['status'] != 'ok']
+    
+    if args.json:
+        print(json_dumps(report))
+    else:
+        print(f"🩺 {report['total']} pixels, {report['tokens']} tokens: {report['summary']}")
+        rows = failing if args.only_failing else report['matrix']
+        for row in rows:
+            icon = '✅' if row['status'] == 'ok' else '❌'
+            print(f"{icon} {row['id_gestor']:<20} {row['pixel_id']:<24} token={row['token']} "
+                  f"{row['status']:<16} {row['error'] or ''}")
+    
+    # Código de saída para uso em cron/monitoramento
+    if any(row['status'] in ('invalid_token', 'pixel_not_found', 'error') for row in failing):
+        raise SystemExit(1)
+
+def cmd_replay(args):
+    """Reenviar ao TikTok eventos de event_logs (por padrão os que falharam)"""
+    pixel_id = args.pixel_id
+    if args.id_gestor:
+        pixel = pixel_cache.get(args.id_gestor)
+        if not pixel:
+            print(f"❌ Pixel não encontrado para gestor {args.id_gestor}")
+            raise SystemExit(1)
+        pixel_id = pixel.pixel_id
+    
+    progress = replay_events(
+        pixel_id=pixel_id,
+        since=_parse_datetime_param(args.since) if args.since else None,
+        until=_parse_datetime_param(args.until) if args.until else None,
+        statuses=tuple(args.status.split(',')),
+        cursor=args.cursor,
+        limit=args.limit,
+        dry_run=args.dry_run,
+        page_size=args.page_size
+    )
+    for line in progress:
+        if args.json:
+            print(json_dumps(line), flush=True)
+            continue
+        counts = ', '.join(f"{key}={value}" for key, value in line.items() if key not in ('type', 'cursor'))
+        icon = '🔁' if line['type'] == 'progress' else '✅'
+        print(f"{icon} {counts}", flush=True)
+    if line.get('cursor') and not line.get('finished'):
+        print(f"Para continuar: --cursor {line['cursor']}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tarefas de manutenção do banco')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    
+    subparsers.add_parser('rebuild-stats', help=cmd_rebuild_stats.__doc__).set_defaults(func=cmd_rebuild_stats)
+    
+    partitions = subparsers.add_parser('partitions', help=cmd_partitions.__doc__)
+    partitions.add_argument('--months-ahead', type=int, default=EVENT_LOG_PARTITION_MONTHS_AHEAD)
+    partitions.set_defaults(func=cmd_partitions)
+    
+    retention = subparsers.add_parser('retention', help=cmd_retention.__doc__)
+    retention.add_argument('--retain-months', type=int, default=EVENT_LOG_RETENTION_MONTHS)
+    retention.add_argument('--mode', choices=['drop', 'compact'], default='drop',
+                           help='drop: remove a partição; compact: mantém as linhas sem tiktok_response')
+    retention.add_argument('--archive-dir', default=EVENT_LOG_ARCHIVE_DIR)
+    retention.set_defaults(func=cmd_retention)
+    
+    purge = subparsers.add_parser('purge-outbox', help=cmd_purge_outbox.__doc__)
+    purge.add_argument('--days', type=int, default=7)
+    purge.set_defaults(func=cmd_purge_outbox)
+    
+    compact = subparsers.add_parser('compact-responses', help=cmd_compact_responses.__doc__)
+    compact.add_argument('--batch-size', type=int, default=1000)
+    compact.set_defaults(func=cmd_compact_responses)
+    
+    health = subparsers.add_parser('health-check', help=cmd_health_check.__doc__)
+    health.add_argument('--id-gestor', help='verificar só estes gestores (separados por vírgula)')
+    health.add_argument('--concurrency', type=int, default=HEALTH_CHECK_CONCURRENCY)
+    health.add_argument('--only-failing', action='store_true', help='listar só os pixels com problema')
+    health.add_argument('--json', action='store_true', help='saída em JSON')
+    health.set_defaults(func=cmd_health_check)
+    
+    replay = subparsers.add_parser('replay', help=cmd_replay.__doc__)
+    replay.add_argument('--id-gestor')
+    replay.add_argument('--pixel-id')
+    replay.add_argument('--since', help='ISO 8601 (inclusive)')
+    replay.add_argument('--until', help='ISO 8601 (exclusivo)')
+    replay.add_argument('--status', default='error', help='status dos logs a reenviar, separados por vírgula')
+    replay.add_argument('--limit', type=int, help='máximo de logs a percorrer')
+    replay.add_argument('--cursor', help='continuar de um replay anterior')
+    replay.add_argument('--page-size', type=int, default=REPLAY_PAGE_SIZE)
+    replay.add_argument('--dry-run', action='store_true', help='só contar o que seria reenviado')
+    replay.add_argument('--json', action='store_true', help='progresso em NDJSON')
+    replay.set_defaults(func=cmd_replay)
+    
+    args = parser.parse_args()
+    with app.app_context():
+        db.create_all()
+        args.func(args)
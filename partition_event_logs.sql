@@ -0,0 +1,81 @@
+-- Converter event_logs em tabela particionada por mês (PostgreSQL 12+)
+-- Execute uma vez (depois de create_tables.sql), com o app parado (ou o dispatcher desligado):
+--   psql "$DATABASE_URL" -f partition_event_logs.sql
+-- Depois disso as partições dos próximos meses são criadas automaticamente pelo app
+-- e a retenção/arquivamento é feita com: python maintenance.py retention
+--
+-- Observação: em tabela particionada o índice único precisa incluir created_at. O índice
+-- (stripe_event_id, pixel_id, created_at) barra a regravação da mesma linha (ex.: WAL
+-- recuperado) e a unicidade de (stripe_event_id, pixel_id) é garantida pelo upsert_event_logs()
+-- do app, que consulta os logs existentes sob um advisory lock por pixel.
+
+BEGIN;
+
+ALTER TABLE event_logs RENAME TO event_logs_legacy;
+ALTER INDEX IF EXISTS uq_event_logs_stripe_event_pixel RENAME TO event_logs_legacy_stripe_event_pixel;
+ALTER INDEX IF EXISTS idx_event_logs_pixel_created_id RENAME TO event_logs_legacy_pixel_created_id;
+ALTER INDEX IF EXISTS idx_event_logs_created_at RENAME TO event_logs_legacy_created_at;
+ALTER SEQUENCE event_logs_id_seq OWNED BY NONE;
+
+CREATE TABLE event_logs (
+    id INTEGER NOT NULL DEFAULT nextval('event_logs_id_seq'),
+    pixel_id VARCHAR(100) NOT NULL,
+    stripe_event_id VARCHAR(100) NOT NULL,
+    stripe_event_type VARCHAR(50) NOT NULL,
+    status VARCHAR(20) NOT NULL, -- success, error
+    error_message TEXT,
+    tiktok_response TEXT,
+    response_hash VARCHAR(64),
+    tiktok_request_id VARCHAR(100),
+    event_payload TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+
+ALTER SEQUENCE event_logs_id_seq OWNED BY event_logs.id;
+
+CREATE INDEX idx_event_logs_pixel_created_id ON event_logs(pixel_id, created_at, id);
+CREATE UNIQUE INDEX uq_event_logs_stripe_event_pixel ON event_logs(stripe_event_id, pixel_id, created_at);
+CREATE INDEX idx_event_logs_created_at ON event_logs(created_at);
+
+-- Tabela criada antes do replay de eventos
+ALTER TABLE event_logs_legacy ADD COLUMN IF NOT EXISTS event_payload TEXT;
+
+-- Partições mensais desde o log mais antigo até 2 meses à frente
+DO $$
+DECLARE
+    m DATE;
+BEGIN
+    FOR m IN
+        SELECT generate_series(
+            date_trunc('month', COALESCE((SELECT MIN(created_at) FROM event_logs_legacy), now())),
+            date_trunc('month', now()) + INTERVAL '2 months',
+            INTERVAL '1 month'
+        )::date
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE IF NOT EXISTS %I PARTITION OF event_logs FOR VALUES FROM (%L) TO (%L)',
+            'event_logs_' || to_char(m, '"y"YYYY"m"MM'), m, (m + INTERVAL '1 month')::date
+        );
+    END LOOP;
+END $$;
+
+-- Partição padrão para qualquer data fora das partições mensais (ex.: WAL recuperado de um mês já
+-- removido pela retenção). Ao criar a partição de um mês, o app move para ela as linhas do período
+-- que estiverem aqui (ensure_event_log_partitions).
+CREATE TABLE IF NOT EXISTS event_logs_default PARTITION OF event_logs DEFAULT;
+
+INSERT INTO event_logs (id, pixel_id, stripe_event_id, stripe_event_type, status, error_message, tiktok_response, response_hash, tiktok_request_id, event_payload, created_at)
+SELECT id, pixel_id, stripe_event_id, stripe_event_type, status, error_message, tiktok_response, response_hash, tiktok_request_id, event_payload, COALESCE(created_at, now())
+FROM event_logs_legacy;
+
+DROP TABLE event_logs_legacy;
+
+COMMIT;
+
+-- Verificar as partições criadas
+SELECT c.relname AS partition, pg_get_expr(c.relpartbound, c.oid) AS bounds
+FROM pg_inherits i
+JOIN pg_class c ON c.oid = i.inhrelid
+WHERE i.inhparent = 'event_logs'::regclass
+ORDER BY c.relname;
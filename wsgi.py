@@ -0,0 +1,24 @@
+import os
+from dotenv import load_dotenv
+
+# Carrega variáveis de ambiente
+load_dotenv()
+
+# Com o worker gevent o monkey patch precisa acontecer antes de importar o app
+if os.getenv('GUNICORN_WORKER_CLASS', 'gthread') == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass
+
+from main import app, db, init_db  # noqa: E402
+
+# Executado uma única vez no master quando preload_app está ativo
+init_db()
+
+# Garante que o engine do banco esteja configurado antes do fork dos workers
+with app.app_context():
+    db.engine